@@ -0,0 +1,70 @@
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Count, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from workout_app.models import Workout, WorkoutExercise, ExerciseSet, WorkoutSummary
+from workout_app.deletion import pending_user_ids
+from .models import UserActivity
+
+# Estimated bytes per row, including the indexes, for databases that do not report their sizes
+DEFAULT_ROW_BYTES = {
+    Workout: 150,
+    WorkoutSummary: 200,
+    WorkoutExercise: 60,
+    ExerciseSet: 70,
+}
+UPDATED_FIELDS = ["workout_count", "set_count", "total_volume", "total_distance", "last_active",
+                  "storage_bytes", "refreshed"]
+
+
+def row_bytes():
+    # Average size of a row per model. PostgreSQL knows the size of each table with its indexes
+    # and the estimated number of rows (from the last ANALYZE)
+    if connection.vendor != "postgresql":
+        return DEFAULT_ROW_BYTES
+    tables = {model._meta.db_table: model for model in DEFAULT_ROW_BYTES}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relname, pg_total_relation_size(oid), reltuples FROM pg_class WHERE relname = ANY(%s)",
+            [list(tables)])
+        sizes = dict(DEFAULT_ROW_BYTES)
+        for table, size, rows in cursor.fetchall():
+            if rows > 0:
+                sizes[tables[table]] = size / rows
+    return sizes
+
+
+def aggregate_users():
+    # One query over the users, their workouts and the summaries of the workouts.
+    # Every workout has one summary, so the joins do not multiply rows. The sets are not read:
+    # their counts and totals are in the summaries (see workout_app/summaries.py).
+    # Deleted workouts and users that have not been purged yet are left out
+    kept = Q(user_workout__deleted_at=None)
+    return User.objects.exclude(id__in=pending_user_ids()).annotate(
+        workout_count=Count("user_workout", filter=kept),
+        exercise_count=Coalesce(Sum("user_workout__summary__exercise_count", filter=kept), Value(0)),
+        set_count=Coalesce(Sum("user_workout__summary__set_count", filter=kept), Value(0)),
+        total_volume=Coalesce(Sum("user_workout__summary__total_volume", filter=kept), Value(0)),
+        total_distance=Coalesce(Sum("user_workout__summary__total_distance", filter=kept), Value(0.0)),
+        last_active=Max("user_workout__date", filter=kept),
+    ).values_list("id", "workout_count", "exercise_count", "set_count", "total_volume", "total_distance",
+                  "last_active")
+
+
+def refresh_activity(batch_size=1000):
+    # Recompute the activity of all users. Returns the number of users
+    sizes = row_bytes()
+    refreshed = timezone.now()
+    activities = []
+    for user_id, workouts, exercises, sets, volume, distance, last_active in aggregate_users().iterator():
+        storage = (workouts * (sizes[Workout] + sizes[WorkoutSummary]) + exercises * sizes[WorkoutExercise]
+                   + sets * sizes[ExerciseSet])
+        activities.append(UserActivity(
+            user_id=user_id, workout_count=workouts, set_count=sets, total_volume=volume,
+            total_distance=distance, last_active=last_active, storage_bytes=int(storage),
+            refreshed=refreshed))
+    with transaction.atomic():
+        UserActivity.objects.bulk_create(activities, batch_size=batch_size, update_conflicts=True,
+                                         unique_fields=["user"], update_fields=UPDATED_FIELDS)
+    return len(activities)
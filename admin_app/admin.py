@@ -1,3 +1,5 @@
 from django.contrib import admin
+from .models import UserActivity
 
 # Register your models here.
+admin.site.register(UserActivity)
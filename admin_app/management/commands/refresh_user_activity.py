@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand
+from admin_app.activity import refresh_activity
+
+
+class Command(BaseCommand):
+    # Recompute the activity of the users for the dashboard of the administration.
+    # Run it from a scheduler (cron, Heroku Scheduler, ...), or keep it running with --every.
+    help = "Refresh the per-user activity shown in the admin dashboard"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--every", type=int, default=0,
+                            help="Keep running and refresh every this many seconds")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            count = refresh_activity()
+            self.stdout.write(self.style.SUCCESS(
+                f"Refreshed the activity of {count} users in {time.perf_counter() - started:.1f} s"))
+            if not options["every"]:
+                return
+            time.sleep(options["every"])
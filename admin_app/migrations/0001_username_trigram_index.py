@@ -0,0 +1,34 @@
+# Trigram index for the search of users by username (admin_app.views.UserList).
+# The search uses username__icontains, which PostgreSQL runs as UPPER("username"::text) LIKE UPPER(%s).
+# A GIN index with trigrams on that expression serves LIKE '%term%'. Other databases have no such index
+# and scan the table, which is fine for development.
+# pg_trgm must be available. Since PostgreSQL 13 the owner of the database can create it.
+
+from django.db import migrations
+
+INDEX_NAME = "admin_user_username_trgm"
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON auth_user USING gin ((UPPER("username"::text)) gin_trgm_ops)')
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
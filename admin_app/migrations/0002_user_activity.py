@@ -0,0 +1,29 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('admin_app', '0001_username_trigram_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserActivity',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='activity', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('workout_count', models.IntegerField(default=0)),
+                ('set_count', models.IntegerField(default=0)),
+                ('total_volume', models.BigIntegerField(default=0)),
+                ('total_distance', models.FloatField(default=0)),
+                ('last_active', models.DateTimeField(blank=True, null=True)),
+                ('storage_bytes', models.BigIntegerField(default=0)),
+                ('refreshed', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -1 +1,26 @@
 from django.db import models
+from django.contrib.auth.models import User
+
+
+# Activity of a user, shown in the dashboard of the administration (views.ActivityDashboard).
+# The values are aggregated from the WorkoutSummaries by activity.refresh_activity(), which runs on a
+# schedule (management command refresh_user_activity). The dashboard only reads this table.
+class UserActivity(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="activity")
+    # Number of Workouts
+    workout_count = models.IntegerField(default=0)
+    # Number of ExerciseSets in all workouts
+    set_count = models.IntegerField(default=0)
+    # Sum of reps * weight of all sets
+    total_volume = models.BigIntegerField(default=0)
+    # Sum of the distance of all sets
+    total_distance = models.FloatField(default=0)
+    # Date of the newest workout
+    last_active = models.DateTimeField(blank=True, null=True)
+    # Estimated size of the rows of the user in the database, including the indexes
+    storage_bytes = models.BigIntegerField(default=0)
+    # Time of the computation
+    refreshed = models.DateTimeField()
+
+    def __str__(self):
+        return f"Activity of {self.user_id}"
@@ -1,3 +1,205 @@
+import gzip
+import json
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.contrib.auth.models import User, Group
+from .models import UserActivity
+from .activity import refresh_activity
+from django.shortcuts import reverse
+from django.core.management import call_command
+from io import StringIO
+from workout_app.models import Exercise, Workout, WorkoutExercise, ExerciseSet
+from workout_app import summaries, roles, deletion
+from workout_app.query_detector import QueryBudgetMixin
 
-# Create your tests here.
+
+class UserListTest(TestCase):
+
+    def setUp(self):
+        User.objects.bulk_create([User(username=f"runner{i}") for i in range(7)] +
+                                 [User(username=f"Lifter{i}") for i in range(3)])
+
+    def usernames(self, response):
+        return [user.username for user in response.context["page_obj"]]
+
+    def test_search_in_database(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("admin-users"), {"search_user": "LIFT"})
+        self.assertEqual(self.usernames(response), ["Lifter0", "Lifter1", "Lifter2"])
+        # Counted and sliced in SQL, the users are not loaded into Python
+        selects = [query["sql"] for query in context.captured_queries if "auth_user" in query["sql"]]
+        self.assertTrue(all("LIKE" in sql for sql in selects))
+        self.assertTrue(any("LIMIT" in sql for sql in selects))
+
+    def test_search_term_is_kept_in_page_links(self):
+        response = self.client.get(reverse("admin-users"), {"search_user": "runner"})
+        self.assertEqual(response.context["page_obj"].paginator.count, 7)
+        self.assertContains(response, "?search_user=runner&amp;page=2")
+        response = self.client.get(reverse("admin-users"), {"search_user": "runner", "page": 2})
+        self.assertEqual(self.usernames(response), ["runner5", "runner6"])
+
+    def test_create_user_redirects(self):
+        response = self.client.post(reverse("admin-users"), {
+            "username": "newbie", "password1": "Very-secret-42", "password2": "Very-secret-42"})
+        self.assertRedirects(response, reverse("admin-users"))
+        self.assertTrue(User.objects.filter(username="newbie").exists())
+
+
+class ExerciseListTest(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        for username in ("anna", "ben", "carla"):
+            user = User.objects.create_user(username=username, password="secret")
+            for name in ("Squat", "Run", "Bench press"):
+                Exercise.objects.create(user=user, name=name, type=0)
+
+    def rows(self, response):
+        return [(exercise.user.username, exercise.name) for exercise in response.context["page_obj"]]
+
+    def test_page_without_repeated_queries(self):
+        # The users of a page are joined instead of being loaded one by one
+        with self.assertQueryBudget(3):
+            response = self.client.get(reverse("admin_exercise_list"))
+            self.assertEqual(len(self.rows(response)), 5)
+
+    def test_search_username_or_name(self):
+        response = self.client.get(reverse("admin_exercise_list"), {"search_user": "CARLA"})
+        self.assertEqual(self.rows(response), [("carla", "Squat"), ("carla", "Run"), ("carla", "Bench press")])
+        response = self.client.get(reverse("admin_exercise_list"), {"search_user": "press"})
+        self.assertEqual([row[0] for row in self.rows(response)], ["anna", "ben", "carla"])
+
+    def test_search_term_is_kept_in_page_links(self):
+        response = self.client.get(reverse("admin_exercise_list"), {"search_user": "a"})
+        self.assertContains(response, "?search_user=a&amp;page=2")
+
+
+class ActivityDashboardTest(TestCase):
+
+    def setUp(self):
+        self.athlete = User.objects.create_user(username="athlete", password="secret")
+        self.idle = User.objects.create_user(username="idle", password="secret")
+        exercise = Exercise.objects.create(user=self.athlete, name="Squat", type=0)
+        self.add_workout(exercise, sets=3)
+        self.add_workout(exercise, sets=2)
+
+    def add_workout(self, exercise, sets):
+        workout = Workout.objects.create(user=self.athlete, name="Legs")
+        workout_exercise = WorkoutExercise.objects.create(workout=workout, exercise=exercise)
+        for i in range(sets):
+            ExerciseSet.objects.create(workout_exercise=workout_exercise, reps=10, weight=50)
+        summaries.rebuild_workouts([workout.id])
+        return workout
+
+    def test_refresh_reads_the_summaries_only(self):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(refresh_activity(), 2)
+        self.assertFalse(any("workout_app_exerciseset" in query["sql"] for query in context.captured_queries))
+        activity = UserActivity.objects.get(user=self.athlete)
+        self.assertEqual((activity.workout_count, activity.set_count, activity.total_volume), (2, 5, 2500))
+        self.assertGreater(activity.storage_bytes, 0)
+        idle = UserActivity.objects.get(user=self.idle)
+        self.assertEqual((idle.workout_count, idle.set_count, idle.last_active), (0, 0, None))
+
+    def test_refresh_updates_rows(self):
+        refresh_activity()
+        self.add_workout(Exercise.objects.get(name="Squat"), sets=1)
+        call_command("refresh_user_activity", stdout=StringIO())
+        self.assertEqual(UserActivity.objects.count(), 2)
+        self.assertEqual(UserActivity.objects.get(user=self.athlete).set_count, 6)
+
+    def test_dashboard(self):
+        refresh_activity()
+        admin = User.objects.create_user(username="admin", password="secret")
+        admin.groups.add(Group.objects.create(name=roles.ADMIN))
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("admin_activity"), {"order": "sets"})
+        self.assertFalse(any("workout_app_" in query["sql"] for query in context.captured_queries))
+        self.assertEqual([activity.user.username for activity in response.context["page_obj"]], ["athlete", "idle"])
+
+    def test_administrators_only(self):
+        self.client.force_login(self.athlete)
+        self.assertEqual(self.client.get(reverse("admin_activity")).status_code, 403)
+
+
+class UserTreeTest(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username="admin", password="secret")
+        self.admin.groups.add(Group.objects.create(name=roles.ADMIN))
+        self.athlete = User.objects.create_user(username="athlete", password="secret")
+        squat = Exercise.objects.create(user=self.athlete, name="Squat", type=0)
+        run = Exercise.objects.create(user=self.athlete, name="Run", type=1, goal=2)
+        for i in range(4):
+            workout = Workout.objects.create(user=self.athlete, name=f"Workout {i}")
+            for exercise in (squat, run):
+                workout_exercise = WorkoutExercise.objects.create(workout=workout, exercise=exercise)
+                for j in range(2):
+                    ExerciseSet.objects.create(workout_exercise=workout_exercise, reps=10, weight=50)
+        self.client.force_login(self.admin)
+
+    def tree(self, **params):
+        response = self.client.get(reverse("admin_user_tree", kwargs={"user_id": self.athlete.id}), params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content)
+
+    def test_tree(self):
+        # The user, then per chunk the workouts, their exercises and their sets
+        with self.assertQueryBudget(10):
+            tree = json.loads(self.tree())
+        self.assertEqual(tree["user"]["username"], "athlete")
+        self.assertEqual(tree["workout_count"], 4)
+        self.assertEqual([len(workout["exercises"]) for workout in tree["workouts"]], [2] * 4)
+        self.assertEqual(tree["workouts"][0]["exercises"][1]["exercise"], "Run")
+        self.assertEqual(len(tree["workouts"][0]["exercises"][0]["sets"]), 2)
+
+    def test_date_window_and_gzip(self):
+        tree = json.loads(gzip.decompress(self.tree(end="2000-01-01", gzip="1")))
+        self.assertEqual((tree["workouts"], tree["workout_count"], tree["end"]), ([], 0, "2000-01-01"))
+        response = self.client.get(reverse("admin_user_tree", kwargs={"user_id": self.athlete.id}), {"start": "x"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_administrators_only(self):
+        self.client.force_login(self.athlete)
+        response = self.client.get(reverse("admin_user_tree", kwargs={"user_id": self.athlete.id}))
+        self.assertEqual(response.status_code, 403)
+
+
+class DeletedWorkoutTest(TestCase):
+
+    def setUp(self):
+        admin = User.objects.create_user(username="admin", password="secret")
+        admin.groups.add(Group.objects.create(name=roles.ADMIN))
+        self.athlete = User.objects.create_user(username="athlete", password="secret")
+        squat = Exercise.objects.create(user=self.athlete, name="Squat", type=0)
+        self.workout = Workout.objects.create(user=self.athlete, name="Workout")
+        self.workout_exercise = WorkoutExercise.objects.create(workout=self.workout, exercise=squat)
+        ExerciseSet.objects.create(workout_exercise=self.workout_exercise, reps=10, weight=50)
+        deletion.delete_workout(self.workout)
+        self.client.force_login(admin)
+
+    def test_exercises_are_hidden(self):
+        response = self.client.get(reverse("admin_workout_exercise_list", kwargs={
+            "workout_id": self.workout.id, "user_id": self.athlete.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context["workout_exercise_list"]), [])
+
+    def test_sets_are_not_found(self):
+        response = self.client.get(reverse("admin_exercise_set_list", kwargs={
+            "workout_exercise_id": self.workout_exercise.id}))
+        self.assertEqual(response.status_code, 404)
+
+
+class CacheStatsTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="athlete", password="secret")
+        self.client.force_login(self.user)
+
+    def test_administrators_only(self):
+        self.assertEqual(self.client.get(reverse("admin_cache_stats")).status_code, 403)
+        self.user.groups.add(Group.objects.create(name=roles.ADMIN))
+        response = self.client.get(reverse("admin_cache_stats"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("hit_ratio", response.json()["workout_rows"])
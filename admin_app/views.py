@@ -1,13 +1,25 @@
-from django.shortcuts import render, reverse
+from django.shortcuts import render, reverse, get_object_or_404
 from django.views import View
-from django.http import HttpResponseRedirect
-from workout_app import models
+from django.http import (HttpResponseRedirect, JsonResponse, HttpResponseBadRequest, HttpResponseForbidden,
+                         Http404)
+from workout_app import models, fragment_cache, deletion, export, roles
+from workout_app.helpers import arender, streaming_response
 from django.contrib.auth.models import User
 from django.contrib.auth import get_user_model
 from .forms import CreateUserForm
+from .models import UserActivity
 from django.db import IntegrityError
 from django.contrib import messages
+from django.db.models import F, Q
 from django.core.paginator import Paginator
+from urllib.parse import urlencode
+
+
+# Prefix of the querystrings of the page links, which keeps the search term
+def search_querystring(search_user):
+    if not search_user:
+        return ""
+    return urlencode({"search_user": search_user}) + "&"
 
 
 class UserList(View):
@@ -17,41 +29,32 @@ class UserList(View):
     paginate_by = 5
 
     def get(self, request, *args, **kwargs):
-        # Select all users
+        # The search term is a GET-parameter, so it is kept while paging through the results.
+        # If it is empty, all users are listed
+        search_user = request.GET.get("search_user", "").strip()
         User = get_user_model()
-        users = User.objects.all()
-        # Add users to the paginatro
+        # Users whose deletion has been requested are hidden until they are purged
+        users = User.objects.exclude(id__in=deletion.pending_user_ids()).order_by("id")
+        if search_user:
+            # Filtered in the database. On PostgreSQL a trigram index serves the lookup
+            # (see migrations/0001_username_trigram_index.py)
+            users = users.filter(username__icontains=search_user)
+        # The paginator counts and slices the queryset in SQL
         paginator = Paginator(users, self.paginate_by)
         page_number = request.GET.get("page")
         page_obj = paginator.get_page(page_number)
         # Create an empty form for creating users
         create_user_form = self.create_user_form_class()
 
-        return render(request, self.template_name, {"page_obj": page_obj, "create_user_form": create_user_form})
+        return render(request, self.template_name, {"page_obj": page_obj, "create_user_form": create_user_form,
+                                                    "search_user": search_user,
+                                                    "search_query": search_querystring(search_user)})
 
     def post(self, request, *args, **kwargs):
         # Create user if a the according form has been submitted
         self.__create_user(request)
-        # Copy the string that has been submitted in the search field
-        # If it was empty the default value is an empty string, which will
-        # yield all users
-        seach_user = request.POST.get('search_user', "")
-        # Instanciate an empty form to send back to the template
-        create_user_form = self.create_user_form_class()
-        # Select all users
-        User = get_user_model()
-        users = User.objects.all()
-        # Create an empty list to hold filtered users
-        user_list = []
-        # Filter the users, according to the search_user value (The search-field on the page)
-        for user in users:
-            if seach_user in user.username:
-                user_list.append(user)
-        # Put the filtered results in the paginator
-        paginator = Paginator(user_list, self.paginate_by)
-        page_number = request.GET.get("page")
-        page_obj = paginator.get_page(page_number)
-        return render(request, self.template_name, {"page_obj": page_obj, "create_user_form": create_user_form})
+        # Show the list again. Redirecting prevents the form from being submitted twice on reload
+        return HttpResponseRedirect(reverse("admin-users"))
 
     def __create_user(self, request):
         # Create a user if the create_user_form in home.html has been submitted
@@ -73,100 +76,149 @@ class WorkoutList(View):
     # List workouts by user.id
     template_name = "admin_workout_list.html"
 
-    def get(self, request, *args, **kwargs):
+    async def get(self, request, *args, **kwargs):
+        # Async view: the queries use the async queryset API
         user_id = kwargs.get("user_id")
-        user = User.objects.get(id=user_id)
-        workout_list = models.Workout.objects.filter(
-            user_id=user_id).order_by('id')
-        return render(request, self.template_name, {"workout_list": workout_list, "user": user})
+        user = await User.objects.aget(id=user_id)
+        workout_list = [workout async for workout in models.Workout.objects.filter(
+            user_id=user_id).order_by('id').aiterator()]
+        return await arender(request, self.template_name, {"workout_list": workout_list, "user": user})
 
 
 class WorkoutExerciseList(View):
     # List workout_exercises by workout.id
     template_name = "admin_workout_exercise_list.html"
 
-    def get(self, request, *args, **kwargs):
+    async def get(self, request, *args, **kwargs):
+        # Async view: the queries use the async queryset API
         workout_id = kwargs.get("workout_id")
         user_id = kwargs.get("user_id")
-        user = User.objects.get(id=user_id)
+        user = await User.objects.aget(id=user_id)
 
-        workout_exercise_list = models.WorkoutExercise.objects.filter(
-            workout_id=workout_id).order_by('id')
-        return render(request, self.template_name, {"workout_exercise_list": workout_exercise_list, "user": user})
+        # The names of the exercises are loaded along, they are shown in the template.
+        # The exercises of a deleted workout are hidden until they are purged
+        workout_exercise_list = [workout_exercise async for workout_exercise in models.WorkoutExercise.objects.filter(
+            workout_id=workout_id, workout__deleted_at=None).select_related("exercise").order_by('id').aiterator()]
+        return await arender(request, self.template_name,
+                             {"workout_exercise_list": workout_exercise_list, "user": user})
 
 
 class ExerciseSetList(View):
     # List exercise_sets by workout_exercise.id
     template_name = "admin_exercise_set_list.html"
 
-    def get(self, request, *args, **kwargs):
+    async def get(self, request, *args, **kwargs):
+        # Async view: the queries use the async queryset API
         workout_exercise_id = kwargs.get("workout_exercise_id")
-        workout_exercise = models.WorkoutExercise.objects.get(
-            id=workout_exercise_id)
-        user = workout_exercise.workout.user  
-        workout = workout_exercise.workout      
+        try:
+            workout_exercise = await models.WorkoutExercise.objects.select_related(
+                "workout__user", "exercise").aget(id=workout_exercise_id, workout__deleted_at=None)
+        except models.WorkoutExercise.DoesNotExist:
+            raise Http404("No such exercise")
+        user = workout_exercise.workout.user
+        workout = workout_exercise.workout
         exercise = workout_exercise.exercise
-        exercise_set_list = models.ExerciseSet.objects.filter(
-            workout_exercise_id=workout_exercise_id)
-        return render(request, self.template_name, {"exercise_set_list": exercise_set_list, "exercise": exercise, "workout": workout, "user": user})
+        exercise_set_list = [exercise_set async for exercise_set in models.ExerciseSet.objects.filter(
+            workout_exercise_id=workout_exercise_id).order_by("id").aiterator()]
+        return await arender(request, self.template_name, {"exercise_set_list": exercise_set_list, "exercise": exercise, "workout": workout, "user": user})
+
+
+class UserTree(View):
+    # The complete activity of a user as one JSON document: workouts -> exercises -> sets.
+    # GET-parameters: start and end = dates (YYYY-MM-DD) to limit the workouts to; gzip = 1
+    # The workouts are loaded in chunks with their exercises and sets prefetched (see workout_app/export.py),
+    # so the number of queries does not grow with the workouts of a chunk and the response is streamed.
+    def get(self, request, *args, **kwargs):
+        # The document holds all the data of the user, so it is for administrators only
+        if roles.ADMIN not in request.groups:
+            return HttpResponseForbidden("Administrators only")
+        user = get_object_or_404(User, id=kwargs.get("user_id"))
+        try:
+            start = export.parse_day(request.GET.get("start"))
+            end = export.parse_day(request.GET.get("end"))
+        except ValueError:
+            return HttpResponseBadRequest("Invalid date")
+
+        chunks = export.stream_user_tree(user, start, end)
+        if request.GET.get("gzip") == "1":
+            response = streaming_response(request, export.gzip_stream(chunks), "application/gzip")
+            response["Content-Disposition"] = f'attachment; filename="user-{user.id}.json.gz"'
+        else:
+            response = streaming_response(request, (chunk.encode() for chunk in chunks), "application/json")
+        return response
 
 
 class DeleteUser(View):
-    # Delete user
+    # Delete user. The user is deactivated and hidden right away, their data is deleted
+    # in the background (see workout_app/deletion.py)
     def get(self, request, *args, **kwargs):
         user_id = kwargs.get("user_id")
         user = User.objects.get(id=user_id)
-        user.delete()
+        deletion.delete_user(user)
+        # The dashboard shows the user until the next refresh otherwise
+        UserActivity.objects.filter(user_id=user.id).delete()
         return HttpResponseRedirect(reverse('admin-users'))
 
 
 class ExerciseList(View):
-# List exercises and filter them by username
+# List exercises and filter them by username or exercise name
     template_name = "admin_exercise_list.html"
     paginate_by = 5
 
     def get(self, request, *args, **kwargs):
-        # All exercises
-        exercise_list = models.Exercise.objects.all()
-        # Empty list to hold filtered exercises
-        exercises = [] 
-        # In case there is no search_user in the session, make it an empty string
-        search_user = ""
-        if 'search_user' in request.session:
-            search_user = request.session['search_user']
-        
-        # Filter the exercise list 
-        for exercise in exercise_list:
-            if search_user in exercise.user.username:
-                exercises.append(exercise)
-            elif search_user in exercise.name:                
-                exercises.append(exercise)
-        
-        # Put the filtered results in the paginator
+        # The search term is a GET-parameter, so it is kept while paging through the results
+        search_user = request.GET.get("search_user", "").strip()
+        # The users are joined, the template shows their names
+        exercises = models.Exercise.objects.select_related("user").order_by("id")
+        if search_user:
+            # Filtered in the database. On PostgreSQL trigram indexes serve both lookups
+            # (see workout_app/migrations/0009_exercise_name_trigram_index.py)
+            exercises = exercises.filter(
+                Q(user__username__icontains=search_user) | Q(name__icontains=search_user))
+
+        # Only the requested page is loaded
         paginator = Paginator(exercises, self.paginate_by)
         page_number = request.GET.get("page")
         page_obj = paginator.get_page(page_number)
 
-        return render(request, self.template_name, {"page_obj": page_obj, "search_user": search_user})
+        return render(request, self.template_name, {"page_obj": page_obj, "search_user": search_user,
+                                                    "search_query": search_querystring(search_user)})
 
-    def post(self, request, *args, **kwargs):
-        exercise_list = models.Exercise.objects.all()
-        # Copy the contents of the search field
-        search_user = request.POST.get("search_user")
-        # Copy the search_user from POST to session
-        request.session['search_user'] = search_user
-        # Create an empy list to hold the filtered exercise list
-        exercises = []
-        # Filter the exercise list 
-        for exercise in exercise_list:
-            if search_user in exercise.user.username:
-                exercises.append(exercise)
-            elif search_user in exercise.name:                
-                exercises.append(exercise)
-        
-        # Put the filtered results in the paginator
-        paginator = Paginator(exercises, self.paginate_by)
-        page_number = request.GET.get("page")
-        page_obj = paginator.get_page(page_number)
 
-        return render(request, self.template_name, {"page_obj": page_obj})
+class ActivityDashboard(View):
+    # Workouts, sets, volume, last activity and storage per user.
+    # Reads the precomputed UserActivity rows (see activity.py), so opening the page reads no sets
+    template_name = "admin_activity.html"
+    paginate_by = 20
+    # Columns that the list can be sorted by, the most active users first
+    orderings = {
+        "workouts": "-workout_count",
+        "sets": "-set_count",
+        "volume": "-total_volume",
+        "last_active": "-last_active",
+        "storage": "-storage_bytes",
+    }
+
+    def get(self, request, *args, **kwargs):
+        # The activity of all users is for administrators only
+        if roles.ADMIN not in request.groups:
+            return HttpResponseForbidden("Administrators only")
+        order = request.GET.get("order", "last_active")
+        if order not in self.orderings:
+            order = "last_active"
+        activities = UserActivity.objects.select_related("user").order_by(
+            F(self.orderings[order][1:]).desc(nulls_last=True), "user_id")
+        paginator = Paginator(activities, self.paginate_by)
+        page_obj = paginator.get_page(request.GET.get("page"))
+        # All rows are refreshed at once
+        refreshed = UserActivity.objects.order_by("-refreshed").values_list("refreshed", flat=True).first()
+        return render(request, self.template_name, {"page_obj": page_obj, "order": order, "refreshed": refreshed})
+
+
+class CacheStats(View):
+    # Hits and misses of the cached rows in the list of workouts (in this process)
+    def get(self, request, *args, **kwargs):
+        # Diagnostics are for administrators only
+        if roles.ADMIN not in request.groups:
+            return HttpResponseForbidden("Administrators only")
+        return JsonResponse({"workout_rows": fragment_cache.get_stats()})
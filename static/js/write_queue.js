@@ -0,0 +1,221 @@
+/*
+    WriteQueue stores operations in the localStorage of the browser and sends them in batches
+    to the sync endpoint (view SyncExerciseSets). Sets can be logged without reception, they are
+    sent as soon as the connection is back.
+    Every operation carries a key that is generated here. The server remembers the keys, so an
+    operation that is sent twice, e.g. because the response got lost, is applied only once.
+*/
+class WriteQueue {
+
+    /*
+    @parameter : sync_url
+        The URL of the sync endpoint
+
+    @parameter : csrf_token
+        The CSRF token of the page
+
+    @parameter : on_synced
+        Function that is called with (key, exercise_set) for every operation that has been applied
+
+    @parameter : on_failed
+        Function that is called with (key, errors) for every operation that has been rejected
+    */
+    constructor(sync_url, csrf_token, on_synced, on_failed) {
+        this.sync_url = sync_url;
+        this.csrf_token = csrf_token;
+        this.on_synced = on_synced;
+        this.on_failed = on_failed;
+        this.storage_key = "workout-write-queue";
+        // Number of operations that are sent at once
+        this.batch_size = 50;
+        // Delay before the next attempt after a failure. It doubles up to max_retry_delay
+        this.initial_retry_delay = 2000;
+        this.max_retry_delay = 60000;
+        this.retry_delay = this.initial_retry_delay;
+        this.retry = null;
+        this.flushing = false;
+        window.addEventListener("online", () => this.flush());
+    }
+
+    // True if the browser has everything the queue needs
+    static isSupported() {
+        try {
+            return "fetch" in window && window.localStorage !== undefined;
+        } catch (err) {
+            return false;
+        }
+    }
+
+    // The queued operations
+    load() {
+        return JSON.parse(window.localStorage.getItem(this.storage_key) || "[]");
+    }
+
+    save(operations) {
+        window.localStorage.setItem(this.storage_key, JSON.stringify(operations));
+    }
+
+    // Remove the operations with the given keys from the queue
+    remove(keys) {
+        this.save(this.load().filter((operation) => !keys.includes(operation.key)));
+    }
+
+    newKey() {
+        if (window.crypto && window.crypto.randomUUID) {
+            return window.crypto.randomUUID();
+        }
+        return Date.now().toString(36) + "-" + Math.random().toString(36).slice(2);
+    }
+
+    /*
+    Queue a new set and try to send it right away
+    @parameter : exercise_set
+        Object with workout_exercise, reps, weight, time and distance
+    Returns the key of the operation
+    */
+    addSet(exercise_set) {
+        let operation = { key: this.newKey(), type: "add_set", set: exercise_set };
+        let operations = this.load();
+        operations.push(operation);
+        this.save(operations);
+        this.flush();
+        return operation.key;
+    }
+
+    // Send the queued operations in batches. After a failure it is retried with an increasing delay
+    async flush() {
+        if (this.flushing) {
+            return;
+        }
+        this.flushing = true;
+        clearTimeout(this.retry);
+        try {
+            let batch = this.load().slice(0, this.batch_size);
+            while (batch.length > 0) {
+                let response = await fetch(this.sync_url, {
+                    method: "POST",
+                    credentials: "same-origin",
+                    headers: { "Content-Type": "application/json", "X-CSRFToken": this.csrf_token },
+                    body: JSON.stringify({ operations: batch }),
+                });
+                if (response.status == 400) {
+                    // Drop the invalid operations, the others are sent again
+                    let result = await response.json();
+                    let invalid = Object.keys(result.errors || {}).map((index) => batch[index]);
+                    if (invalid.length == 0) {
+                        invalid = batch;
+                    }
+                    this.remove(invalid.map((operation) => operation.key));
+                    invalid.forEach((operation) => this.on_failed(operation.key, (result.errors || {})));
+                } else if (response.ok) {
+                    let result = await response.json();
+                    this.remove(Object.keys(result.results));
+                    for (let key in result.results) {
+                        this.on_synced(key, result.results[key]);
+                    }
+                } else {
+                    throw new Error("Sync failed with status " + response.status);
+                }
+                batch = this.load().slice(0, this.batch_size);
+            }
+            this.retry_delay = this.initial_retry_delay;
+        } catch (err) {
+            // Offline or the server is not reachable. Keep the operations and try again later
+            this.retry = setTimeout(() => this.flush(), this.retry_delay);
+            this.retry_delay = Math.min(this.retry_delay * 2, this.max_retry_delay);
+        } finally {
+            this.flushing = false;
+        }
+    }
+}
+
+/*
+    SetEntryPage connects the form for adding a set in edit_workout_exercise_*.html to a WriteQueue.
+    New sets are shown right away, marked as pending until the server has confirmed them.
+*/
+class SetEntryPage {
+
+    /*
+    @parameter : form
+        The form of the page. Its fields are named "exercise_set-<field>"
+
+    @parameter : workout_exercise_id
+        The id of the WorkoutExercise the page belongs to
+
+    @parameter : columns
+        The fields of a set that are shown in the list, e.g. ["reps", "weight"]
+
+    @parameter : container_id
+        The id of an HTML-Element that the new rows are appended to
+
+    @parameter : delete_url
+        The URL for deleting a set, with 0 in place of the id of the set
+    */
+    constructor(form, workout_exercise_id, columns, container_id, delete_url, sync_url, csrf_token) {
+        this.form = form;
+        this.workout_exercise_id = workout_exercise_id;
+        this.columns = columns;
+        this.container = document.getElementById(container_id);
+        this.delete_url = delete_url;
+        this.queue = new WriteQueue(sync_url, csrf_token,
+            (key, exercise_set) => this.showSynced(key, exercise_set),
+            (key, errors) => this.showFailed(key, errors));
+        // Show the sets of this page that are still waiting to be sent
+        this.queue.load().forEach((operation) => {
+            if (operation.set.workout_exercise == this.workout_exercise_id) {
+                this.showPending(operation.key, operation.set);
+            }
+        });
+        this.queue.flush();
+    }
+
+    // Queue the set in the form and reset the form
+    addSet() {
+        let exercise_set = { workout_exercise: this.workout_exercise_id };
+        for (let element of this.form.elements) {
+            if (element.name && element.name.startsWith("exercise_set-")) {
+                exercise_set[element.name.slice("exercise_set-".length)] = element.value;
+            }
+        }
+        this.form.reset();
+        let key = this.queue.addSet(exercise_set);
+        this.showPending(key, exercise_set);
+    }
+
+    showPending(key, exercise_set) {
+        let row = document.createElement("div");
+        row.className = "row";
+        row.dataset.key = key;
+        this.columns.forEach((column) => {
+            let cell = document.createElement("div");
+            cell.className = "col-4 entry-column";
+            cell.textContent = exercise_set[column];
+            row.appendChild(cell);
+        });
+        let status = document.createElement("div");
+        status.className = "col entry-column";
+        status.innerHTML = "<i class='fa-solid fa-cloud-arrow-up' title='Waiting for connection'></i>";
+        row.appendChild(status);
+        this.container.appendChild(row);
+    }
+
+    // Replace the pending mark with the link for deleting the saved set
+    showSynced(key, exercise_set) {
+        let row = this.container.querySelector("[data-key='" + key + "']");
+        if (row == null || exercise_set == null) {
+            return;
+        }
+        let link = document.createElement("a");
+        link.className = "url-link wo-button";
+        link.href = this.delete_url.replace(/0$/, exercise_set.id);
+        link.innerHTML = "<i class='fa-solid fa-trash-can'></i>";
+        row.lastChild.replaceChildren(link);
+    }
+
+    showFailed(key, errors) {
+        let row = this.container.querySelector("[data-key='" + key + "']");
+        if (row != null) {
+            row.lastChild.innerHTML = "<i class='fa-solid fa-circle-exclamation' title='The set is invalid'></i>";
+        }
+    }
+}
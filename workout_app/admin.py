@@ -7,3 +7,8 @@ admin.site.register(Exercise)
 admin.site.register(ExerciseSet)
 admin.site.register(WorkoutExercise)
 
+admin.site.register(WorkoutExerciseSummary)
+admin.site.register(WorkoutSummary)
+admin.site.register(PersonalRecord)
+admin.site.register(SyncOperation)
+admin.site.register(DeletionJob)
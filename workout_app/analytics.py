@@ -0,0 +1,153 @@
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Max, Q, Sum, Value
+from django.db.models.functions import NullIf
+from .models import Workout, ExerciseSet
+
+# Constants for exercise.type
+STRENGTH = 0
+# Constants for exercise.goal
+REPETITIONS = 0
+# Number of sessions in the moving average
+MOVING_AVERAGE_WINDOW = 4
+# Seconds per day and per week
+DAY = 24 * 60 * 60
+WEEK = 7 * DAY
+# Cached results expire after a day, although they are invalidated by the data version anyway
+CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def user_data_version(user_id):
+    # A version of all the workout data of a user. Every change of a workout, its exercises or
+    # its sets bumps Workout.version, adding or deleting a workout changes the count or the highest id.
+    # The version is read from the database, so it is the same in all processes.
+    version = Workout.objects.filter(user_id=user_id).aggregate(
+        count=Count("id"), versions=Sum("version"), last=Max("id"))
+    return f"{version['count']}.{version['versions'] or 0}.{version['last'] or 0}"
+
+
+def get_progress(user_id, exercise):
+    # The progress of a user in an exercise. The result is cached until the data of the user changes
+    key = f"progress:{user_id}:{exercise.id}:{exercise.type}:{exercise.goal}:{user_data_version(user_id)}"
+    progress = cache.get(key)
+    if progress is None:
+        progress = compute_progress(user_id, exercise)
+        cache.set(key, progress, CACHE_TIMEOUT)
+    return progress
+
+
+def load_sets(user_id, exercise_id):
+    # The sets of a user in an exercise as column arrays, ordered by the date of the workout.
+    # Only the needed columns are fetched, without creating model instances.
+    rows = ExerciseSet.objects.filter(
+        workout_exercise__workout__user_id=user_id, workout_exercise__exercise_id=exercise_id,
+        workout_exercise__workout__deleted_at=None).order_by(
+        "workout_exercise__workout__date", "workout_exercise__workout_id", "id").values_list(
+        "workout_exercise__workout_id", "workout_exercise__workout__date", "reps", "weight", "distance", "time")
+    workout_ids, dates, reps, weights, distances, times = zip(*rows) if rows else ([],) * 6
+    count = len(workout_ids)
+    return {
+        "workout": np.fromiter(workout_ids, dtype=np.int64, count=count),
+        "date": np.fromiter((date.timestamp() for date in dates), dtype=np.float64, count=count),
+        "reps": np.fromiter((value or 0 for value in reps), dtype=np.float64, count=count),
+        "weight": np.fromiter((value or 0 for value in weights), dtype=np.float64, count=count),
+        "distance": np.fromiter((value or 0 for value in distances), dtype=np.float64, count=count),
+        "time": np.fromiter((value.total_seconds() if value else 0 for value in times), dtype=np.float64,
+                            count=count),
+    }
+
+
+def compute_progress(user_id, exercise):
+    # Compute the progress of a user in an exercise:
+    # For strength exercises the estimated one rep max (1RM) per session and the weekly volume,
+    # for cardio exercises the pace per session (seconds per unit of distance, or per repetition).
+    # Both with a moving average and the trend in units per week.
+    sets = load_sets(user_id, exercise.id)
+    if exercise.type == STRENGTH:
+        # Epley formula: weight * (1 + reps / 30). Sets without reps or weight are ignored
+        valid = (sets["reps"] > 0) & (sets["weight"] > 0)
+        values = np.where(valid, sets["weight"] * (1 + sets["reps"] / 30), np.nan)
+        sessions, session_values = per_session(sets, values, np.fmax)
+    else:
+        amount = sets["distance"] if exercise.goal != REPETITIONS else sets["reps"]
+        valid = (amount > 0) & (sets["time"] > 0)
+        values = np.divide(sets["time"], amount, out=np.full_like(amount, np.nan), where=valid)
+        sessions, session_values = per_session(sets, values, np.fmin)
+
+    # Sessions without any valid set are dropped
+    keep = ~np.isnan(session_values)
+    session_dates = sets["date"][sessions][keep]
+    session_values = session_values[keep]
+    return {
+        "metric": "Estimated 1RM (kg)" if exercise.type == STRENGTH else "Pace (s per unit)",
+        "sessions": [{"date": to_datetime(date), "value": round(value, 2),
+                      "moving_average": None if np.isnan(average) else round(average, 2)}
+                     for date, value, average in zip(session_dates.tolist(), session_values.tolist(),
+                                                     moving_average(session_values).tolist())],
+        "trend_per_week": trend(session_dates, session_values),
+        "weekly_volume": weekly_volume(sets) if exercise.type == STRENGTH else [],
+        "set_count": int(len(sets["workout"])),
+        "totals": None if exercise.type == STRENGTH else cardio_totals(user_id, exercise),
+    }
+
+
+def cardio_totals(user_id, exercise):
+    # Total time, average pace and the fastest set of a user in a cardio exercise.
+    # The pace is the time per unit of distance, or per repetition. Everything is computed in SQL.
+    amount = "reps" if exercise.goal == REPETITIONS else "distance"
+    timed = Q(time__gt=timedelta(0))
+    paced = timed & Q(**{f"{amount}__gt": 0})
+    exercise_sets = ExerciseSet.objects.filter(
+        workout_exercise__workout__user_id=user_id, workout_exercise__exercise_id=exercise.id,
+        workout_exercise__workout__deleted_at=None)
+    totals = exercise_sets.aggregate(
+        total_time=Sum("time", filter=timed),
+        total_amount=Sum(amount, filter=timed),
+        average_pace=ExpressionWrapper(
+            Sum("time", filter=paced) / NullIf(Sum(amount, filter=paced), Value(0)), output_field=DurationField()))
+    totals["fastest_set"] = exercise_sets.filter(timed).order_by("time", "id").values(
+        "time", amount, date=F("workout_exercise__workout__date")).first()
+    return totals
+
+
+def per_session(sets, values, reduce):
+    # Reduce the values of the sets to one value per workout, e.g. the maximum.
+    # Returns the index of the first set of each workout and the reduced values
+    if not len(values):
+        return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+    starts = np.flatnonzero(np.r_[True, sets["workout"][1:] != sets["workout"][:-1]])
+    return starts, reduce.reduceat(values, starts)
+
+
+def moving_average(values, window=MOVING_AVERAGE_WINDOW):
+    # Simple moving average. The first window - 1 values have no average (nan)
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        cumulative = np.cumsum(np.insert(values, 0, 0.0))
+        result[window - 1:] = (cumulative[window:] - cumulative[:-window]) / window
+    return result
+
+
+def trend(dates, values):
+    # Slope of the least squares line through the values, in units per week
+    if len(values) < 2 or np.ptp(dates) == 0:
+        return None
+    slope = np.polyfit(dates / WEEK, values, 1)[0]
+    return round(float(slope), 3)
+
+
+def weekly_volume(sets):
+    # Sum of reps x weight per calendar week (weeks start on Monday)
+    if not len(sets["date"]):
+        return []
+    # The unix epoch was a Thursday, so shift by three days to start the weeks on Monday
+    weeks = np.floor((sets["date"] + 3 * DAY) / WEEK).astype(np.int64)
+    unique_weeks, index = np.unique(weeks, return_inverse=True)
+    volume = np.bincount(index, weights=sets["reps"] * sets["weight"])
+    return [{"week": to_datetime(week * WEEK - 3 * DAY), "volume": int(total)}
+            for week, total in zip(unique_weeks.tolist(), volume.tolist())]
+
+
+def to_datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
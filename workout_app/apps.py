@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class WorkoutAppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "workout_app"
+
+    def ready(self):
+        # Count the queries of every database connection for the metrics and the N+1 detector
+        from django.db.backends.signals import connection_created
+        from . import metrics, query_detector
+        connection_created.connect(metrics.install_query_wrapper)
+        connection_created.connect(query_detector.install_query_wrapper)
+        # Invalidate the cached roles when the group membership changes
+        from . import roles  # noqa: F401
+        # Invalidate the cached exercise catalogues when an exercise changes
+        from . import catalogue  # noqa: F401
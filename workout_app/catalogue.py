@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from uuid import uuid4
+from asgiref.sync import sync_to_async
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Exercise
+from . import metrics
+from .fragment_cache import get_cache
+
+# The catalogue of a user: their exercises with id, name, type and goal.
+# Every form for picking an exercise and every report needs it, so it is cached on two levels:
+# in this process and in the cache of the workout rows (settings.WORKOUT_FRAGMENT_CACHE, see fragment_cache.py).
+# Like the roles (see roles.py) every user has a version in that cache. invalidate() gives the user a new
+# version, so the copies of all processes are outdated at once. With several processes the cache must
+# therefore be shared (FRAGMENT_CACHE_BACKEND, see settings.py). With the default LocMemCache
+# every process has a cache of its own: an exercise changed in another process then shows up once
+# the copies have expired, after at most LOCAL_TIMEOUT + TIMEOUT seconds.
+# Saving or deleting an exercise invalidates the catalogue of its user, bulk inserts have to call invalidate().
+# A catalogue that is reloaded from the database and differs from the previous copy gets a new version as well.
+# The cached rows of the workout list include the version in their key, so a row rendered with an outdated
+# catalogue is not served any longer than the catalogue itself.
+
+# A cached exercise
+Entry = namedtuple("Entry", ["id", "name", "type", "goal"])
+
+
+class Catalogue(dict):
+    # id -> Entry. version is the version of the catalogue it has been cached under
+    version = None
+# Number of users whose catalogue is kept in this process. The least recently used are dropped
+LOCAL_SIZE = 1000
+# Seconds until a copy in this process expires, even if its version is still current
+LOCAL_TIMEOUT = 60
+# Seconds until a copy in the cache expires
+TIMEOUT = 5 * 60
+
+# user_id -> (version, catalogue, expiry)
+_local = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _version_key(user_id):
+    return f"exercise-catalogue-version:{user_id}"
+
+
+def _catalogue_key(user_id, version):
+    return f"exercise-catalogue:{user_id}:{version}"
+
+
+def _get_version(user_id):
+    # Current version of the catalogue of a user. A new one is created if the cache has lost it
+    cache = get_cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        cache.add(_version_key(user_id), uuid4().hex, None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def get_catalogue(user_id, exercise_ids=()):
+    # The exercises of a user as a Catalogue of id -> Entry, ordered by id. Do not modify it, it is shared.
+    # @parameter : exercise_ids = ids that must be in the catalogue. If one is missing, the catalogue
+    #              is reloaded from the database once. A new version is only created if the exercises
+    #              have changed: the id may as well belong to another user
+    catalogue = _get_catalogue(user_id)
+    if all(exercise_id in catalogue for exercise_id in exercise_ids):
+        return catalogue
+    reloaded = _load(user_id)
+    if reloaded == catalogue:
+        return catalogue
+    return _store_new_version(user_id, reloaded)
+
+
+def _get_catalogue(user_id):
+    # The catalogue from this process, the cache or the database
+    version = _get_version(user_id)
+    with _local_lock:
+        cached = _local.get(user_id)
+        if cached is not None and cached[0] == version and cached[2] > time.monotonic():
+            _local.move_to_end(user_id)
+            metrics.record_cache_lookup("exercise_catalogue", True)
+            return cached[1]
+    metrics.record_cache_lookup("exercise_catalogue", False)
+
+    catalogue = get_cache().get(_catalogue_key(user_id, version))
+    if catalogue is not None:
+        _store_local(user_id, version, catalogue)
+        return catalogue
+    catalogue = _load(user_id)
+    if cached is not None and cached[0] == version and cached[1] != catalogue:
+        # Changed by a process whose invalidation has not reached this one
+        return _store_new_version(user_id, catalogue)
+    _store(user_id, version, catalogue)
+    return catalogue
+
+
+def _load(user_id):
+    return Catalogue((row[0], Entry(*row)) for row in Exercise.objects.filter(user_id=user_id).order_by(
+        "id").values_list("id", "name", "type", "goal"))
+
+
+def _store_new_version(user_id, catalogue):
+    version = uuid4().hex
+    get_cache().set(_version_key(user_id), version, None)
+    _store(user_id, version, catalogue)
+    return catalogue
+
+
+def _store(user_id, version, catalogue):
+    catalogue.version = version
+    get_cache().set(_catalogue_key(user_id, version), catalogue, TIMEOUT)
+    _store_local(user_id, version, catalogue)
+
+
+def _store_local(user_id, version, catalogue):
+    with _local_lock:
+        _local[user_id] = (version, catalogue, time.monotonic() + LOCAL_TIMEOUT)
+        _local.move_to_end(user_id)
+        while len(_local) > LOCAL_SIZE:
+            _local.popitem(last=False)
+
+
+async def aget_catalogue(user_id, exercise_ids=()):
+    # Async version of get_catalogue. The caches and the database are accessed in a thread
+    return await sync_to_async(get_catalogue)(user_id, exercise_ids)
+
+
+def invalidate(user_id):
+    # Call it after exercises of the user have been created with bulk_create or changed with update().
+    # Saving and deleting an exercise call it through the signals below
+    get_cache().set(_version_key(user_id), uuid4().hex, None)
+    with _local_lock:
+        _local.pop(user_id, None)
+
+
+@receiver(post_save, sender=Exercise)
+@receiver(post_delete, sender=Exercise)
+def exercise_changed(sender, instance, **kwargs):
+    invalidate(instance.user_id)
+
+
+def to_exercise(user_id, entry):
+    # An Exercise object built from the cache, as if it had been loaded from the database
+    return Exercise.from_db(DEFAULT_DB_ALIAS, ["id", "user_id", "name", "type", "goal"],
+                            [entry.id, user_id, entry.name, entry.type, entry.goal])
+
+
+def attach_exercises(user_id, workout_exercises, catalogue):
+    # Set workout_exercise.exercise from the catalogue, so the templates do not load them one by one.
+    # Exercises that are missing from the catalogue are left to be loaded from the database
+    for workout_exercise in workout_exercises:
+        entry = catalogue.get(workout_exercise.exercise_id)
+        if entry is not None:
+            workout_exercise.exercise = to_exercise(user_id, entry)
+    return workout_exercises
@@ -0,0 +1,36 @@
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from .models import Workout, WorkoutExercise, ExerciseSet
+from . import summaries
+
+
+def clone_workout(workout_id, user_id, with_sets=False):
+    # Copy a workout of a user with all its WorkoutExercises into a new workout dated today.
+    # If with_sets is True, the ExerciseSets are copied as well. They are ordinary sets, so they count
+    # in the summaries and the records as if they had been done. The view CloneWorkout does not copy them.
+    # The number of queries does not depend on the number of exercises and sets:
+    # one to load the workout, one each for its exercises and sets, one insert per table
+    # and the queries for the summaries.
+    # Raises Workout.DoesNotExist if the workout does not belong to the user
+    workout_exercises = WorkoutExercise.objects.order_by("id")
+    if with_sets:
+        workout_exercises = workout_exercises.prefetch_related(
+            Prefetch("workout_exercise_exercise_set", queryset=ExerciseSet.objects.order_by("id")))
+    source = Workout.objects.prefetch_related(
+        Prefetch("workout_workout_exercise", queryset=workout_exercises)).get(id=workout_id, user_id=user_id)
+    source_exercises = list(source.workout_workout_exercise.all())
+
+    with transaction.atomic():
+        workout = Workout.objects.create(user_id=user_id, name=source.name, date=timezone.now())
+        new_exercises = WorkoutExercise.objects.bulk_create([
+            WorkoutExercise(workout=workout, exercise_id=workout_exercise.exercise_id)
+            for workout_exercise in source_exercises])
+        if with_sets:
+            ExerciseSet.objects.bulk_create([
+                ExerciseSet(workout_exercise=new_exercise, reps=exercise_set.reps, weight=exercise_set.weight,
+                            time=exercise_set.time, distance=exercise_set.distance)
+                for workout_exercise, new_exercise in zip(source_exercises, new_exercises)
+                for exercise_set in workout_exercise.workout_exercise_exercise_set.all()])
+        summaries.rebuild_workouts([workout.id])
+    return workout
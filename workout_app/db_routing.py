@@ -0,0 +1,179 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.urls import resolve, Resolver404
+
+# Alias of the optional read replica in settings.DATABASES
+REPLICA = "replica"
+# Names of the read-only views whose queries can go to the replica
+REPLICA_VIEWS = {
+    "workout_list",
+    "exercise_progress",
+    "export_workouts",
+    "admin-users",
+    "admin_workout_list",
+    "admin_workout_exercise_list",
+    "admin_exercise_set_list",
+    "admin_exercise_list",
+    "admin_activity",
+    "admin_user_tree",
+}
+# Apps whose tables are always read from the primary. The session holds the time of the last write,
+# so it must never be stale
+PRIMARY_APPS = {"sessions"}
+# Key in the session for the time of the last write of the user
+LAST_WRITE_SESSION_KEY = "last_write"
+# Seconds after a write during which the user reads from the primary, so they see their own changes
+# even if the replica lags behind. Can be set with REPLICA_STICKY_SECONDS in the settings
+DEFAULT_STICKY_SECONDS = 10
+
+# True while the current request (or task) may read from the replica
+_read_from_replica = ContextVar("read_from_replica", default=False)
+# The writes of the current request: {"wrote": True} once a write has been routed to the primary.
+# A dict and not a flag of its own, so writes in the threads of async views reach the middleware
+_writes = ContextVar("writes", default=None)
+
+
+def replica_configured():
+    return REPLICA in connections
+
+
+@contextmanager
+def use_replica(enabled=True):
+    # Send the reads in the block to the replica (if one is configured). Can also be used in commands
+    token = _read_from_replica.set(enabled)
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(token)
+
+
+class ReplicaRouter:
+    # Database router (settings.DATABASE_ROUTERS). Reads go to the replica inside use_replica(),
+    # everything else goes to the primary. Without a replica it always returns the primary.
+
+    def db_for_read(self, model, **hints):
+        if _read_from_replica.get() and model._meta.app_label not in PRIMARY_APPS and replica_configured():
+            return REPLICA
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Remember the write, so the user reads their own changes from the primary for a while.
+        # The session is written on every request that changes it, which is not a change of the data
+        writes = _writes.get()
+        if writes is not None and model._meta.app_label not in PRIMARY_APPS:
+            writes["wrote"] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, REPLICA}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema from the primary through the replication
+        if db == REPLICA:
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    # Lets the views in REPLICA_VIEWS read from the replica. Requests that write to the primary mark
+    # the session, and for REPLICA_STICKY_SECONDS after that the user reads from the primary.
+    # The writes are detected by ReplicaRouter.db_for_write, since several views change data on GET.
+    # Sets request.read_from_replica, so the decision can be checked in tests and logs.
+    # Must come after SessionMiddleware.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall(request)
+        writes = {"wrote": False}
+        token = _writes.set(writes)
+        try:
+            with use_replica(self.__read_from_replica(request)):
+                response = self.get_response(request)
+        finally:
+            _writes.reset(token)
+        self.__remember_write(request, writes)
+        return self.__stream_from_replica(request, response)
+
+    async def __acall(self, request):
+        # The session is loaded from the database, so the decision is made in a thread
+        writes = {"wrote": False}
+        token = _writes.set(writes)
+        try:
+            with use_replica(await sync_to_async(self.__read_from_replica)(request)):
+                response = await self.get_response(request)
+        finally:
+            _writes.reset(token)
+        await sync_to_async(self.__remember_write)(request, writes)
+        return self.__stream_from_replica(request, response)
+
+    def __read_from_replica(self, request):
+        if request.method not in ("GET", "HEAD", "OPTIONS"):
+            request.read_from_replica = False
+            return False
+        request.read_from_replica = self.__is_replica_view(request) and not self.__wrote_recently(request)
+        return request.read_from_replica
+
+    def __remember_write(self, request, writes):
+        # Saved in the session by SessionMiddleware, which comes before this middleware
+        if writes["wrote"] and hasattr(request, "session"):
+            request.session[LAST_WRITE_SESSION_KEY] = time.time()
+
+    def __is_replica_view(self, request):
+        try:
+            return resolve(request.path_info).url_name in REPLICA_VIEWS
+        except Resolver404:
+            return False
+
+    def __wrote_recently(self, request):
+        last_write = request.session.get(LAST_WRITE_SESSION_KEY)
+        sticky_seconds = getattr(settings, "REPLICA_STICKY_SECONDS", DEFAULT_STICKY_SECONDS)
+        return last_write is not None and time.time() - last_write < sticky_seconds
+
+    def __stream_from_replica(self, request, response):
+        # A streamed response (e.g. the export) runs its queries after the view has returned
+        if request.read_from_replica and response.streaming:
+            if response.is_async:
+                response.streaming_content = _achunks_from_replica(response.streaming_content)
+            else:
+                response.streaming_content = _chunks_from_replica(response.streaming_content)
+        return response
+
+
+def _chunks_from_replica(content):
+    # Produce every chunk inside use_replica(). The flag is set and reset around each chunk,
+    # because under ASGI the chunks may be produced in different threads
+    iterator = iter(content)
+    while True:
+        with use_replica():
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+        yield chunk
+
+
+async def _achunks_from_replica(content):
+    # Same for an async stream (see helpers.astream). Its threads get a copy of the context with the flag
+    iterator = aiter(content)
+    while True:
+        with use_replica():
+            try:
+                chunk = await anext(iterator)
+            except StopAsyncIteration:
+                return
+        yield chunk
@@ -0,0 +1,92 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import (Workout, WorkoutExercise, ExerciseSet, Exercise, PersonalRecord, SyncOperation, DeletionJob,
+                     DELETION_KIND)
+
+# Deferred deletion of workouts and users.
+# Deleting a long history at once makes the request slow and holds locks on many rows. So the request only
+# hides the workout (Workout.deleted_at) or the user (is_active = False) and creates a DeletionJob.
+# The purge (management command purge_deleted) deletes the rows later, child tables first, in batches
+# of bounded size, each in a transaction of its own. An interrupted purge continues where it stopped.
+
+WORKOUT = DELETION_KIND[0][0]
+USER = DELETION_KIND[1][0]
+# Number of rows that are deleted at once
+BATCH_SIZE = 1000
+
+
+def delete_workout(workout):
+    # Hide the workout and schedule the purge
+    with transaction.atomic():
+        Workout.all_objects.filter(id=workout.id).update(deleted_at=timezone.now())
+        return DeletionJob.objects.create(kind=WORKOUT, object_id=workout.id)
+
+
+def delete_user(user):
+    # Hide the user and schedule the purge. An inactive user can no longer log in,
+    # and their sessions are no longer valid
+    with transaction.atomic():
+        User.objects.filter(id=user.id).update(is_active=False)
+        return DeletionJob.objects.create(kind=USER, object_id=user.id)
+
+
+def pending_user_ids():
+    # The users whose deletion has been requested. They are hidden in the administration
+    return DeletionJob.objects.filter(kind=USER, finished=None).values("object_id")
+
+
+def pending_jobs():
+    return DeletionJob.objects.filter(finished=None).order_by("id")
+
+
+def purge(job, batch_size=BATCH_SIZE, progress=None):
+    # Delete the rows of a job in batches.
+    # @parameter : progress = function called with the job after every batch
+    if job.started is None:
+        job.started = timezone.now()
+        DeletionJob.objects.filter(id=job.id).update(started=job.started)
+    purger = Purger(job, batch_size, progress)
+    if job.kind == USER:
+        purger.purge_user(job.object_id)
+    else:
+        purger.purge_workout(job.object_id)
+    job.finished = timezone.now()
+    job.error = ""
+    DeletionJob.objects.filter(id=job.id).update(finished=job.finished, error="")
+
+
+class Purger:
+    def __init__(self, job, batch_size, progress):
+        self.job = job
+        self.batch_size = batch_size
+        self.progress = progress
+
+    def purge_workout(self, workout_id):
+        self.delete_in_batches(ExerciseSet.objects.filter(workout_exercise__workout_id=workout_id))
+        # Deletes the summaries along
+        self.delete_in_batches(WorkoutExercise.objects.filter(workout_id=workout_id))
+        self.delete_in_batches(Workout.all_objects.filter(id=workout_id))
+
+    def purge_user(self, user_id):
+        for workout_id in Workout.all_objects.filter(user_id=user_id).values_list("id", flat=True).iterator():
+            self.purge_workout(workout_id)
+        self.delete_in_batches(SyncOperation.objects.filter(user_id=user_id))
+        self.delete_in_batches(PersonalRecord.objects.filter(user_id=user_id))
+        self.delete_in_batches(Exercise.objects.filter(user_id=user_id))
+        # The remaining rows of the user are few, e.g. the email addresses and the activity
+        self.delete_in_batches(User.objects.filter(id=user_id))
+
+    def delete_in_batches(self, queryset):
+        model = queryset.model
+        while True:
+            ids = list(queryset.order_by("pk").values_list("pk", flat=True)[:self.batch_size])
+            if not ids:
+                return
+            with transaction.atomic():
+                deleted, per_model = model._base_manager.filter(pk__in=ids).delete()
+                DeletionJob.objects.filter(id=self.job.id).update(deleted_rows=F("deleted_rows") + deleted)
+            self.job.deleted_rows += deleted
+            if self.progress is not None:
+                self.progress(self.job)
@@ -0,0 +1,162 @@
+import csv
+import json
+import zlib
+from datetime import datetime, time, timedelta
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from .models import Workout, WorkoutExercise, ExerciseSet
+from .helpers import format_time
+
+# Supported formats and their content types
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+# Columns of the CSV export. There is one row per ExerciseSet.
+# WorkoutExercises without sets get a row with empty set columns.
+CSV_COLUMNS = ["workout_id", "workout_name", "workout_date", "exercise", "exercise_type", "exercise_goal",
+               "done", "set_id", "reps", "weight", "time", "distance"]
+# Number of workouts that are loaded at once
+CHUNK_SIZE = 500
+
+
+def get_workouts(user_id, start=None, end=None, chunk_size=CHUNK_SIZE):
+    # Iterate over the workouts of a user with their exercises and sets, oldest first.
+    # The workouts are fetched in chunks and the exercises and sets are prefetched per chunk,
+    # so the memory does not depend on the size of the history.
+    # @parameter : start, end = dates (inclusive) to limit the export to
+    workouts = Workout.objects.filter(user_id=user_id).order_by("date", "id")
+    if start:
+        workouts = workouts.filter(date__gte=_start_of_day(start))
+    if end:
+        workouts = workouts.filter(date__lt=_start_of_day(end + timedelta(days=1)))
+    workout_exercises = WorkoutExercise.objects.select_related("exercise").order_by("id").prefetch_related(
+        Prefetch("workout_exercise_exercise_set", queryset=ExerciseSet.objects.order_by("id")))
+    return workouts.prefetch_related(
+        Prefetch("workout_workout_exercise", queryset=workout_exercises)).iterator(chunk_size=chunk_size)
+
+
+def parse_day(value):
+    # None if the parameter is empty. Raises ValueError if it is not a valid date (YYYY-MM-DD)
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+    except ValueError:
+        # Well formed, but not a date, e.g. 2023-02-30
+        day = None
+    if day is None:
+        raise ValueError(value)
+    return day
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def workout_to_dict(workout):
+    # The tree of a workout: workout -> exercises -> sets
+    return {
+        "id": workout.id,
+        "name": workout.name,
+        "date": workout.date.isoformat(),
+        "exercises": [{
+            "id": workout_exercise.id,
+            "exercise": workout_exercise.exercise.name,
+            "type": workout_exercise.exercise.get_type_display(),
+            "goal": workout_exercise.exercise.get_goal_display(),
+            "done": workout_exercise.done,
+            "sets": [set_to_dict(exercise_set) for exercise_set in workout_exercise.workout_exercise_exercise_set.all()],
+        } for workout_exercise in workout.workout_workout_exercise.all()],
+    }
+
+
+def set_to_dict(exercise_set):
+    return {
+        "id": exercise_set.id,
+        "reps": exercise_set.reps,
+        "weight": exercise_set.weight,
+        "time": format_time(exercise_set.time),
+        "distance": exercise_set.distance,
+    }
+
+
+class Echo:
+    # Pseudo buffer for csv.writer, which returns the written line instead of storing it
+    def write(self, value):
+        return value
+
+
+def stream_csv(workouts):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for workout in workouts:
+        for workout_exercise in workout.workout_workout_exercise.all():
+            exercise = workout_exercise.exercise
+            columns = [workout.id, workout.name, workout.date.isoformat(), exercise.name,
+                       exercise.get_type_display(), exercise.get_goal_display(), workout_exercise.done]
+            exercise_sets = workout_exercise.workout_exercise_exercise_set.all()
+            if not exercise_sets:
+                yield writer.writerow(columns + [""] * 5)
+            for exercise_set in exercise_sets:
+                yield writer.writerow(columns + [exercise_set.id, exercise_set.reps, exercise_set.weight,
+                                                 format_time(exercise_set.time), exercise_set.distance])
+
+
+def stream_ndjson(workouts):
+    # One workout per line
+    for workout in workouts:
+        yield json.dumps(workout_to_dict(workout)) + "\n"
+
+
+def stream_json(workouts):
+    # A JSON array of workouts, written one workout at a time
+    yield "["
+    separator = ""
+    for workout in workouts:
+        yield separator + json.dumps(workout_to_dict(workout))
+        separator = ",\n"
+    yield "]\n"
+
+
+def stream_user_tree(user, start=None, end=None):
+    # The complete tree of a user for the administration: the user, then their workouts with
+    # exercises and sets, written one workout at a time. The number of workouts comes last,
+    # since it is only known at the end of the stream.
+    yield '{"user": ' + json.dumps({
+        "id": user.id,
+        "username": user.username,
+        "is_active": user.is_active,
+        "date_joined": user.date_joined.isoformat(),
+        "last_login": user.last_login.isoformat() if user.last_login else None,
+    })
+    yield ', "start": ' + json.dumps(start.isoformat() if start else None)
+    yield ', "end": ' + json.dumps(end.isoformat() if end else None)
+    yield ', "workouts": ['
+    count = 0
+    for workout in get_workouts(user.id, start, end):
+        yield (",\n" if count else "") + json.dumps(workout_to_dict(workout))
+        count += 1
+    yield '], "workout_count": ' + json.dumps(count) + "}\n"
+
+
+def gzip_stream(chunks):
+    # Compress a stream of strings on the fly
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(user_id, export_format, start=None, end=None, compress=False):
+    # Stream the history of a user in the given format, optionally gzipped
+    workouts = get_workouts(user_id, start, end)
+    streams = {"csv": stream_csv, "ndjson": stream_ndjson, "json": stream_json}
+    chunks = streams[export_format](workouts)
+    if compress:
+        return gzip_stream(chunks)
+    return (chunk.encode() for chunk in chunks)
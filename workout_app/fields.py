@@ -0,0 +1,45 @@
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import models
+from .helpers import parse_time, format_time
+
+
+class TimerDurationFormField(forms.DurationField):
+    # Form field for durations in the format of the timer in static/js/timer.js, "hh:mm:ss:d"
+    widget = forms.TextInput
+
+    def prepare_value(self, value):
+        if isinstance(value, str):
+            return value
+        return format_time(value)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return parse_time(value)
+        except (ValueError, OverflowError):
+            raise ValidationError(self.error_messages["invalid"], code="invalid")
+
+
+class TimerDurationField(models.DurationField):
+    # DurationField that also accepts the format of the timer, "hh:mm:ss:d".
+    # The database stores a native interval (or microseconds), so times can be summed,
+    # sorted and compared in SQL.
+
+    def to_python(self, value):
+        try:
+            return parse_time(value)
+        except (ValueError, OverflowError):
+            raise ValidationError(self.error_messages["invalid"], code="invalid", params={"value": value})
+
+    def get_prep_value(self, value):
+        return self.to_python(super().get_prep_value(value))
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        return super().get_db_prep_value(value, connection, prepared=True)
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{"form_class": TimerDurationFormField, **kwargs})
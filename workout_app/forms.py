@@ -1,5 +1,6 @@
-from django.forms import ModelForm, TextInput, IntegerField, HiddenInput, modelformset_factory, CharField, DateField
+from django.forms import Form, FileField, ChoiceField, ModelForm, TextInput, IntegerField, HiddenInput, modelformset_factory, CharField, DateField, ModelChoiceField, ValidationError
 from .models import *
+from . import catalogue as exercise_catalogue
 
 class WorkoutForm(ModelForm):
     class Meta:
@@ -50,6 +51,38 @@ class ExerciseForm(ModelForm):
         self.fields['goal'].widget.attrs['class'] = 'input-field'
 
 
+class CatalogueChoiceField(ModelChoiceField):
+    # Selector of an exercise of the user. The options are taken from the cached catalogue
+    # (see catalogue.py), so rendering the field does not query the exercises. The selected one is
+    # not loaded from the database, it is only checked to still exist
+    user_id = None
+    catalogue = None
+
+    def set_catalogue(self, user_id, catalogue):
+        # The queryset restricts the choices to the user, should the catalogue be missing an exercise
+        self.queryset = Exercise.objects.filter(user_id=user_id)
+        self.user_id = user_id
+        self.catalogue = catalogue
+        # Setting the queryset has replaced the choices of the widget
+        self.widget.choices = [("", self.empty_label)] + [(entry.id, entry.name) for entry in catalogue.values()]
+
+    def to_python(self, value):
+        if value in self.empty_values or self.catalogue is None:
+            return super().to_python(value)
+        try:
+            entry = self.catalogue.get(int(value))
+        except (TypeError, ValueError):
+            raise ValidationError(self.error_messages["invalid_choice"], code="invalid_choice",
+                                  params={"value": value})
+        if entry is None:
+            return super().to_python(value)
+        if not self.queryset.filter(id=entry.id).exists():
+            # Deleted in another process, whose invalidation has not reached this one yet
+            exercise_catalogue.invalidate(self.user_id)
+            return super().to_python(value)
+        return exercise_catalogue.to_exercise(self.user_id, entry)
+
+
 class WorkoutExerciseForm(ModelForm):
     # id of the WorkoutExercise as a hidden field
     # id = IntegerField(widget = HiddenInput) 
@@ -57,14 +90,31 @@ class WorkoutExerciseForm(ModelForm):
     class Meta:
         model= WorkoutExercise
         fields = ["exercise"]
+        field_classes = {"exercise": CatalogueChoiceField}
 
     def __init__(self, *args, **kwargs):
+        # @parameter : catalogue = the catalogue of the user, if it has been loaded already.
+        # Async views have to pass it, since loading it may query the database
         user_id = kwargs.pop("user_id")
+        catalogue = kwargs.pop("catalogue", None)
         super(WorkoutExerciseForm, self).__init__(*args, **kwargs)        
         # Set the empty label in the selector
         self.fields['exercise'].empty_label = "( --- Select Exercise --- )"
-        self.fields['exercise'].queryset = Exercise.objects.filter(user_id=user_id)
+        if catalogue is None:
+            catalogue = exercise_catalogue.get_catalogue(user_id)
+        self.fields['exercise'].set_catalogue(user_id, catalogue)
         self.fields['exercise'].widget.attrs.update({"class": "input-field"})
 
 # FormSet to hold multiple forms of type WorkoutExerciseForm
-WorkoutExerciseFormset = modelformset_factory(model=WorkoutExercise, form=WorkoutExerciseForm, fields = ["exercise", "done"], extra=0)
\ No newline at end of file
+WorkoutExerciseFormset = modelformset_factory(model=WorkoutExercise, form=WorkoutExerciseForm, fields = ["exercise", "done"], extra=0)
+
+
+class ImportWorkoutsForm(Form):
+    # Form for uploading a file with workouts, in one of the formats of the export
+    file = FileField()
+    format = ChoiceField(choices=[("csv", "CSV"), ("json", "JSON"), ("ndjson", "NDJSON")])
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['file'].widget.attrs['class'] = 'input-field'
+        self.fields['format'].widget.attrs['class'] = 'input-field'
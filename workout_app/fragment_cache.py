@@ -0,0 +1,50 @@
+import threading
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from .models import Workout
+from . import metrics
+
+# Version of the markup of a row in workout_list.html.
+# Increment it whenever the row changes, so rows rendered by the old template are not served
+ROW_TEMPLATE_VERSION = 2
+# Counters of the cached workout rows in this process
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    # The cache backend for the rows is configured in settings.CACHES
+    return caches[getattr(settings, "WORKOUT_FRAGMENT_CACHE", "default")]
+
+
+def workout_row_key(workout_id, version, catalogue_version=""):
+    # Every change of the workout bumps its version, so an outdated row is never read again.
+    # The row shows the names of the exercises from the catalogue (see catalogue.py), so its version is included
+    return f"workout-row:{ROW_TEMPLATE_VERSION}:{workout_id}:{version}:{catalogue_version}"
+
+
+def bump_workout_versions(workout_ids):
+    # Invalidate the cached rows of the given workouts
+    Workout.objects.filter(id__in=list(workout_ids)).update(version=F("version") + 1)
+
+
+def record(hit):
+    # Count a hit or a miss
+    with _stats_lock:
+        _stats["hits" if hit else "misses"] += 1
+    metrics.record_cache_lookup("workout_rows", hit)
+
+
+def get_stats():
+    # Hits, misses and the hit ratio of this process
+    with _stats_lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_ratio": hits / total if total else 0.0}
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats["hits"] = 0
+        _stats["misses"] = 0
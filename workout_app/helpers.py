@@ -1,14 +1,76 @@
-from django.http import HttpResponseRedirect
-from django.shortcuts import reverse
-
-# Redirect user to the main page of their group
-def redirect_user_to_goup(request):
-    user_group = None
-    # Grab the name of the first group of the user
-    # Users can belong to many groups, yet in this project
-    # there is only one group: admin
-    user_group = request.user.groups.all()[0].name
-    if user_group == 'admin':
-        return HttpResponseRedirect(reverse("admin-users"))
-    else:
-        return HttpResponseRedirect(reverse("home"))
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.contrib.auth.middleware import get_user
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.shortcuts import render
+from django.utils.dateparse import parse_duration
+from datetime import timedelta
+
+# Helpers for async views.
+# The session, the user and the templates run blocking queries, which are not allowed in the event loop.
+
+# Load request.user in a thread. Afterwards it can be used without queries
+async def aget_user(request):
+    request.user = await sync_to_async(get_user)(request)
+    return request.user
+
+
+# Render a template in a thread, since the template might evaluate querysets,
+# e.g. the choices of a form or the messages stored in the session
+async def arender(request, template_name, context=None):
+    return await sync_to_async(render)(request, template_name, context)
+
+
+# Number of chunks of a synchronous stream that astream() produces per thread switch
+ASTREAM_BATCH = 50
+
+
+# Iterate over a synchronous stream of bytes asynchronously. Under ASGI Django 4.2 reads a synchronous
+# stream into memory before sending it. Here the stream runs in a thread, a batch of chunks at a time,
+# so only that batch is held in memory
+async def astream(chunks, batch_size=ASTREAM_BATCH):
+    iterator = iter(chunks)
+    while True:
+        batch = await sync_to_async(lambda: list(islice(iterator, batch_size)))()
+        if not batch:
+            return
+        yield b"".join(batch)
+
+
+# StreamingHttpResponse that streams under WSGI as well as under ASGI
+def streaming_response(request, chunks, content_type):
+    if isinstance(request, ASGIRequest):
+        chunks = astream(chunks)
+    return StreamingHttpResponse(chunks, content_type=content_type)
+
+
+# Parse the time of an ExerciseSet in the format of the timer, "01:02:03:4" (hours:minutes:seconds:tenths),
+# into a timedelta. Missing leading parts are allowed, e.g. "03:4" means 3.4 seconds.
+# Other formats of durations, such as "1:02:03.4", are accepted as well.
+# Raises ValueError for invalid values
+def parse_time(value):
+    if value is None or isinstance(value, timedelta):
+        return value
+    value = str(value).strip()
+    if not value:
+        return None
+    parts = value.split(":")
+    if len(parts) <= 4 and all(part.isdigit() for part in parts):
+        hours, minutes, seconds, tenths = ([0] * 4 + [int(part) for part in parts])[-4:]
+        return timedelta(hours=hours, minutes=minutes, seconds=seconds + tenths / 10)
+    duration = parse_duration(value)
+    if duration is None:
+        raise ValueError(f"Invalid time {value}")
+    return duration
+
+
+# Format the time of an ExerciseSet like the timer does, e.g. "01:02:03:4"
+def format_time(value):
+    if value is None:
+        return ""
+    tenths = int(value.total_seconds() * 10)
+    hours, tenths = divmod(tenths, 36000)
+    minutes, tenths = divmod(tenths, 600)
+    seconds, tenths = divmod(tenths, 10)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}:{tenths}"
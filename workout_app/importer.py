@@ -0,0 +1,249 @@
+import codecs
+import csv
+import json
+import time as timer
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from django.utils import timezone
+from .models import Workout, Exercise, WorkoutExercise, ExerciseSet, EXERCISE_TYPE, EXERCISE_GOAL
+from .forms import ExerciseSetForm
+from . import summaries, records, catalogue
+
+# Formats that can be imported. They are the formats of export.py
+IMPORT_FORMATS = ("csv", "ndjson", "json")
+# Number of workouts that are inserted at once
+BATCH_SIZE = 500
+# Size of the chunks in which a JSON file is read
+READ_SIZE = 64 * 1024
+
+
+class ImportValidationError(Exception):
+    # Raised for invalid data. The import is rolled back
+    def __init__(self, message, record=None):
+        if record is not None:
+            message = f"Record {record}: {message}"
+        super().__init__(message)
+
+
+class ImportResult:
+    # Statistics of an import
+    def __init__(self, workouts, sets, seconds):
+        self.workouts = workouts
+        self.sets = sets
+        self.seconds = seconds
+
+    @property
+    def rows_per_second(self):
+        return self.sets / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f"Imported {self.workouts} workouts and {self.sets} sets in {self.seconds:.2f}s "
+                f"({self.rows_per_second:.0f} rows/s)")
+
+
+class WorkoutImporter:
+    # Imports workouts in the formats of export.py for a user.
+    # The file is read as a stream and the workouts are inserted in batches using bulk_create:
+    # one query per batch for the workouts, the workout exercises and the sets each.
+    # Exercises are matched by name and created if the user does not have them yet.
+    # Everything runs in one transaction, so an invalid record leaves the database untouched.
+
+    def __init__(self, user, batch_size=BATCH_SIZE):
+        self.user = user
+        self.batch_size = batch_size
+
+    def run(self, file, import_format):
+        # @parameter : file = binary file object
+        if import_format not in IMPORT_FORMATS:
+            raise ImportValidationError(f"Unknown format {import_format}")
+        started = timer.perf_counter()
+        workout_count = 0
+        set_count = 0
+        records = {"csv": read_csv, "ndjson": read_ndjson, "json": read_json}[import_format](file)
+        with transaction.atomic():
+            self.exercises = {exercise.name: exercise for exercise in Exercise.objects.filter(user_id=self.user.id)}
+            batch = []
+            for number, record in enumerate(records, start=1):
+                batch.append(self.__clean_workout(record, number))
+                if len(batch) == self.batch_size:
+                    set_count += self.__insert(batch)
+                    workout_count += len(batch)
+                    batch = []
+            if batch:
+                set_count += self.__insert(batch)
+                workout_count += len(batch)
+        return ImportResult(workout_count, set_count, timer.perf_counter() - started)
+
+    def __insert(self, batch):
+        # Insert a batch of cleaned workouts and return the number of sets
+        self.__create_missing_exercises(batch)
+        workouts = Workout.objects.bulk_create([
+            Workout(user_id=self.user.id, name=workout["name"], date=workout["date"]) for workout in batch])
+
+        workout_exercises = []
+        for workout, cleaned in zip(workouts, batch):
+            for exercise in cleaned["exercises"]:
+                workout_exercises.append(WorkoutExercise(
+                    workout=workout, exercise=self.exercises[exercise["exercise"]], done=exercise["done"]))
+        workout_exercises = WorkoutExercise.objects.bulk_create(workout_exercises)
+
+        exercise_sets = []
+        cleaned_exercises = (exercise for cleaned in batch for exercise in cleaned["exercises"])
+        for workout_exercise, cleaned in zip(workout_exercises, cleaned_exercises):
+            for exercise_set in cleaned["sets"]:
+                exercise_sets.append(ExerciseSet(workout_exercise=workout_exercise, **exercise_set))
+        ExerciseSet.objects.bulk_create(exercise_sets, batch_size=self.batch_size * 10)
+
+        summaries.rebuild_workouts([workout.id for workout in workouts])
+        self.__register_records(exercise_sets)
+        return len(exercise_sets)
+
+    def __register_records(self, exercise_sets):
+        # Update the personal records once per exercise with the new sets
+        sets_per_exercise = {}
+        for exercise_set in exercise_sets:
+            sets_per_exercise.setdefault(exercise_set.workout_exercise.exercise_id, []).append(exercise_set)
+        for exercise_id, sets in sets_per_exercise.items():
+            records.register_sets(self.user.id, exercise_id, sets)
+
+    def __create_missing_exercises(self, batch):
+        missing = {}
+        for workout in batch:
+            for exercise in workout["exercises"]:
+                if exercise["exercise"] not in self.exercises:
+                    missing[exercise["exercise"]] = Exercise(
+                        user_id=self.user.id, name=exercise["exercise"], type=exercise["type"], goal=exercise["goal"])
+        for exercise in Exercise.objects.bulk_create(missing.values()):
+            self.exercises[exercise.name] = exercise
+        if missing:
+            # bulk_create does not send post_save
+            catalogue.invalidate(self.user.id)
+
+    def __clean_workout(self, record, number):
+        # Validate a workout and convert it to the values of the models
+        if not isinstance(record, dict):
+            raise ImportValidationError("A workout must be an object", number)
+        name = str(record.get("name") or "").strip()
+        if not name:
+            raise ImportValidationError("The workout has no name", number)
+        if len(name) > Workout._meta.get_field("name").max_length:
+            raise ImportValidationError("The name of the workout is too long", number)
+        date = parse_datetime(str(record.get("date") or ""))
+        if date is None:
+            raise ImportValidationError(f"Invalid date {record.get('date')}", number)
+        if timezone.is_naive(date):
+            date = timezone.make_aware(date)
+        exercises = record.get("exercises") or []
+        if not isinstance(exercises, list):
+            raise ImportValidationError("exercises must be a list", number)
+        return {"name": name, "date": date,
+                "exercises": [self.__clean_exercise(exercise, number) for exercise in exercises]}
+
+    def __clean_exercise(self, record, number):
+        if not isinstance(record, dict):
+            raise ImportValidationError("An exercise must be an object", number)
+        name = str(record.get("exercise") or "").strip()
+        if not name:
+            raise ImportValidationError("The exercise has no name", number)
+        if len(name) > Exercise._meta.get_field("name").max_length:
+            raise ImportValidationError("The name of the exercise is too long", number)
+        exercise_sets = record.get("sets") or []
+        if not isinstance(exercise_sets, list):
+            raise ImportValidationError("sets must be a list", number)
+        return {
+            "exercise": name,
+            "type": choice_value(EXERCISE_TYPE, record.get("type", 0), number),
+            "goal": choice_value(EXERCISE_GOAL, record.get("goal", 0), number),
+            "done": str(record.get("done", False)).lower() in ("true", "1"),
+            "sets": [self.__clean_set(exercise_set, number) for exercise_set in exercise_sets],
+        }
+
+    def __clean_set(self, record, number):
+        # Sets are validated with the rules of ExerciseSetForm
+        if not isinstance(record, dict):
+            raise ImportValidationError("A set must be an object", number)
+        form = ExerciseSetForm({field: record.get(field) for field in ExerciseSetForm.Meta.fields})
+        if not form.is_valid():
+            errors = "; ".join(f"{field}: {' '.join(messages)}" for field, messages in form.errors.items())
+            raise ImportValidationError(f"Invalid set ({errors})", number)
+        return form.cleaned_data
+
+
+def choice_value(choices, value, number):
+    # Accept both the value and the label of a choice, e.g. 1 or "Cardio"
+    for choice, label in choices:
+        if str(value).lower() in (str(choice), label.lower()):
+            return choice
+    raise ImportValidationError(f"Invalid choice {value}", number)
+
+
+def read_csv(file):
+    # Yield the workouts of a CSV file in the format of export.CSV_COLUMNS.
+    # Consecutive rows of the same workout are merged, so are consecutive rows of the same exercise.
+    rows = csv.DictReader(codecs.iterdecode(file, "utf-8"))
+    workout = None
+    for row in rows:
+        if workout is None or row.get("workout_id") != workout["id"]:
+            if workout is not None:
+                yield workout
+            workout = {"id": row.get("workout_id"), "name": row.get("workout_name"),
+                       "date": row.get("workout_date"), "exercises": []}
+        exercises = workout["exercises"]
+        if not exercises or exercises[-1]["exercise"] != row.get("exercise"):
+            exercises.append({"exercise": row.get("exercise"), "type": row.get("exercise_type"),
+                              "goal": row.get("exercise_goal"), "done": row.get("done"), "sets": []})
+        if row.get("set_id"):
+            exercises[-1]["sets"].append(
+                {field: row.get(field) or None for field in ("reps", "weight", "time", "distance")})
+    if workout is not None:
+        yield workout
+
+
+def read_ndjson(file):
+    # Yield the workouts of a file with one JSON object per line
+    for number, line in enumerate(file, start=1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError as error:
+                raise ImportValidationError(f"Invalid JSON ({error})", number)
+
+
+def read_json(file):
+    # Yield the elements of a JSON array one by one, without loading the whole file
+    decoder = json.JSONDecoder()
+    text_stream = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = 0
+    started = False
+    end_of_file = False
+    number = 0
+    while True:
+        # Skip whitespace and, inside the array, the separators
+        while position < len(buffer) and (buffer[position].isspace() or (started and buffer[position] == ",")):
+            position += 1
+        if position < len(buffer):
+            if not started:
+                if buffer[position] != "[":
+                    raise ImportValidationError("Expected a JSON array")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                return
+            try:
+                record, position = decoder.raw_decode(buffer, position)
+            except ValueError as error:
+                # The element might be incomplete, unless the whole file has been read
+                if end_of_file:
+                    raise ImportValidationError(f"Invalid JSON ({error})", number + 1)
+            else:
+                number += 1
+                yield record
+                continue
+        elif end_of_file:
+            raise ImportValidationError("Unexpected end of the JSON array" if started else "Expected a JSON array")
+        chunk = file.read(READ_SIZE)
+        end_of_file = not chunk
+        buffer = buffer[position:] + text_stream.decode(chunk, final=end_of_file)
+        position = 0
@@ -0,0 +1,166 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import connection
+from django.shortcuts import reverse
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from workout_app import urls as workout_urls
+from admin_app import urls as admin_urls
+from workout_app.models import ExerciseSet
+
+# Views that change data on GET or only accept POST. They are not benchmarked
+SKIPPED_VIEWS = {
+    "add_exercise_set",
+    "add_workout_exercise",
+    "clone_workout",
+    "delete_exercise",
+    "delete_exercise_set",
+    "delete_workout",
+    "delete_workout_exercise",
+    "admin_delete_user",
+    "log_exercise_sets",
+    "sync_exercise_sets",
+}
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile of a sorted list
+    if not values:
+        return 0
+    index = max(0, min(len(values) - 1, round(fraction * len(values) + 0.5) - 1))
+    return values[index]
+
+
+class Command(BaseCommand):
+    # Request every read view of workout_app and admin_app with the test client and report
+    # p50/p95/p99 latency, the number of queries and the peak memory per view as JSON.
+    # Run it against the same data (see seed_workouts) before and after a change and compare the files.
+    help = "Benchmark the views with the test client and report the results as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username", help="User whose pages are requested, e.g. seed0")
+        parser.add_argument("--repeat", type=int, default=50, help="Timed requests per view")
+        parser.add_argument("--view", action="append", dest="views", help="Only benchmark this URL name")
+        parser.add_argument("--output", help="Write the JSON to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        try:
+            self.user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']} does not exist")
+        paths = self.__paths()
+        if options["views"]:
+            unknown = set(options["views"]) - set(paths)
+            if unknown:
+                raise CommandError(f"Unknown or skipped views: {', '.join(sorted(unknown))}")
+            paths = {name: path for name, path in paths.items() if name in options["views"]}
+
+        client = Client()
+        client.force_login(self.user)
+        results = {}
+        # The test client sends the host "testserver"
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            for name, path in paths.items():
+                results[name] = self.__benchmark(client, path, options["repeat"])
+                if options["output"]:
+                    self.stdout.write(f"{name}: p50 {results[name]['p50_ms']} ms, "
+                                      f"{results[name]['queries']} queries")
+
+        report = json.dumps({"meta": self.__meta(options), "views": results}, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(report)
+        else:
+            self.stdout.write(report)
+
+    def __paths(self):
+        # The URL of every view, with the ids of the user's newest data as arguments
+        exercise_set = ExerciseSet.objects.filter(
+            workout_exercise__workout__user=self.user).select_related("workout_exercise").order_by("-id").first()
+        if exercise_set is None:
+            raise CommandError("The user has no exercise sets. Seed data with seed_workouts first")
+        arguments = {
+            "id": exercise_set.workout_exercise.workout_id,
+            "workout_id": exercise_set.workout_exercise.workout_id,
+            "workout_exercise_id": exercise_set.workout_exercise_id,
+            "exercise_id": exercise_set.workout_exercise.exercise_id,
+            "exercise_set_id": exercise_set.id,
+            "user_id": self.user.id,
+        }
+        paths = {}
+        for pattern in workout_urls.urlpatterns + admin_urls.urlpatterns:
+            if pattern.name in SKIPPED_VIEWS:
+                continue
+            kwargs = {name: arguments[name] for name in pattern.pattern.converters}
+            paths[pattern.name] = reverse(pattern.name, kwargs=kwargs)
+        return paths
+
+    def __request(self, client, path):
+        response = client.get(path)
+        if response.streaming:
+            # The export does its work while it is streamed
+            for chunk in response.streaming_content:
+                pass
+        return response
+
+    def __benchmark(self, client, path, repeat):
+        # Warm up the caches, count the queries once, then time the requests
+        with CaptureQueriesContext(connection) as context:
+            response = self.__request(client, path)
+        queries = len(context.captured_queries)
+
+        latencies = []
+        for i in range(repeat):
+            started = time.perf_counter()
+            self.__request(client, path)
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+
+        # tracemalloc slows down the request, so the memory is measured in a separate request
+        tracemalloc.start()
+        try:
+            self.__request(client, path)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        return {
+            "path": path,
+            "status": response.status_code,
+            "requests": repeat,
+            "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0,
+            "queries": queries,
+            "peak_memory_kb": round(peak / 1024, 1),
+        }
+
+    def __meta(self, options):
+        return {
+            "commit": self.__commit(),
+            "created": timezone.now().isoformat(),
+            "username": options["username"],
+            "repeat": options["repeat"],
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+        }
+
+    def __commit(self):
+        # The commit that is benchmarked, if the code is in a git repository
+        try:
+            result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+                                    capture_output=True, text=True, timeout=5)
+        except (OSError, subprocess.SubprocessError):
+            return None
+        return result.stdout.strip() or None
@@ -0,0 +1,91 @@
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.shortcuts import reverse
+from django.test import Client, AsyncClient, override_settings
+from workout_app.models import WorkoutExercise
+
+
+class Command(BaseCommand):
+    # Load comparison of the read views through the WSGI handler (threads) and the ASGI handler (event loop).
+    # The requests are made in-process with django's test clients, so no server is needed
+    # and the numbers show the cost of the handlers, the views and the database, without the network.
+    help = "Compare the read views under WSGI and ASGI at high concurrency"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username", help="User whose pages are requested")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per handler")
+        parser.add_argument("--concurrency", type=int, default=50, help="Requests in flight at once")
+
+    def handle(self, *args, **options):
+        try:
+            self.user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']} does not exist")
+        paths = self.__paths()
+        # The paths are requested in turns
+        requests = [paths[i % len(paths)] for i in range(options["requests"])]
+        concurrency = options["concurrency"]
+
+        self.stdout.write(f"{len(requests)} requests per handler, {concurrency} concurrent, paths: {', '.join(paths)}")
+        # The test clients send the host "testserver"
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            wsgi = self.__run_wsgi(requests, concurrency)
+            self.__report("WSGI", *wsgi)
+            asgi = asyncio.run(self.__run_asgi(requests, concurrency))
+            self.__report("ASGI", *asgi)
+
+    def __paths(self):
+        paths = [reverse("workout_list")]
+        workout_exercise = WorkoutExercise.objects.filter(workout__user=self.user).order_by("-id").first()
+        if workout_exercise is not None:
+            paths.append(reverse("edit_workout", kwargs={"id": workout_exercise.workout_id}))
+            paths.append(reverse("edit_exercise_set", kwargs={"workout_exercise_id": workout_exercise.id}))
+        return paths
+
+    def __run_wsgi(self, requests, concurrency):
+        # One client per thread, like one worker thread per request
+        local = threading.local()
+
+        def get(path):
+            if not hasattr(local, "client"):
+                local.client = Client()
+                local.client.force_login(self.user)
+            client = local.client
+            started = time.perf_counter()
+            response = client.get(path)
+            return response.status_code, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(get, requests))
+        return results, time.perf_counter() - started
+
+    async def __run_asgi(self, requests, concurrency):
+        client = AsyncClient()
+        await asyncio.to_thread(client.force_login, self.user)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def get(path):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path)
+                return response.status_code, time.perf_counter() - started
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(get(path) for path in requests))
+        return results, time.perf_counter() - started
+
+    def __report(self, name, results, seconds):
+        latencies = sorted(latency for status, latency in results)
+        errors = sum(1 for status, latency in results if status >= 400)
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+        self.stdout.write(
+            f"{name}: {len(results) / seconds:.1f} requests/s, median {statistics.median(latencies) * 1000:.1f} ms, "
+            f"p95 {p95 * 1000:.1f} ms, {errors} errors")
+
@@ -0,0 +1,39 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from workout_app import export
+
+
+class Command(BaseCommand):
+    # Stream the training history of a user to a file or to stdout
+    help = "Export the workouts, exercises and sets of a user as CSV, NDJSON or JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--format", choices=list(export.EXPORT_FORMATS), default="csv")
+        parser.add_argument("--start", help="First date (YYYY-MM-DD)")
+        parser.add_argument("--end", help="Last date (YYYY-MM-DD)")
+        parser.add_argument("--gzip", action="store_true", help="Compress the output")
+        parser.add_argument("--output", help="Output file. Defaults to stdout")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']} does not exist")
+        # The same dates as in the view ExportWorkouts
+        try:
+            start = export.parse_day(options["start"])
+            end = export.parse_day(options["end"])
+        except ValueError as error:
+            raise CommandError(f"Invalid date: {error}")
+
+        chunks = export.stream_export(user.id, options["format"], start, end, options["gzip"])
+        if options["output"]:
+            with open(options["output"], "wb") as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
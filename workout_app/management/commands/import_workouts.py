@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from workout_app.importer import WorkoutImporter, ImportValidationError, IMPORT_FORMATS, BATCH_SIZE
+
+
+class Command(BaseCommand):
+    # Import workouts for a user from a file in one of the formats of the export
+    help = "Import workouts, exercises and sets for a user from a CSV, NDJSON or JSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=IMPORT_FORMATS,
+                            help="Format of the file. Defaults to the extension of the file")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                            help="Number of workouts that are inserted at once")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']} does not exist")
+        import_format = options["format"] or options["path"].rsplit(".", 1)[-1].lower()
+        if import_format not in IMPORT_FORMATS:
+            raise CommandError("Unknown format, use --format")
+
+        try:
+            with open(options["path"], "rb") as file:
+                result = WorkoutImporter(user, batch_size=options["batch_size"]).run(file, import_format)
+        except ImportValidationError as error:
+            raise CommandError(f"The import has been rolled back. {error}")
+        except OSError as error:
+            raise CommandError(str(error))
+
+        self.stdout.write(self.style.SUCCESS(str(result)))
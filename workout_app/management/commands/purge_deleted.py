@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand
+from workout_app import deletion
+
+
+class Command(BaseCommand):
+    # Purge the workouts and users that have been deleted (see workout_app/deletion.py).
+    # Run it from a scheduler (cron, Heroku Scheduler, ...), or keep it running with --every.
+    # A job that fails keeps its error and is tried again on the next run.
+    help = "Delete the rows of deleted workouts and users in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=deletion.BATCH_SIZE, help="Rows per DELETE")
+        parser.add_argument("--every", type=int, default=0,
+                            help="Keep running and look for new jobs every this many seconds")
+
+    def handle(self, *args, **options):
+        while True:
+            for job in deletion.pending_jobs():
+                self.__purge(job, options["batch_size"])
+            if not options["every"]:
+                return
+            time.sleep(options["every"])
+
+    def __purge(self, job, batch_size):
+        started = time.perf_counter()
+        try:
+            deletion.purge(job, batch_size, progress=self.__progress)
+        except Exception as error:
+            deletion.DeletionJob.objects.filter(id=job.id).update(error=repr(error))
+            self.stderr.write(f"{job}: failed: {error!r}")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Purged {job.get_kind_display().lower()} {job.object_id}: {job.deleted_rows} rows "
+            f"in {time.perf_counter() - started:.1f} s"))
+
+    def __progress(self, job):
+        self.stdout.write(f"{job.get_kind_display()} {job.object_id}: {job.deleted_rows} rows deleted")
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from workout_app.models import Workout, WorkoutExercise
+from workout_app import summaries, records
+
+
+class Command(BaseCommand):
+    # Rebuild the materialized WorkoutExerciseSummaries and WorkoutSummaries from the ExerciseSets.
+    # Use it to create the summaries for existing data and to reconcile summaries that have drifted.
+    # The personal records are recomputed as well.
+    help = "Rebuild the workout summaries from the exercise sets"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only rebuild the summaries of this username")
+        parser.add_argument("--batch-size", type=int, default=500,
+                            help="Number of workouts that are rebuilt at once")
+
+    def handle(self, *args, **options):
+        workouts = Workout.objects.order_by("id")
+        if options["user"]:
+            try:
+                user = User.objects.get(username=options["user"])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} does not exist")
+            workouts = workouts.filter(user_id=user.id)
+
+        batch_size = options["batch_size"]
+        batch = []
+        rebuilt = 0
+        for workout_id in workouts.values_list("id", flat=True).iterator(chunk_size=batch_size):
+            batch.append(workout_id)
+            if len(batch) == batch_size:
+                summaries.rebuild_workouts(batch)
+                rebuilt += len(batch)
+                batch = []
+        if batch:
+            summaries.rebuild_workouts(batch)
+            rebuilt += len(batch)
+
+        # Recompute the personal records of every user and exercise in the workouts
+        pairs = WorkoutExercise.objects.filter(workout__in=workouts).values_list(
+            "workout__user_id", "exercise_id").distinct()
+        records.recompute(list(pairs))
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the summaries of {rebuilt} workouts"))
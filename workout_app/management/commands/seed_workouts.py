@@ -0,0 +1,105 @@
+import random
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+from workout_app.models import Workout, Exercise, WorkoutExercise, ExerciseSet
+from workout_app import summaries, records
+
+# The catalogue of every seeded user: (name, type, goal)
+EXERCISES = [
+    ("Squat", 0, 0),
+    ("Bench press", 0, 0),
+    ("Deadlift", 0, 0),
+    ("Pull-ups", 0, 0),
+    ("Overhead press", 0, 0),
+    ("Burpees", 1, 0),
+    ("Push-ups", 1, 0),
+    ("Run", 1, 2),
+    ("Row", 1, 2),
+    ("Bike", 1, 2),
+]
+
+
+class Command(BaseCommand):
+    # Create users with a synthetic training history for benchmarks (see benchmark_views).
+    # The users are called <prefix>0, <prefix>1, ... and all have the given password.
+    # Every user is seeded in a transaction of their own with bulk inserts, so a large run can be
+    # interrupted and continued: the users that already exist are skipped.
+    help = "Seed users with synthetic workouts, exercises and sets"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10, help="Number of users")
+        parser.add_argument("--workouts", type=int, default=50, help="Workouts per user")
+        parser.add_argument("--exercises", type=int, default=6, help="Exercises per workout")
+        parser.add_argument("--sets", type=int, default=5, help="Sets per exercise of a workout")
+        parser.add_argument("--prefix", default="seed", help="Prefix of the usernames")
+        parser.add_argument("--password", default="seed-password", help="Password of the users")
+        parser.add_argument("--random-seed", type=int, default=0, help="Seed of the random values")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows per INSERT")
+
+    def handle(self, *args, **options):
+        if options["exercises"] > len(EXERCISES):
+            raise CommandError(f"At most {len(EXERCISES)} exercises per workout are supported")
+        self.options = options
+        self.random = random.Random(options["random_seed"])
+        # Hashing is slow on purpose, so it is done once for all users
+        password = make_password(options["password"])
+
+        usernames = [f"{options['prefix']}{i}" for i in range(options["users"])]
+        existing = set(User.objects.filter(username__in=usernames).values_list("username", flat=True))
+        created = 0
+        for username in usernames:
+            if username in existing:
+                continue
+            with transaction.atomic():
+                self.__seed_user(User.objects.create(username=username, password=password))
+            created += 1
+            if created % 100 == 0:
+                self.stdout.write(f"Seeded {created} users")
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {created} users, skipped {len(existing)} existing users"))
+
+    def __seed_user(self, user):
+        batch_size = self.options["batch_size"]
+        exercises = Exercise.objects.bulk_create(
+            [Exercise(user=user, name=name, type=type, goal=goal) for name, type, goal in EXERCISES])
+
+        # One workout every other day, the newest one today
+        now = timezone.now()
+        count = self.options["workouts"]
+        workouts = Workout.objects.bulk_create(
+            [Workout(user=user, name=f"Workout {i + 1}", date=now - timedelta(days=2 * (count - 1 - i)))
+             for i in range(count)], batch_size=batch_size)
+
+        workout_exercises = WorkoutExercise.objects.bulk_create(
+            [WorkoutExercise(workout=workout, exercise=exercise, done=True)
+             for workout in workouts
+             for exercise in self.random.sample(exercises, self.options["exercises"])],
+            batch_size=batch_size)
+
+        ExerciseSet.objects.bulk_create(
+            [self.__exercise_set(workout_exercise)
+             for workout_exercise in workout_exercises
+             for i in range(self.options["sets"])],
+            batch_size=batch_size)
+
+        workout_ids = [workout.id for workout in workouts]
+        for start in range(0, len(workout_ids), 500):
+            summaries.rebuild_workouts(workout_ids[start:start + 500])
+        records.recompute([(user.id, exercise.id) for exercise in exercises])
+
+    def __exercise_set(self, workout_exercise):
+        exercise = workout_exercise.exercise
+        if exercise.type == 0:
+            return ExerciseSet(workout_exercise=workout_exercise, reps=self.random.randint(3, 12),
+                               weight=self.random.randrange(20, 150, 5), time=timedelta(0), distance=0)
+        if exercise.goal == 0:
+            return ExerciseSet(workout_exercise=workout_exercise, reps=self.random.randint(10, 50), weight=0,
+                               time=timedelta(seconds=self.random.randint(30, 300)), distance=0)
+        distance = round(self.random.uniform(1, 10), 1)
+        return ExerciseSet(workout_exercise=workout_exercise, reps=0, weight=0,
+                           time=timedelta(seconds=int(distance * self.random.randint(240, 420))),
+                           distance=distance)
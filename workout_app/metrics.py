@@ -0,0 +1,151 @@
+import os
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.template.backends.django import DjangoTemplates, Template
+from prometheus_client import Counter, Histogram, CollectorRegistry, generate_latest, multiprocess
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY
+
+# Metrics in the Prometheus format, exposed by the view Metrics at /metrics.
+# With several worker processes (gunicorn), set the environment variable PROMETHEUS_MULTIPROC_DIR to an
+# empty directory before the workers start. Every process then writes its values to files in it,
+# and /metrics adds up the values of all processes. Clear the directory on every deployment, and call
+# mark_process_dead() from the child_exit hook of gunicorn.
+
+# Label of requests whose URL does not match a view. Every URL name is a label value,
+# so arbitrary paths must not become one
+UNRESOLVED = "<unresolved>"
+
+REQUEST_LATENCY = Histogram(
+    "workout_request_duration_seconds", "Time spent in the view and the middleware", ["view", "method"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+REQUEST_QUERIES = Histogram(
+    "workout_request_db_queries", "Number of database queries per request", ["view"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500))
+REQUEST_DB_TIME = Histogram(
+    "workout_request_db_duration_seconds", "Time spent in database queries per request", ["view"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+TEMPLATE_RENDER_TIME = Histogram(
+    "workout_template_render_seconds", "Time spent rendering a template", ["template"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+# The hit ratio is rate(hits) / rate(all requests) of this counter
+CACHE_REQUESTS = Counter(
+    "workout_cache_requests", "Lookups in the caches of the app", ["cache", "result"])
+
+# Queries and database time of the current request
+_request_stats = ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+def record_query(execute, sql, params, many, context):
+    # Execute wrapper of the database connections (see WorkoutAppConfig.ready).
+    # The stats live in a context variable, so the queries are counted in the threads of async views, too
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - started
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    # Receiver of the signal connection_created
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def record_cache_lookup(cache, hit):
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def view_label(request):
+    resolver_match = getattr(request, "resolver_match", None)
+    if resolver_match is None or not resolver_match.url_name:
+        return UNRESOLVED
+    return resolver_match.url_name
+
+
+def export():
+    # The metrics in the text format of Prometheus and its content type
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    # Remove the files of a worker process that has exited (multi-process mode only)
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
+
+
+class MetricsMiddleware:
+    # Records the latency, the number of queries and the database time of every request per URL name.
+    # Should be the first middleware, so the time of the other middleware is included
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall(request)
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+            self.__observe(request, stats, time.perf_counter() - started)
+
+    async def __acall(self, request):
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+            self.__observe(request, stats, time.perf_counter() - started)
+
+    def __observe(self, request, stats, seconds):
+        view = view_label(request)
+        REQUEST_LATENCY.labels(view=view, method=request.method).observe(seconds)
+        REQUEST_QUERIES.labels(view=view).observe(stats.queries)
+        REQUEST_DB_TIME.labels(view=view).observe(stats.db_time)
+
+
+class InstrumentedTemplate(Template):
+    # Template of the Django backend that records its render time
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            TEMPLATE_RENDER_TIME.labels(template=self.template.origin.template_name or "<string>").observe(
+                time.perf_counter() - started)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    # Template backend (settings.TEMPLATES) that records the render time of every template.
+    # Templates included in another template are part of the time of the outer one
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workout_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkoutSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('exercise_count', models.IntegerField(default=0)),
+                ('set_count', models.IntegerField(default=0)),
+                ('total_volume', models.IntegerField(default=0)),
+                ('total_distance', models.FloatField(default=0)),
+                ('report', models.TextField(blank=True, default='')),
+                ('best_set', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='workout_app.exerciseset')),
+                ('workout', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='workout_app.workout')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WorkoutExerciseSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('set_count', models.IntegerField(default=0)),
+                ('total_volume', models.IntegerField(default=0)),
+                ('total_distance', models.FloatField(default=0)),
+                ('report', models.TextField(blank=True, default='')),
+                ('best_set', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='workout_app.exerciseset')),
+                ('workout_exercise', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='workout_app.workoutexercise')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workout_app', '0002_workout_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workout',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:28
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workout_app', '0003_workout_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='workout',
+            name='date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Converts ExerciseSet.time from text, such as "00:01:30:0", into a duration.
+# The new values are written to a temporary column in batches, then the old column is replaced.
+
+import datetime
+from django.db import migrations
+import workout_app.fields
+
+# Number of sets that are converted at once
+BATCH_SIZE = 2000
+
+
+def parse_time(value):
+    # "hh:mm:ss:d" with optional leading parts. Values that cannot be parsed become NULL
+    parts = (value or "").strip().split(":")
+    if len(parts) > 4 or not all(part.isdigit() for part in parts):
+        return None
+    hours, minutes, seconds, tenths = ([0] * 4 + [int(part) for part in parts])[-4:]
+    return datetime.timedelta(hours=hours, minutes=minutes, seconds=seconds + tenths / 10)
+
+
+def format_time(value):
+    if value is None:
+        return None
+    tenths = int(value.total_seconds() * 10)
+    hours, tenths = divmod(tenths, 36000)
+    minutes, tenths = divmod(tenths, 600)
+    seconds, tenths = divmod(tenths, 10)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}:{tenths}"
+
+
+def convert(apps, source, target, function):
+    # Copy the converted values from one column into the other, one batch of ids at a time
+    ExerciseSet = apps.get_model("workout_app", "ExerciseSet")
+    last_id = 0
+    while True:
+        batch = list(ExerciseSet.objects.filter(id__gt=last_id).order_by("id").only("id", source)[:BATCH_SIZE])
+        if not batch:
+            return
+        for exercise_set in batch:
+            setattr(exercise_set, target, function(getattr(exercise_set, source)))
+        ExerciseSet.objects.bulk_update(batch, [target])
+        last_id = batch[-1].id
+
+
+def text_to_duration(apps, schema_editor):
+    convert(apps, "time", "duration", parse_time)
+
+
+def duration_to_text(apps, schema_editor):
+    convert(apps, "duration", "time", format_time)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workout_app', '0005_personal_records'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exerciseset',
+            name='duration',
+            field=workout_app.fields.TimerDurationField(blank=True, null=True),
+        ),
+        migrations.RunPython(text_to_duration, duration_to_text),
+        migrations.RemoveField(
+            model_name='exerciseset',
+            name='time',
+        ),
+        migrations.RenameField(
+            model_name='exerciseset',
+            old_name='duration',
+            new_name='time',
+        ),
+        migrations.AlterField(
+            model_name='exerciseset',
+            name='time',
+            field=workout_app.fields.TimerDurationField(blank=True, default=datetime.timedelta(0), null=True),
+        ),
+    ]
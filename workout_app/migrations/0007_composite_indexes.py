@@ -0,0 +1,53 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('workout_app', '0006_exercise_set_duration'),
+    ]
+
+    operations = [
+        # The composite indexes are created first, so the foreign keys are never left without an index
+        migrations.AddIndex(
+            model_name='exercise',
+            index=models.Index(fields=['user', '-id'], name='exercise_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exerciseset',
+            index=models.Index(fields=['workout_exercise', 'id'], name='exercise_set_exercise_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workout',
+            index=models.Index(fields=['user', '-date', '-id'], name='workout_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workoutexercise',
+            index=models.Index(fields=['workout', 'id'], name='workout_exercise_workout_idx'),
+        ),
+        migrations.AlterField(
+            model_name='exercise',
+            name='user',
+            field=models.ForeignKey(db_index=False, default=1, on_delete=django.db.models.deletion.CASCADE, related_name='user_exercise', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='exerciseset',
+            name='workout_exercise',
+            field=models.ForeignKey(db_index=False, default=0, on_delete=django.db.models.deletion.CASCADE, related_name='workout_exercise_exercise_set', to='workout_app.workoutexercise'),
+        ),
+        migrations.AlterField(
+            model_name='workout',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='user_workout', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='workoutexercise',
+            name='workout',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='workout_workout_exercise', to='workout_app.workout'),
+        ),
+    ]
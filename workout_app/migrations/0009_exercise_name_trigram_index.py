@@ -0,0 +1,33 @@
+# Trigram index for the search of exercises by name (admin_app.views.ExerciseList).
+# The search uses name__icontains, which PostgreSQL runs as UPPER("name"::text) LIKE UPPER(%s).
+# A GIN index with trigrams on that expression serves LIKE '%term%'. The usernames have the same index
+# (admin_app/migrations/0001_username_trigram_index.py). Other databases scan the table.
+
+from django.db import migrations
+
+INDEX_NAME = "exercise_name_trgm"
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON workout_app_exercise USING gin ((UPPER("name"::text)) gin_trgm_ops)')
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workout_app', '0008_sync_operations'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.2 on 2026-10-18 19:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workout_app', '0009_exercise_name_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workout',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='DeletionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.IntegerField(choices=[(0, 'Workout'), (1, 'User')])),
+                ('object_id', models.BigIntegerField()),
+                ('requested', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('deleted_rows', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['finished', 'id'], name='deletion_job_pending_idx')],
+            },
+        ),
+    ]
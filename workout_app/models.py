@@ -1,25 +1,51 @@
+from datetime import timedelta
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
+from .fields import TimerDurationField
 
 # EXERCISE_TYPE is used in class Exercise
 EXERCISE_TYPE = ((0, "Strength"), (1, "Cardio"))
 # EXERCISE_GOAL is used in class Exercise
 EXERCISE_GOAL = ((0, "Repetitions"), (2, "Distance"))
 
+# The default manager of Workout. Workouts that have been deleted, but not purged yet, are hidden
+# (see deletion.py)
+class WorkoutManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at=None)
+
+
 # A class for a Workout session
 # A Wrokout is comprised of several sets.
 # Each set is for one particular type of exercise
 class Workout(models.Model):    
-    # Relation to the user
+    # Relation to the user. It is indexed by workout_user_date_idx
     user = models.ForeignKey(
-        User, on_delete=models.CASCADE, related_name="user_workout")
+        User, on_delete=models.CASCADE, related_name="user_workout", db_index=False)
     # Name of the session
     name = models.CharField(max_length=200, blank=False)
-    # Date on which the workout took place
-    date = models.DateTimeField(auto_now_add=True)
+    # Date on which the workout took place.
+    # It defaults to the time of creation, yet imported workouts keep their original date
+    date = models.DateTimeField(default=timezone.now)
+    # Incremented on every change of the workout, its exercises or its sets.
+    # Used as part of the key of the cached rows in workout_list.html
+    version = models.PositiveIntegerField(default=0)
+    # Time of the deletion. The workout is hidden until a DeletionJob purges it with its exercises and sets
+    deleted_at = models.DateTimeField(blank=True, null=True)
+
+    # Without the deleted workouts
+    objects = WorkoutManager()
+    # Including the deleted workouts
+    all_objects = models.Manager()
+
     # Meta for ordering the objects in a descending order
     class Meta:
         ordering = ['-date']
+        # The list of workouts filters on the user and pages through date and id
+        indexes = [
+            models.Index(fields=["user", "-date", "-id"], name="workout_user_date_idx"),
+        ]
     # Strinbg representation of the object
     def __str__(self):
         return self.name
@@ -28,9 +54,9 @@ class Workout(models.Model):
 # The WorkoutSet class is related to this class. A WorkoutSet is for a particular
 # type of exercise. For instance, the user wants to do a set of push-ups. 
 class Exercise(models.Model): 
-    # Relation to the user
+    # Relation to the user. It is indexed by exercise_user_id_idx
     user = models.ForeignKey(
-        User, on_delete=models.CASCADE, related_name="user_exercise", default=1)   
+        User, on_delete=models.CASCADE, related_name="user_exercise", default=1, db_index=False)   
     # Name of the exercise
     name = models.CharField(max_length=200, blank=False)
     # Type of exercise. There are only two types: Strength and Cardio which are
@@ -40,6 +66,13 @@ class Exercise(models.Model):
     # If the Exercise if of type Strength then this field will be left blank.
     # There are basicly two types of goal: distance and repetitions.
     goal = models.IntegerField(choices=EXERCISE_GOAL, default=0)
+
+    class Meta:
+        # The list of exercises filters on the user and pages through the id
+        indexes = [
+            models.Index(fields=["user", "-id"], name="exercise_user_id_idx"),
+        ]
+
     # Strinbg representation of the object
     def __str__(self):
         return self.name
@@ -48,13 +81,20 @@ class Exercise(models.Model):
 # Furthermore, ExerciseSets use it to add Sets of an Exercise in a workout
 # In other words, this model is referenced as a ForeingKey by ExerciseSet
 class WorkoutExercise(models.Model):
-    # The relationshop to the owner object of type Workout
+    # The relationshop to the owner object of type Workout. It is indexed by workout_exercise_workout_idx
     workout= models.ForeignKey(
-        Workout, on_delete=models.CASCADE, related_name="workout_workout_exercise")
+        Workout, on_delete=models.CASCADE, related_name="workout_workout_exercise", db_index=False)
     # The relationship to an Exercise object
     exercise = models.ForeignKey(Exercise, on_delete=models.PROTECT, related_name="exercise_workout_exercise")
     # Status of wether or not you're done with the exercise within the given workout
     done = models.BooleanField(default=False)
+
+    class Meta:
+        # The exercises of a workout are loaded in the order of their id
+        indexes = [
+            models.Index(fields=["workout", "id"], name="workout_exercise_workout_idx"),
+        ]
+
     # String representation of the object
     def __str__(self):
         return f"{self.workout.name} : {self.exercise.name}"
@@ -63,15 +103,156 @@ class WorkoutExercise(models.Model):
 # A class for a set. It belongs to (related to) an object of type Workout.
 # Each set must also be related to a particular exercise, such as pull-ups or jogging, etc.
 class ExerciseSet(models.Model):
-    # The relationshop to the owner object of type WorkoutExercise  
-    workout_exercise = models.ForeignKey(WorkoutExercise, on_delete=models.CASCADE, related_name="workout_exercise_exercise_set", default=0)
+    # The relationshop to the owner object of type WorkoutExercise. It is indexed by exercise_set_exercise_idx
+    workout_exercise = models.ForeignKey(WorkoutExercise, on_delete=models.CASCADE, related_name="workout_exercise_exercise_set", default=0, db_index=False)
     # Number of repetitioons in this set
     reps = models.IntegerField(blank=True, null=True, default="0")
     # The weight that was used, if weight lifting is involved
     weight = models.IntegerField(blank=True, null=True, default="0")
-    # The time it took to complete the set, if it is a cardio exercise
-    time = models.CharField(blank=True, null=True, default="00:00:00:0")
+    # The time it took to complete the set, if it is a cardio exercise.
+    # It is entered in the format of the timer, "hh:mm:ss:d", and stored as a duration
+    time = TimerDurationField(blank=True, null=True, default=timedelta(0))
     # The distance covered in the ammount of time specified in the time field
     distance = models.FloatField(blank=True, null=True, default="0")
+
+    class Meta:
+        # The sets of a WorkoutExercise are loaded in the order of their id
+        indexes = [
+            models.Index(fields=["workout_exercise", "id"], name="exercise_set_exercise_idx"),
+        ]
+
     def __str__(self):
         return f"{self.workout_exercise.__str__()}"
+
+
+# Materialized summary of the ExerciseSets of a WorkoutExercise.
+# It is maintained by the functions in summaries.py, whenever a set is added, edited or deleted,
+# so the list of workouts does not have to walk through all of the ExerciseSets.
+class WorkoutExerciseSummary(models.Model):
+    # The relationship to the summarized WorkoutExercise
+    workout_exercise = models.OneToOneField(
+        WorkoutExercise, on_delete=models.CASCADE, related_name="summary")
+    # Number of sets
+    set_count = models.IntegerField(default=0)
+    # Sum of reps x weight over all sets
+    total_volume = models.IntegerField(default=0)
+    # Sum of the distance over all sets
+    total_distance = models.FloatField(default=0)
+    # The best set according to the type and goal of the exercise
+    best_set = models.ForeignKey(
+        ExerciseSet, on_delete=models.SET_NULL, blank=True, null=True, related_name="+")
+    # Pre-rendered report, such as "10 x 20 kg  10 x 25 kg  "
+    report = models.TextField(blank=True, default="")
+    # String representation of the object
+    def __str__(self):
+        return f"{self.workout_exercise_id} : {self.report}"
+
+
+# Materialized summary of a Workout. It is aggregated from the WorkoutExerciseSummaries
+# of the workout.
+class WorkoutSummary(models.Model):
+    # The relationship to the summarized Workout
+    workout = models.OneToOneField(
+        Workout, on_delete=models.CASCADE, related_name="summary")
+    # Number of exercises in the workout
+    exercise_count = models.IntegerField(default=0)
+    # Number of sets
+    set_count = models.IntegerField(default=0)
+    # Sum of reps x weight over all sets
+    total_volume = models.IntegerField(default=0)
+    # Sum of the distance over all sets
+    total_distance = models.FloatField(default=0)
+    # The set with the highest volume in the workout
+    best_set = models.ForeignKey(
+        ExerciseSet, on_delete=models.SET_NULL, blank=True, null=True, related_name="+")
+    # Pre-rendered report, one line per exercise, such as "Squat:10 x 20 kg  "
+    report = models.TextField(blank=True, default="")
+    # String representation of the object
+    def __str__(self):
+        return f"{self.workout_id} : {self.set_count} sets"
+
+
+# RECORD_TYPE is used in class PersonalRecord
+RECORD_TYPE = ((0, "Heaviest weight"), (1, "Most reps"), (2, "Longest distance"), (3, "Fastest time"))
+
+# The best value of a user in an exercise for each type of record.
+# It is maintained by the functions in records.py whenever sets are added or deleted,
+# so finding the personal records does not require scanning all the ExerciseSets.
+class PersonalRecord(models.Model):
+    # Relation to the user
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="user_personal_record")
+    # Relation to the exercise
+    exercise = models.ForeignKey(
+        Exercise, on_delete=models.CASCADE, related_name="exercise_personal_record")
+    # Type of record, as defined in RECORD_TYPE
+    record_type = models.IntegerField(choices=RECORD_TYPE)
+    # The record itself: kg, reps, distance or seconds
+    value = models.FloatField()
+    # The set that holds the record
+    exercise_set = models.ForeignKey(
+        ExerciseSet, on_delete=models.SET_NULL, blank=True, null=True, related_name="exercise_set_personal_record")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "exercise", "record_type"], name="unique_personal_record"),
+        ]
+
+    # String representation of the object
+    def __str__(self):
+        return f"{self.exercise_id} : {self.get_record_type_display()} : {self.value}"
+
+
+# An operation that a client has queued offline and synced later (see sync.py).
+# The key is generated by the client, so a retried operation is recognized and not applied twice.
+class SyncOperation(models.Model):
+    # Relation to the user
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="user_sync_operation")
+    # Idempotency key generated by the client, e.g. a UUID
+    key = models.CharField(max_length=64)
+    # The set that the operation has created
+    exercise_set = models.ForeignKey(
+        ExerciseSet, on_delete=models.SET_NULL, blank=True, null=True, related_name="exercise_set_sync_operation")
+    # When the operation has been applied. Old operations can be purged
+    applied = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="unique_sync_operation"),
+        ]
+
+    # String representation of the object
+    def __str__(self):
+        return f"{self.user_id} : {self.key}"
+
+
+# DELETION_KIND is used in class DeletionJob
+DELETION_KIND = ((0, "Workout"), (1, "User"))
+
+# A deletion that is carried out in the background (see deletion.py). The workout or user is hidden
+# right away, then the purge deletes its rows in batches of bounded size.
+class DeletionJob(models.Model):
+    # Workout or user, as defined in DELETION_KIND
+    kind = models.IntegerField(choices=DELETION_KIND)
+    # Id of the workout or the user. Not a ForeignKey, since the row is deleted by the job
+    object_id = models.BigIntegerField()
+    # When the deletion has been requested
+    requested = models.DateTimeField(auto_now_add=True)
+    # When the purge has started and finished
+    started = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+    # Progress: number of rows deleted so far
+    deleted_rows = models.IntegerField(default=0)
+    # The error of the last attempt, if it has failed
+    error = models.TextField(blank=True, default="")
+
+    class Meta:
+        # The purge picks the pending jobs
+        indexes = [
+            models.Index(fields=["finished", "id"], name="deletion_job_pending_idx"),
+        ]
+
+    # String representation of the object
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.object_id} : {self.deleted_rows} rows"
@@ -0,0 +1,170 @@
+import base64
+import json
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+
+
+class KeysetPage:
+    # A page of a KeysetPaginator. It can be used in templates like a page of django's Paginator,
+    # yet instead of page numbers it provides tokens for the next and the previous page.
+    def __init__(self, object_list, paginator, has_next, has_previous, next_token, previous_token):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_token = next_token
+        self.previous_token = previous_token
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def approximate_total(self):
+        # Total number of objects, or None if the paginator has not been asked for it
+        return self.paginator.approximate_total
+
+
+class KeysetPaginator:
+    # Cursor based pagination. The rows of a page are selected with a WHERE clause on the
+    # ordering columns, e.g. (date, id) < (last date, last id), instead of an OFFSET.
+    # So every page costs the same as the first one and no COUNT(*) is needed.
+    # @parameter : ordering = the fields the queryset is ordered by, such as ("-date", "-id").
+    #              The last one must be unique, so the order is total.
+    # @parameter : with_total = compute approximate_total. On PostgreSQL it is the estimate
+    #              of the query planner, on other databases it is an exact count.
+
+    def __init__(self, queryset, per_page, ordering, with_total=False):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+        self.with_total = with_total
+
+    def get_page(self, after=None, before=None, last=False):
+        # @parameter : after = token of the last object of the previous page
+        # @parameter : before = token of the first object of the following page
+        # @parameter : last = get the last page
+        # Invalid tokens lead to the first page, just like invalid page numbers in django's Paginator.get_page
+        queryset, values, backwards = self.__page_query(after, before, last)
+        return self.__page(list(queryset), values, backwards)
+
+    async def aget_page(self, after=None, before=None, last=False):
+        # Same as get_page, using the async queryset API. The approximate total is computed as well,
+        # so the page can be rendered without further queries
+        queryset, values, backwards = self.__page_query(after, before, last)
+        objects = [obj async for obj in queryset.aiterator()]
+        if self.with_total and not hasattr(self, "_approximate_total"):
+            self._approximate_total = await self.__aapproximate_total()
+        return self.__page(objects, values, backwards)
+
+    @property
+    def approximate_total(self):
+        if not self.with_total:
+            return None
+        if not hasattr(self, "_approximate_total"):
+            self._approximate_total = self.__approximate_total()
+        return self._approximate_total
+
+    def __page_query(self, after, before, last):
+        # The query for a page: one row more than fits on the page tells whether there is another page.
+        # Returns the queryset, the values of the token and whether the page is read backwards
+        try:
+            if after:
+                values = self.decode(after)
+                return self.__query_after(values), values, False
+            if before:
+                values = self.decode(before)
+                return self.__query_before(values), values, True
+        except ValueError:
+            pass
+        if last:
+            return self.__query_before(None), None, True
+        return self.__query_after(None), None, False
+
+    def __query_after(self, values):
+        queryset = self.queryset.order_by(*self.ordering)
+        if values is not None:
+            queryset = queryset.filter(self.__following(values))
+        return queryset[:self.per_page + 1]
+
+    def __query_before(self, values):
+        # Walk backwards using the reversed ordering. The order is restored in __page
+        queryset = self.queryset.order_by(*self.__reversed_ordering())
+        if values is not None:
+            queryset = queryset.filter(self.__following(values, reverse=True))
+        return queryset[:self.per_page + 1]
+
+    def __page(self, objects, values, backwards):
+        more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+        if backwards:
+            objects.reverse()
+            return self.__make_page(objects, has_next=values is not None, has_previous=more)
+        return self.__make_page(objects, has_next=more, has_previous=values is not None)
+
+    def __make_page(self, objects, has_next, has_previous):
+        next_token = self.encode(objects[-1]) if objects and has_next else None
+        previous_token = self.encode(objects[0]) if objects and has_previous else None
+        return KeysetPage(objects, self, has_next, has_previous, next_token, previous_token)
+
+    def __following(self, values, reverse=False):
+        # Condition for the rows that follow the given values in the ordering:
+        # (a > x) OR (a = x AND b > y) OR ...
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip("-")
+            descending = field.startswith("-") != reverse
+            condition |= Q(**equal, **{f"{name}__{'lt' if descending else 'gt'}": value})
+            equal[name] = value
+        return condition
+
+    def __reversed_ordering(self):
+        return [field[1:] if field.startswith("-") else f"-{field}" for field in self.ordering]
+
+    def __approximate_total(self):
+        connection = connections[self.queryset.db]
+        if connection.vendor == "postgresql":
+            plan = json.loads(self.queryset.order_by().explain(format="json"))
+            return int(plan[0]["Plan"]["Plan Rows"])
+        return self.queryset.count()
+
+    async def __aapproximate_total(self):
+        connection = connections[self.queryset.db]
+        if connection.vendor == "postgresql":
+            plan = json.loads(await self.queryset.order_by().aexplain(format="json"))
+            return int(plan[0]["Plan"]["Plan Rows"])
+        return await self.queryset.acount()
+
+    def encode(self, obj):
+        # Opaque token with the values of the ordering fields of an object
+        values = [getattr(obj, field.lstrip("-")) for field in self.ordering]
+        values = [value.isoformat() if hasattr(value, "isoformat") else value for value in values]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+    def decode(self, token):
+        # The values of the ordering fields, converted back by the model fields
+        try:
+            values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        except (TypeError, ValueError):
+            raise ValueError("Invalid token")
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise ValueError("Invalid token")
+        model = self.queryset.model
+        try:
+            return [model._meta.get_field(field.lstrip("-")).to_python(value)
+                    for field, value in zip(self.ordering, values)]
+        except ValidationError:
+            raise ValueError("Invalid token")
@@ -0,0 +1,51 @@
+import re
+from django.db import connection
+
+# Only the tables of this app are audited. The tables of Django and allauth are not ours to index
+AUDITED_TABLE_PREFIX = "workout_app_"
+# A table scan in the plan of SQLite, e.g. "SCAN workout_app_workout" (without "USING INDEX")
+SQLITE_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+# A sequential scan in the plan of PostgreSQL, e.g. "Seq Scan on workout_app_workout  (cost=...)"
+POSTGRESQL_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+def explain(sql, using=connection):
+    # The lines of the query plan of an SQL statement
+    with using.cursor() as cursor:
+        if using.vendor == "postgresql":
+            cursor.execute(f"EXPLAIN {sql}")
+            return [row[0] for row in cursor.fetchall()]
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+        # The last column holds the description of the step
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def sequential_scans(sql, using=connection):
+    # The audited tables that the plan of an SQL statement reads with a sequential scan
+    pattern = POSTGRESQL_SCAN if using.vendor == "postgresql" else SQLITE_SCAN
+    tables = []
+    for line in explain(sql, using):
+        match = pattern.search(line.strip())
+        if match and match.group(1).startswith(AUDITED_TABLE_PREFIX):
+            tables.append(match.group(1))
+    return tables
+
+
+def audit(captured_queries, using=connection):
+    # Check the queries captured by CaptureQueriesContext.
+    # Returns a list of (sql, tables) for every SELECT that scans an audited table
+    problems = []
+    for query in captured_queries:
+        sql = query["sql"]
+        if not sql.lstrip().upper().startswith("SELECT"):
+            continue
+        tables = sequential_scans(sql, using)
+        if tables:
+            problems.append((sql, tables))
+    return problems
+
+
+def analyze(using=connection):
+    # Update the statistics of the query planner, e.g. after seeding a large dataset
+    with using.cursor() as cursor:
+        cursor.execute("ANALYZE")
@@ -0,0 +1,183 @@
+import logging
+import re
+import sys
+import time
+import traceback
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.base import Node
+
+# Detector of repeated queries (N+1), e.g. a loop over objects that reads a ForeignKey of each one.
+# Every query is recorded with a fingerprint (the SQL without its parameters), the lines of our code
+# that caused it and the template line that was rendered. Queries with the same fingerprint that run
+# at least REPEAT_THRESHOLD times in a request are reported.
+# In development: set QUERY_DETECTOR=1 (see settings.py). In tests: QueryBudgetMixin.
+
+logger = logging.getLogger(__name__)
+
+REPEAT_THRESHOLD = 3
+# Number of frames of our code that are kept for a query
+STACK_DEPTH = 5
+# Lists of placeholders, e.g. "IN (%s, %s, %s)", vary in length with the data
+PLACEHOLDER_LIST = re.compile(r"\((?:\s*%s\s*,)*\s*%s\s*\)")
+# Literals in SQL that was written without parameters
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+WHITESPACE = re.compile(r"\s+")
+# Modules whose frames are not shown: the execute wrappers and the middleware
+IGNORED_MODULES = {__name__, "workout_app.metrics", "workout_app.db_routing"}
+
+# The recorder of the current request or test
+_recorder = ContextVar("query_recorder", default=None)
+
+
+def fingerprint(sql):
+    # The shape of a query: the same for every execution of the same line of code
+    sql = PLACEHOLDER_LIST.sub("(...)", sql)
+    sql = STRING_LITERAL.sub("?", sql)
+    sql = NUMBER_LITERAL.sub("?", sql)
+    return WHITESPACE.sub(" ", sql).strip()
+
+
+def _is_own_code(frame):
+    filename = frame.f_code.co_filename
+    return (filename.startswith(str(settings.BASE_DIR)) and "site-packages" not in filename
+            and frame.f_globals.get("__name__") not in IGNORED_MODULES)
+
+
+def _caller():
+    # The innermost frames of our code and the innermost template node on the stack
+    frame = sys._getframe(1)
+    stack = []
+    template = None
+    while frame is not None:
+        if template is None:
+            node = frame.f_locals.get("self")
+            # type() and not isinstance(): a lazy object would be evaluated, which may run a query
+            if issubclass(type(node), Node) and getattr(node, "origin", None) and getattr(node, "token", None):
+                template = f"{node.origin.template_name or node.origin.name}:{node.token.lineno}"
+        if len(stack) < STACK_DEPTH and _is_own_code(frame):
+            stack.append(frame)
+        frame = frame.f_back
+    lines = [f"{summary.filename}:{summary.lineno} in {summary.name}: {summary.line}"
+             for summary in traceback.StackSummary.extract((frame, frame.f_lineno) for frame in stack)]
+    return lines, template
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        stack, template = _caller()
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                "sql": sql,
+                "fingerprint": fingerprint(sql),
+                "time": time.perf_counter() - started,
+                "stack": stack,
+                "template": template,
+            })
+
+    def repeated(self, threshold=REPEAT_THRESHOLD):
+        # The shapes that have been executed at least threshold times, the most frequent first.
+        # Every entry holds the count and the stack and template of the first execution
+        shapes = {}
+        for query in self.queries:
+            shape = shapes.setdefault(query["fingerprint"], {"count": 0, "first": query})
+            shape["count"] += 1
+        repeated = [{"fingerprint": fingerprint, "count": shape["count"], "sql": shape["first"]["sql"],
+                     "stack": shape["first"]["stack"], "template": shape["first"]["template"]}
+                    for fingerprint, shape in shapes.items() if shape["count"] >= threshold]
+        return sorted(repeated, key=lambda shape: -shape["count"])
+
+
+def record_query(execute, sql, params, many, context):
+    # Execute wrapper of the database connections (see WorkoutAppConfig.ready).
+    # Does nothing unless a recorder is active
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    # Receiver of the signal connection_created
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def recording():
+    # Record the queries in the block, including those of async views in other threads
+    recorder = QueryRecorder()
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+def format_report(repeated):
+    lines = []
+    for shape in repeated:
+        lines.append(f"{shape['count']}x {shape['sql']}")
+        if shape["template"]:
+            lines.append(f"    template {shape['template']}")
+        lines.extend(f"    {line}" for line in shape["stack"])
+    return "\n".join(lines)
+
+
+class QueryDetectorMiddleware:
+    # Logs a warning with the stack and the template line for every repeated query shape of a request.
+    # Adds the number of queries in the header X-Query-Count. For development only: the stack of every
+    # query is inspected.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall(request)
+        with recording() as recorder:
+            response = self.get_response(request)
+        return self.__report(request, response, recorder)
+
+    async def __acall(self, request):
+        with recording() as recorder:
+            response = await self.get_response(request)
+        return self.__report(request, response, recorder)
+
+    def __report(self, request, response, recorder):
+        repeated = recorder.repeated(getattr(settings, "QUERY_DETECTOR_THRESHOLD", REPEAT_THRESHOLD))
+        if repeated:
+            logger.warning("Repeated queries in %s %s:\n%s", request.method, request.path, format_report(repeated))
+        response["X-Query-Count"] = str(len(recorder.queries))
+        return response
+
+
+class QueryBudgetMixin:
+    # For TestCases: fail if the code in the block runs more queries than the budget,
+    # or repeats a query shape threshold times (N+1). The message shows where the queries came from.
+    #   with self.assertQueryBudget(10):
+    #       self.client.get(reverse("workout_list"))
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries, threshold=REPEAT_THRESHOLD):
+        with recording() as recorder:
+            yield recorder
+        repeated = recorder.repeated(threshold)
+        if repeated:
+            self.fail(f"Repeated queries (N+1):\n{format_report(repeated)}")
+        if len(recorder.queries) > max_queries:
+            self.fail(f"{len(recorder.queries)} queries, the budget is {max_queries}:\n" +
+                      "\n".join(query["sql"] for query in recorder.queries))
@@ -0,0 +1,162 @@
+from datetime import timedelta
+from django.db import transaction
+from .models import PersonalRecord, ExerciseSet, Exercise, RECORD_TYPE, EXERCISE_GOAL
+from .fragment_cache import bump_workout_versions
+
+# Constants for PersonalRecord.record_type
+HEAVIEST_WEIGHT = 0
+MOST_REPS = 1
+LONGEST_DISTANCE = 2
+FASTEST_TIME = 3
+# Record types, for which a lower value is better
+LOWER_IS_BETTER = {FASTEST_TIME}
+# The field of ExerciseSet for each type of record
+RECORD_FIELDS = {HEAVIEST_WEIGHT: "weight", MOST_REPS: "reps", LONGEST_DISTANCE: "distance", FASTEST_TIME: "time"}
+# Exercise.goal of the exercises with a distance goal. A time over a longer distance is not slower, so their
+# fastest time is the fastest pace: seconds per unit of distance. Sets without a distance set no time record
+DISTANCE_GOAL = EXERCISE_GOAL[1][0]
+
+
+def to_number(value):
+    # Records store durations in seconds
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+def set_values(exercise_set, pace=False):
+    # The values of a set for each type of record. Empty and zero values never set a record
+    # @parameter : pace = True for an exercise with a distance goal, see DISTANCE_GOAL
+    values = {}
+    for record_type, field_name in RECORD_FIELDS.items():
+        field = ExerciseSet._meta.get_field(field_name)
+        value = field.to_python(getattr(exercise_set, field_name))
+        if value:
+            values[record_type] = to_number(value)
+    if pace and FASTEST_TIME in values:
+        if values.get(LONGEST_DISTANCE):
+            values[FASTEST_TIME] /= values[LONGEST_DISTANCE]
+        else:
+            del values[FASTEST_TIME]
+    return values
+
+
+def uses_pace(exercise_id):
+    return Exercise.objects.filter(id=exercise_id, goal=DISTANCE_GOAL).exists()
+
+
+def is_better(record_type, value, record_value):
+    if record_type in LOWER_IS_BETTER:
+        return value < record_value
+    return value > record_value
+
+
+def register_sets(user_id, exercise_id, exercise_sets):
+    # Update the records of a user in an exercise with new sets.
+    # Only the current records are read, the other sets of the user are not scanned.
+    # Returns the labels of the records that have been broken.
+    labels = dict(RECORD_TYPE)
+    with transaction.atomic():
+        records = {record.record_type: record for record in PersonalRecord.objects.select_for_update().filter(
+            user_id=user_id, exercise_id=exercise_id)}
+        changed = {}
+        previous_holders = set()
+        pace = uses_pace(exercise_id)
+        for exercise_set in exercise_sets:
+            for record_type, value in set_values(exercise_set, pace).items():
+                record = records.get(record_type)
+                if record is None:
+                    record = PersonalRecord(user_id=user_id, exercise_id=exercise_id, record_type=record_type)
+                    records[record_type] = record
+                elif is_better(record_type, value, record.value):
+                    previous_holders.add(record.exercise_set_id)
+                else:
+                    continue
+                record.value = value
+                record.exercise_set = exercise_set
+                changed[record_type] = record
+        for record in changed.values():
+            record.save()
+        # The rows of the workouts that lost a record are outdated
+        bump_workout_versions(ExerciseSet.objects.filter(id__in=previous_holders - {None}).values_list(
+            "workout_exercise__workout_id", flat=True))
+    return [labels[record_type] for record_type in sorted(changed)]
+
+
+def records_held_by(exercise_sets):
+    # The (user_id, exercise_id) pairs whose records are held by a QuerySet of ExerciseSets.
+    # Call it before deleting the sets and pass the result to recompute() afterwards.
+    return list(PersonalRecord.objects.filter(exercise_set__in=exercise_sets).values_list(
+        "user_id", "exercise_id").distinct())
+
+
+def recompute(pairs):
+    # Compute the records of the given (user_id, exercise_id) pairs from scratch,
+    # e.g. after a set that held a record has been deleted
+    for user_id, exercise_id in pairs:
+        with transaction.atomic():
+            _recompute(user_id, exercise_id)
+
+
+def _recompute(user_id, exercise_id):
+    # The sets of deleted workouts that have not been purged yet hold no records
+    exercise_sets = ExerciseSet.objects.filter(
+        workout_exercise__workout__user_id=user_id, workout_exercise__exercise_id=exercise_id,
+        workout_exercise__workout__deleted_at=None)
+    pace = uses_pace(exercise_id)
+    records = []
+    for record_type, field_name in RECORD_FIELDS.items():
+        if pace and record_type == FASTEST_TIME:
+            best = _best_pace(exercise_sets)
+        else:
+            best = _best_value(exercise_sets, record_type, field_name)
+        if best:
+            records.append(PersonalRecord(user_id=user_id, exercise_id=exercise_id, record_type=record_type,
+                                          value=best[1], exercise_set_id=best[0]))
+
+    previous = PersonalRecord.objects.filter(user_id=user_id, exercise_id=exercise_id)
+    holders = set(previous.exclude(exercise_set=None).values_list("exercise_set_id", flat=True))
+    previous.delete()
+    PersonalRecord.objects.bulk_create(records)
+    # The rows of the workouts that lost or gained a record are outdated
+    holders |= {record.exercise_set_id for record in records}
+    bump_workout_versions(ExerciseSet.objects.filter(id__in=holders).values_list(
+        "workout_exercise__workout_id", flat=True))
+
+
+def _best_value(exercise_sets, record_type, field_name):
+    # (id, value) of the set with the best value of a field. Empty and zero values never set a record
+    zero = timedelta(0) if field_name == "time" else 0
+    ordering = field_name if record_type in LOWER_IS_BETTER else f"-{field_name}"
+    best = exercise_sets.filter(**{f"{field_name}__gt": zero}).order_by(ordering, "id").values_list(
+        "id", field_name).first()
+    if best is None:
+        return None
+    return best[0], to_number(best[1])
+
+
+def _best_pace(exercise_sets):
+    # (id, seconds per unit of distance) of the set with the fastest pace.
+    # The division of a duration is not portable between the databases, so it is computed here
+    best = None
+    for exercise_set_id, time, distance in exercise_sets.filter(time__gt=timedelta(0), distance__gt=0).order_by(
+            "id").values_list("id", "time", "distance").iterator():
+        pace = to_number(time) / distance
+        if best is None or pace < best[1]:
+            best = (exercise_set_id, pace)
+    return best
+
+
+def record_set_ids(user_id, exercise_id):
+    # Ids of the sets that hold a record of a user in an exercise
+    return set(_record_sets(user_id, exercise_id))
+
+
+async def arecord_set_ids(user_id, exercise_id):
+    # Async version of record_set_ids
+    return {exercise_set_id async for exercise_set_id in _record_sets(user_id, exercise_id).aiterator()}
+
+
+def _record_sets(user_id, exercise_id):
+    return PersonalRecord.objects.filter(user_id=user_id, exercise_id=exercise_id).exclude(
+        exercise_set=None).values_list("exercise_set_id", flat=True)
@@ -0,0 +1,134 @@
+from asgiref.sync import sync_to_async
+from django.db.models import Prefetch, prefetch_related_objects
+from .models import WorkoutExercise, WorkoutExerciseSummary, PersonalRecord
+from . import summaries, catalogue, db_routing
+
+
+# The follwing two reports are used by WorkoutList view
+# They are the items that get displayed when the user navigates to 'Workouts'
+# They are used in the template workout_list.html to enable displaying the name of the workout
+# and providing a link to the workout by using its id.
+# Also, the reports store summaries of each exercise in the workout.
+# And hold the id of WorkoutExercise, which can be used to provide a link to the WorkoutExercise
+# with all of its ExerciseSets
+class WorkoutReport:
+    # A class for storing reports for each workout
+    workout_id = 0
+    # Version of the workout, used for caching the rendered report
+    version = 0
+    # Version of the exercise catalogue the names have been taken from, also part of the cache key
+    catalogue_version = ""
+    date = None
+    name = None
+    exercise_reports = None
+
+    def __init__(self) -> None:
+        self.date = "today"
+        self.name = "workout name"
+        self.exercise_reports = []
+
+
+class ExerciseReport:
+    # A class for storing reports about an exercise in a workout
+    workout_exercise_id = 0
+    report = ""
+    # True if one of the sets holds a personal record
+    has_record = False
+
+
+class ReportBuilder:
+    # Builds WorkoutReports for a page of workouts.
+    # The workouts must already be paginated, so only the visible workouts get loaded.
+    # The reports are read from the materialized WorkoutExerciseSummaries (see summaries.py),
+    # so the ExerciseSets are not loaded at all. A page costs a fixed number of queries, no matter
+    # how many workouts, exercises or sets there are: one for the workouts, one for
+    # the exercises joined with WorkoutExerciseSummary and one for the personal records.
+    # The names of the exercises are taken from the catalogues of the users (see catalogue.py).
+
+    def build(self, workouts):
+        # @parameter : workouts = QuerySet or list of Workout objects (one page)
+        workouts = list(workouts)
+        prefetch_related_objects(workouts, Prefetch("workout_workout_exercise", queryset=self.__workout_exercises()))
+        workout_exercises = {workout.id: list(workout.workout_workout_exercise.all()) for workout in workouts}
+        missing_summaries = self.__rebuild_missing_summaries(workout_exercises)
+        record_holders = set(self.__record_holders(workout_exercises))
+        catalogues = {user_id: catalogue.get_catalogue(user_id, exercise_ids)
+                      for user_id, exercise_ids in self.__exercise_ids(workouts, workout_exercises).items()}
+        return self.__reports(workouts, workout_exercises, missing_summaries, record_holders, catalogues)
+
+    async def abuild(self, workouts):
+        # Same as build, using the async queryset API
+        # @parameter : workouts = list of Workout objects (one page)
+        workout_exercises = {workout.id: [] for workout in workouts}
+        async for workout_exercise in self.__workout_exercises().filter(workout_id__in=list(workout_exercises)):
+            workout_exercises[workout_exercise.workout_id].append(workout_exercise)
+        missing_summaries = {}
+        if self.__missing_summaries(workout_exercises):
+            # Rare: summaries are written in the synchronous code path
+            missing_summaries = await sync_to_async(self.__rebuild_missing_summaries)(workout_exercises)
+        record_holders = {workout_exercise_id async for workout_exercise_id in
+                          self.__record_holders(workout_exercises).aiterator()}
+        catalogues = {user_id: await catalogue.aget_catalogue(user_id, exercise_ids)
+                      for user_id, exercise_ids in self.__exercise_ids(workouts, workout_exercises).items()}
+        return self.__reports(workouts, workout_exercises, missing_summaries, record_holders, catalogues)
+
+    def __reports(self, workouts, workout_exercises, missing_summaries, record_holders, catalogues):
+        reports = []
+        for workout in workouts:
+            report = WorkoutReport()
+            report.workout_id = workout.id
+            report.version = workout.version
+            report.catalogue_version = catalogues[workout.user_id].version
+            report.date = workout.date
+            report.name = workout.name
+
+            catalogue.attach_exercises(workout.user_id, workout_exercises[workout.id], catalogues[workout.user_id])
+            for workout_exercise in workout_exercises[workout.id]:
+                # Create an exercise report for each exercise
+                # and attach it to the workout report
+                summary = summaries.get_summary(workout_exercise) or missing_summaries.get(workout_exercise.id)
+                exercise_report = ExerciseReport()
+                exercise_report.workout_exercise_id = workout_exercise.id
+                exercise_report.report = f"{workout_exercise.exercise.name}:"
+                exercise_report.report += summary.report if summary else ""
+                exercise_report.has_record = workout_exercise.id in record_holders
+                report.exercise_reports.append(exercise_report)
+
+            reports.append(report)
+        return reports
+
+    def __workout_exercises(self):
+        # WorkoutExercises with their summary
+        return WorkoutExercise.objects.select_related("summary").order_by("id")
+
+    def __exercise_ids(self, workouts, workout_exercises):
+        # The ids of the exercises on the page per user. Each of them needs the catalogue of their user
+        exercise_ids = {}
+        for workout in workouts:
+            exercise_ids.setdefault(workout.user_id, set()).update(
+                workout_exercise.exercise_id for workout_exercise in workout_exercises[workout.id])
+        return exercise_ids
+
+    def __missing_summaries(self, workout_exercises):
+        return [workout_exercise.id for exercises in workout_exercises.values()
+                for workout_exercise in exercises if summaries.get_summary(workout_exercise) is None]
+
+    def __rebuild_missing_summaries(self, workout_exercises):
+        # Summaries that have not been created yet, e.g. for data that existed
+        # before the summary tables, get built on the fly.
+        # Run the management command rebuild_summaries to build all of them at once.
+        # The sets are read from the primary and so are the new summaries: the replica may not have them yet
+        missing = self.__missing_summaries(workout_exercises)
+        if not missing:
+            return {}
+        with db_routing.use_replica(False):
+            summaries.rebuild_workout_exercises(missing)
+            return WorkoutExerciseSummary.objects.in_bulk(missing, field_name="workout_exercise_id")
+
+    def __record_holders(self, workout_exercises):
+        # Query for the ids of the WorkoutExercises that have a set holding a personal record
+        workout_exercise_ids = [workout_exercise.id for exercises in workout_exercises.values()
+                                for workout_exercise in exercises]
+        return PersonalRecord.objects.filter(
+            exercise_set__workout_exercise_id__in=workout_exercise_ids).values_list(
+            "exercise_set__workout_exercise_id", flat=True)
@@ -0,0 +1,157 @@
+import time
+from uuid import uuid4
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.signals import user_logged_in
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed, pre_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponseRedirect
+from django.shortcuts import reverse
+from django.urls import resolve, Resolver404
+from .fragment_cache import get_cache
+
+# Resolution of the role of a user: the names of their groups, cached in the session.
+# Users that belong to a group (in this project: admin) have their own area and are redirected there
+# from the views of the users. The groups are loaded at the login and reloaded after the membership
+# has changed: every change gives the user a new version in the cache, and the version in the session
+# no longer matches. The versions are kept in the cache of the workout rows (see fragment_cache.py),
+# which must be shared by the processes (FRAGMENT_CACHE_BACKEND in settings.py), so a change is seen
+# by all of them. In any case the groups are reloaded after ROLE_CACHE_SECONDS, so a change that
+# another process has not seen, e.g. with the default per-process cache, takes effect after that time.
+
+ADMIN = "admin"
+# Key in the session for the cached groups
+SESSION_ROLE_KEY = "role"
+# Seconds after which the groups in the session are reloaded. Can be set with ROLE_CACHE_SECONDS in the settings
+DEFAULT_ROLE_CACHE_SECONDS = 60
+# Views of the user area. Members of a group are redirected to the main page of their group
+USER_AREA_VIEWS = {
+    "home",
+    "workout_list",
+    "add_workout",
+    "edit_workout",
+    "edit_exercise_set",
+    "edit_exercise_list",
+    "exercise_progress",
+}
+
+
+def _version_key(user_id):
+    return f"role-version:{user_id}"
+
+
+def get_version(user_id):
+    # Current version of the membership of a user. A new one is created if the cache has lost it
+    cache = get_cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        cache.add(_version_key(user_id), uuid4().hex, None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def invalidate(user_ids):
+    # The cached groups of the users are reloaded on their next request
+    get_cache().set_many({_version_key(user_id): uuid4().hex for user_id in user_ids}, None)
+
+
+def get_groups(request):
+    # The names of the groups of the logged in user, without loading the user.
+    # Returns an empty list for anonymous users
+    user_id = request.session.get(SESSION_KEY)
+    if user_id is None:
+        return []
+    user_id = int(user_id)
+    version = get_version(user_id)
+    cached = request.session.get(SESSION_ROLE_KEY)
+    max_age = getattr(settings, "ROLE_CACHE_SECONDS", DEFAULT_ROLE_CACHE_SECONDS)
+    if (cached and cached["user_id"] == user_id and cached["version"] == version
+            and time.time() - cached.get("loaded", 0) < max_age):
+        return cached["groups"]
+    return load_groups(request.session, user_id, version)
+
+
+def load_groups(session, user_id, version):
+    # Load the groups from the database and cache them in the session
+    groups = list(Group.objects.filter(user__id=user_id).order_by("id").values_list("name", flat=True))
+    session[SESSION_ROLE_KEY] = {"user_id": user_id, "version": version, "groups": groups, "loaded": time.time()}
+    return groups
+
+
+def main_page(groups):
+    # The URL name of the main page of a member of the groups
+    if groups and groups[0] == ADMIN:
+        return "admin-users"
+    return "home"
+
+
+class RoleMiddleware:
+    # Sets request.groups and redirects members of a group from the user area to their main page.
+    # Must come after SessionMiddleware
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall(request)
+        redirect = self.__resolve(request)
+        if redirect is not None:
+            return redirect
+        return self.get_response(request)
+
+    async def __acall(self, request):
+        # The session is loaded from the database, so the role is resolved in a thread
+        redirect = await sync_to_async(self.__resolve)(request)
+        if redirect is not None:
+            return redirect
+        return await self.get_response(request)
+
+    def __resolve(self, request):
+        request.groups = get_groups(request)
+        if not request.groups:
+            return None
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            return None
+        target = main_page(request.groups)
+        if url_name in USER_AREA_VIEWS and url_name != target:
+            return HttpResponseRedirect(reverse(target))
+        return None
+
+
+@receiver(user_logged_in)
+def logged_in(sender, request, user, **kwargs):
+    # The session is saved at the login anyway, so the groups are loaded along
+    if request is not None and hasattr(request, "session"):
+        load_groups(request.session, user.pk, get_version(user.pk))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        # user.groups.add(group)
+        invalidate([instance.pk])
+    elif action == "pre_clear":
+        # group.user_set.clear()
+        invalidate(instance.user_set.values_list("id", flat=True))
+    else:
+        # group.user_set.add(user)
+        invalidate(pk_set)
+
+
+@receiver(pre_delete, sender=Group)
+@receiver(post_save, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # The name decides the role, so a renamed or deleted group affects all its members
+    if instance.pk is not None:
+        invalidate(instance.user_set.values_list("id", flat=True))
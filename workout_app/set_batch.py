@@ -0,0 +1,86 @@
+from django.db import transaction
+from .models import WorkoutExercise, ExerciseSet
+from .forms import ExerciseSetForm
+from .export import set_to_dict
+from . import summaries, records
+
+# Maximum number of sets in one request
+MAX_SETS = 200
+
+
+class SetBatchError(Exception):
+    # Raised for an invalid batch. errors maps the index of each invalid set to its messages
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or {}
+
+
+def log_sets(user_id, entries):
+    # Validate a batch of sets with the rules of ExerciseSetForm and insert them with one bulk_create.
+    # The summaries and the personal records are updated once per batch, not once per set.
+    # @parameter : entries = list of dicts with workout_exercise, reps, weight, time and distance
+    # Returns the new sets as dicts and the records that have been broken per Exercise
+    if not isinstance(entries, list) or not entries:
+        raise SetBatchError("sets must be a non-empty list")
+    if len(entries) > MAX_SETS:
+        raise SetBatchError(f"At most {MAX_SETS} sets can be logged at once")
+    exercise_sets = clean_sets(user_id, entries)
+    with transaction.atomic():
+        exercise_sets, broken_records = insert_sets(user_id, exercise_sets)
+    return {
+        "sets": [set_to_json(exercise_set) for exercise_set in exercise_sets],
+        "records": broken_records,
+    }
+
+
+def clean_sets(user_id, entries):
+    # Validate the entries and return unsaved ExerciseSets. Raises SetBatchError if any entry is invalid.
+    # The WorkoutExercises must belong to the user. They are loaded with one query
+    errors = {}
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            errors[index] = ["A set must be an object"]
+        elif not is_id(entry.get("workout_exercise")):
+            errors[index] = ["workout_exercise must be an integer"]
+    requested_ids = {entry["workout_exercise"] for index, entry in enumerate(entries) if index not in errors}
+    workout_exercises = WorkoutExercise.objects.filter(
+        id__in=requested_ids, workout__user_id=user_id, workout__deleted_at=None).in_bulk()
+
+    exercise_sets = []
+    for index, entry in enumerate(entries):
+        if index in errors:
+            continue
+        workout_exercise = workout_exercises.get(entry["workout_exercise"])
+        if workout_exercise is None:
+            errors[index] = ["Unknown workout_exercise"]
+            continue
+        form = ExerciseSetForm({field: entry.get(field) for field in ExerciseSetForm.Meta.fields})
+        if not form.is_valid():
+            errors[index] = [f"{field}: {' '.join(messages)}" for field, messages in form.errors.items()]
+            continue
+        exercise_sets.append(ExerciseSet(workout_exercise=workout_exercise, **form.cleaned_data))
+    if errors:
+        raise SetBatchError("Invalid sets", errors)
+    return exercise_sets
+
+
+def is_id(value):
+    # JSON true and false are ints in Python, but not ids
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def insert_sets(user_id, exercise_sets):
+    # Insert cleaned ExerciseSets with one bulk_create and update the summaries and the personal records.
+    # Call it inside a transaction. Returns the saved sets and the broken records per Exercise
+    exercise_sets = ExerciseSet.objects.bulk_create(exercise_sets)
+    summaries.rebuild_workout_exercises({exercise_set.workout_exercise_id for exercise_set in exercise_sets})
+    sets_per_exercise = {}
+    for exercise_set in exercise_sets:
+        sets_per_exercise.setdefault(exercise_set.workout_exercise.exercise_id, []).append(exercise_set)
+    broken_records = {exercise_id: records.register_sets(user_id, exercise_id, sets)
+                      for exercise_id, sets in sets_per_exercise.items()}
+    return exercise_sets, {str(exercise_id): labels for exercise_id, labels in broken_records.items() if labels}
+
+
+def set_to_json(exercise_set):
+    return {"workout_exercise": exercise_set.workout_exercise_id, **set_to_dict(exercise_set)}
@@ -0,0 +1,190 @@
+from django.db import transaction
+from django.db.models import Prefetch
+from .models import Workout, WorkoutExercise, ExerciseSet, WorkoutExerciseSummary, WorkoutSummary
+from .fragment_cache import bump_workout_versions
+from .helpers import format_time
+
+# Constants for exercise.type
+STRENGTH = 0
+CARDIO = 1
+# Constants for exercise.goal
+REPETITIONS = 0
+DISTANCE = 1
+
+# Fields that get overwritten when a summary is rebuilt
+EXERCISE_SUMMARY_FIELDS = ["set_count", "total_volume", "total_distance", "best_set", "report"]
+WORKOUT_SUMMARY_FIELDS = ["exercise_count", "set_count", "total_volume", "total_distance", "best_set", "report"]
+
+
+def generate_report(exercise, exercise_sets):
+    # generate a report according to the type and goal of an exercise
+    if exercise.type == STRENGTH:
+        # Get a summarized report for strength exercises
+        return generate_strength_report(exercise_sets)
+
+    if exercise.goal == REPETITIONS:
+        # Get a summarized report for cardio exercises with repetitions
+        return generate_repetitions_report(exercise_sets)
+    # Get a summarized report for cardio exercises with distance
+    return generate_distance_report(exercise_sets)
+
+
+def generate_strength_report(exercise_sets):
+    # Summarize all the sets in a single report for an exercise for strength
+    report = ""
+    for exercise_set in exercise_sets:
+        report += f"{exercise_set.reps} x {exercise_set.weight} kg  "
+
+    return report
+
+
+def generate_repetitions_report(exercise_sets):
+    # Summarize all the sets in a single report for cardio exercise with repetitions
+    report = ""
+    for exercise_set in exercise_sets:
+        report += f"{exercise_set.reps} in {format_time(exercise_set.time)}     "
+
+    return report
+
+
+def generate_distance_report(exercise_sets):
+    # Summarize all the sets in a single report for an exercise with distance
+    report = ""
+    for exercise_set in exercise_sets:
+        report += f"{exercise_set.distance} in {format_time(exercise_set.time)}   "
+
+    return report
+
+
+def volume(exercise_set):
+    # reps x weight of a set. Empty fields count as zero
+    return (exercise_set.reps or 0) * (exercise_set.weight or 0)
+
+
+def best_set(exercise, exercise_sets):
+    # Pick the best set according to the type and goal of the exercise:
+    # the heaviest one for strength, the most reps or the longest distance for cardio
+    exercise_sets = [exercise_set for exercise_set in exercise_sets if exercise_set is not None]
+    if not exercise_sets:
+        return None
+    if exercise.type == STRENGTH:
+        return max(exercise_sets, key=lambda exercise_set: (exercise_set.weight or 0, exercise_set.reps or 0))
+    if exercise.goal == REPETITIONS:
+        return max(exercise_sets, key=lambda exercise_set: exercise_set.reps or 0)
+    return max(exercise_sets, key=lambda exercise_set: exercise_set.distance or 0)
+
+
+def summarize_workout_exercise(workout_exercise, exercise_sets):
+    # Create an (unsaved) WorkoutExerciseSummary from all the sets of a WorkoutExercise
+    return WorkoutExerciseSummary(
+        workout_exercise=workout_exercise,
+        set_count=len(exercise_sets),
+        total_volume=sum(volume(exercise_set) for exercise_set in exercise_sets),
+        total_distance=sum(exercise_set.distance or 0 for exercise_set in exercise_sets),
+        best_set=best_set(workout_exercise.exercise, exercise_sets),
+        report=generate_report(workout_exercise.exercise, exercise_sets))
+
+
+def summarize_workout(workout_id, workout_exercises):
+    # Create an (unsaved) WorkoutSummary from the summaries of the exercises in a workout
+    summary = WorkoutSummary(workout_id=workout_id, exercise_count=len(workout_exercises))
+    lines = []
+    best_volume = -1
+    for workout_exercise in workout_exercises:
+        exercise_summary = get_summary(workout_exercise)
+        if exercise_summary is None:
+            continue
+        summary.set_count += exercise_summary.set_count
+        summary.total_volume += exercise_summary.total_volume
+        summary.total_distance += exercise_summary.total_distance
+        if exercise_summary.best_set is not None and volume(exercise_summary.best_set) > best_volume:
+            summary.best_set = exercise_summary.best_set
+            best_volume = volume(exercise_summary.best_set)
+        lines.append(f"{workout_exercise.exercise.name}:{exercise_summary.report}")
+    summary.report = "\n".join(lines)
+    return summary
+
+
+def get_summary(workout_exercise):
+    # The summary of a WorkoutExercise, or None if it has not been created yet
+    try:
+        return workout_exercise.summary
+    except WorkoutExerciseSummary.DoesNotExist:
+        return None
+
+
+def set_added(exercise_set):
+    # Update the summaries after a new ExerciseSet has been created.
+    # The totals of the existing summary are incremented, the other sets are not read.
+    # Unsaved defaults of the model are strings, such as "0", so convert them like the database would
+    for field_name in ("reps", "weight", "time", "distance"):
+        field = ExerciseSet._meta.get_field(field_name)
+        setattr(exercise_set, field_name, field.to_python(getattr(exercise_set, field_name)))
+    with transaction.atomic():
+        workout_exercise = WorkoutExercise.objects.select_related("exercise").get(
+            id=exercise_set.workout_exercise_id)
+        summary = WorkoutExerciseSummary.objects.select_for_update().select_related("best_set").filter(
+            workout_exercise_id=workout_exercise.id).first()
+        if summary is None:
+            # There is nothing to increment, so build the summary from scratch
+            rebuild_workout_exercises([workout_exercise.id])
+            return
+        summary.set_count += 1
+        summary.total_volume += volume(exercise_set)
+        summary.total_distance += exercise_set.distance or 0
+        summary.best_set = best_set(workout_exercise.exercise, [summary.best_set, exercise_set])
+        summary.report += generate_report(workout_exercise.exercise, [exercise_set])
+        summary.save()
+        refresh_workout(workout_exercise.workout_id)
+
+
+def refresh_workout(workout_id):
+    # Aggregate the summaries of the exercises of a workout into its WorkoutSummary
+    rebuild_workouts([workout_id], exercises=False)
+
+
+def rebuild_workout_exercises(workout_exercise_ids):
+    # Rebuild the summaries of the given WorkoutExercises from their ExerciseSets,
+    # followed by the summaries of their workouts.
+    # The number of queries does not depend on the number of WorkoutExercises.
+    workout_ids = _rebuild_exercise_summaries(
+        WorkoutExercise.objects.filter(id__in=list(workout_exercise_ids)))
+    rebuild_workouts(workout_ids, exercises=False)
+
+
+def _rebuild_exercise_summaries(workout_exercises):
+    # Rebuild the summaries of a QuerySet of WorkoutExercises and return the ids of their workouts
+    workout_exercises = list(workout_exercises.select_related("exercise").prefetch_related(
+        Prefetch("workout_exercise_exercise_set", queryset=ExerciseSet.objects.order_by("id"))))
+    summaries = [summarize_workout_exercise(workout_exercise, list(workout_exercise.workout_exercise_exercise_set.all()))
+                 for workout_exercise in workout_exercises]
+    WorkoutExerciseSummary.objects.bulk_create(
+        summaries, update_conflicts=True, unique_fields=["workout_exercise"], update_fields=EXERCISE_SUMMARY_FIELDS)
+    return {workout_exercise.workout_id for workout_exercise in workout_exercises}
+
+
+def rebuild_workouts(workout_ids, exercises=True):
+    # Rebuild the summaries of the given workouts and invalidate their cached rows.
+    # If exercises is True, the summaries of all their WorkoutExercises get rebuilt first.
+    workout_ids = list(workout_ids)
+    if exercises:
+        _rebuild_exercise_summaries(WorkoutExercise.objects.filter(workout_id__in=workout_ids))
+    workout_exercises = {workout_id: [] for workout_id in workout_ids}
+    for workout_exercise in WorkoutExercise.objects.filter(workout_id__in=workout_ids).select_related(
+            "exercise", "summary__best_set").order_by("id"):
+        workout_exercises[workout_exercise.workout_id].append(workout_exercise)
+    # Workouts that have been deleted in the meantime are skipped
+    existing = set(Workout.objects.filter(id__in=workout_ids).values_list("id", flat=True))
+    summaries = [summarize_workout(workout_id, workout_exercises[workout_id])
+                 for workout_id in workout_ids if workout_id in existing]
+    WorkoutSummary.objects.bulk_create(
+        summaries, update_conflicts=True, unique_fields=["workout"], update_fields=WORKOUT_SUMMARY_FIELDS)
+    bump_workout_versions(existing)
+
+
+def rebuild_exercise(exercise_id):
+    # Rebuild the summaries of every WorkoutExercise of an Exercise,
+    # e.g. after its name or its type has been changed
+    workout_exercise_ids = WorkoutExercise.objects.filter(
+        exercise_id=exercise_id).values_list("id", flat=True)
+    rebuild_workout_exercises(list(workout_exercise_ids))
@@ -0,0 +1,67 @@
+from django.db import transaction, IntegrityError
+from .models import SyncOperation
+from .set_batch import SetBatchError, clean_sets, insert_sets, set_to_json, MAX_SETS
+
+# Types of operations that can be synced
+ADD_SET = "add_set"
+# Maximum length of an idempotency key
+MAX_KEY_LENGTH = SyncOperation._meta.get_field("key").max_length
+
+
+class SyncConflict(Exception):
+    # Raised if another request is applying the same keys at the same time. The client should retry
+    pass
+
+
+def apply_operations(user_id, operations):
+    # Apply a batch of operations that a client has queued offline, in one transaction.
+    # @parameter : operations = list of {"key": "...", "type": "add_set", "set": {...}}
+    # Operations whose key has been applied before are not applied again, their original result is returned.
+    # Returns {"results": {key: set}, "records": broken records per Exercise}
+    if not isinstance(operations, list) or not operations:
+        raise SetBatchError("operations must be a non-empty list")
+    if len(operations) > MAX_SETS:
+        raise SetBatchError(f"At most {MAX_SETS} operations can be synced at once")
+
+    keys = []
+    errors = {}
+    for index, operation in enumerate(operations):
+        key = operation.get("key") if isinstance(operation, dict) else None
+        if not isinstance(key, str) or not key or len(key) > MAX_KEY_LENGTH:
+            errors[index] = ["Invalid key"]
+        elif key in keys:
+            errors[index] = ["Duplicate key"]
+        elif operation.get("type") != ADD_SET:
+            errors[index] = ["Unknown type"]
+        keys.append(key)
+    if errors:
+        raise SetBatchError("Invalid operations", errors)
+
+    applied = {operation.key: operation.exercise_set for operation in SyncOperation.objects.filter(
+        user_id=user_id, key__in=keys).select_related("exercise_set")}
+    pending = [(index, operation) for index, operation in enumerate(operations) if operation["key"] not in applied]
+
+    broken_records = {}
+    if pending:
+        try:
+            exercise_sets = clean_sets(user_id, [operation.get("set") for index, operation in pending])
+        except SetBatchError as error:
+            # Report the errors by the index of the operation, not by the index among the pending ones
+            raise SetBatchError(str(error), {pending[index][0]: messages for index, messages in error.errors.items()})
+        try:
+            with transaction.atomic():
+                exercise_sets, broken_records = insert_sets(user_id, exercise_sets)
+                # The unique index on (user, key) rejects keys that a concurrent request has just applied
+                SyncOperation.objects.bulk_create([
+                    SyncOperation(user_id=user_id, key=operation["key"], exercise_set=exercise_set)
+                    for (index, operation), exercise_set in zip(pending, exercise_sets)])
+        except IntegrityError:
+            raise SyncConflict("The operations are being applied by another request")
+        for (index, operation), exercise_set in zip(pending, exercise_sets):
+            applied[operation["key"]] = exercise_set
+
+    return {
+        # The set of an operation is None, if it has been deleted after it was synced
+        "results": {key: set_to_json(exercise_set) if exercise_set else None for key, exercise_set in applied.items()},
+        "records": broken_records,
+    }
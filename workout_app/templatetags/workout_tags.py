@@ -0,0 +1,44 @@
+from django import template
+from .. import fragment_cache
+from ..helpers import format_time
+
+register = template.Library()
+
+
+class WorkoutRowCacheNode(template.Node):
+    # Renders its content once per version of a workout and serves it from the cache afterwards
+
+    def __init__(self, nodelist, report):
+        self.nodelist = nodelist
+        self.report = report
+
+    def render(self, context):
+        report = self.report.resolve(context)
+        key = fragment_cache.workout_row_key(report.workout_id, report.version, report.catalogue_version)
+        cache = fragment_cache.get_cache()
+        content = cache.get(key)
+        if content is not None:
+            fragment_cache.record(hit=True)
+            return content
+        fragment_cache.record(hit=False)
+        content = self.nodelist.render(context)
+        cache.set(key, content)
+        return content
+
+
+@register.tag("cache_workout_row")
+def do_cache_workout_row(parser, token):
+    # Usage: {% cache_workout_row report %} ... {% endcache_workout_row %}
+    # report must have the attributes workout_id, version and catalogue_version
+    bits = token.split_contents()
+    if len(bits) != 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires exactly one argument")
+    nodelist = parser.parse(("endcache_workout_row",))
+    parser.delete_first_token()
+    return WorkoutRowCacheNode(nodelist, parser.compile_filter(bits[1]))
+
+
+@register.filter
+def timer(value):
+    # Format a duration like the timer does, e.g. {{ exercise_set.time|timer }} renders "00:01:30:0"
+    return format_time(value)
@@ -1,3 +1,1105 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+from asgiref.sync import sync_to_async
+from django.test import TestCase, TransactionTestCase, AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command, CommandError
+from django.template import engines
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection, connections
+from django.contrib.auth.models import User, Group
+from django.shortcuts import reverse
+from .models import (Workout, Exercise, WorkoutExercise, ExerciseSet, WorkoutExerciseSummary, WorkoutSummary,
+                     PersonalRecord, DeletionJob)
+from . import (summaries, fragment_cache, analytics, records, query_audit, db_routing, metrics, query_detector, roles,
+               deletion, catalogue, helpers)
+from .importer import WorkoutImporter, ImportValidationError
+from .cloning import clone_workout
+from .forms import ExerciseSetForm, WorkoutExerciseForm
 
-# Create your tests here.
+
+def create_workouts(user, exercises, count, sets_per_exercise=3):
+    # Create a number of workouts, each of them using all the given exercises
+    workout_ids = []
+    for i in range(count):
+        workout = Workout.objects.create(user=user, name=f"Workout {i}")
+        for exercise in exercises:
+            workout_exercise = WorkoutExercise.objects.create(
+                workout=workout, exercise=exercise)
+            for j in range(sets_per_exercise):
+                ExerciseSet.objects.create(
+                    workout_exercise=workout_exercise, reps=10, weight=20 + j, time="00:01:30:0", distance=1.5)
+        workout_ids.append(workout.id)
+    summaries.rebuild_workouts(workout_ids)
+
+
+class WorkoutListTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="athlete", password="secret")
+        self.exercises = [
+            Exercise.objects.create(user=self.user, name="Squat", type=0),
+            Exercise.objects.create(user=self.user, name="Burpees", type=1, goal=0),
+            Exercise.objects.create(user=self.user, name="Run", type=1, goal=2),
+        ]
+        self.client.force_login(self.user)
+
+    def count_queries(self, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("workout_list"), params)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_reports(self):
+        create_workouts(self.user, self.exercises, 1, sets_per_exercise=2)
+        response = self.client.get(reverse("workout_list"))
+        reports = list(response.context["page_obj"])
+        self.assertEqual(len(reports), 1)
+        self.assertEqual([exercise_report.report for exercise_report in reports[0].exercise_reports], [
+            "Squat:10 x 20 kg  10 x 21 kg  ",
+            "Burpees:10 in 00:01:30:0     10 in 00:01:30:0     ",
+            "Run:1.5 in 00:01:30:0   1.5 in 00:01:30:0   ",
+        ])
+
+    def test_query_count_stays_flat(self):
+        # The number of queries must not depend on the size of the history
+        create_workouts(self.user, self.exercises, 2)
+        # The first request loads the exercise catalogue into the cache
+        self.count_queries()
+        small_history = self.count_queries()
+        create_workouts(self.user, self.exercises, 40)
+        large_history = self.count_queries()
+        deep_page = self.count_queries(last="")
+        self.assertEqual(small_history, large_history)
+        self.assertEqual(large_history, deep_page)
+
+    def test_keyset_pagination(self):
+        # Walk through all pages forwards and backwards
+        create_workouts(self.user, self.exercises[:1], 5, sets_per_exercise=0)
+        expected = list(Workout.objects.order_by("-date", "-id").values_list("id", flat=True))
+        seen = []
+        params = {}
+        while True:
+            page_obj = self.client.get(reverse("workout_list"), params).context["page_obj"]
+            seen += [report.workout_id for report in page_obj]
+            if not page_obj.has_next():
+                break
+            params = {"after": page_obj.next_token}
+        self.assertEqual(seen, expected)
+        self.assertEqual(page_obj.approximate_total, 5)
+        page_obj = self.client.get(reverse("workout_list"), {"before": page_obj.previous_token}).context["page_obj"]
+        self.assertEqual([report.workout_id for report in page_obj], expected[2:4])
+
+
+class SummaryTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="athlete", password="secret")
+        self.exercise = Exercise.objects.create(user=self.user, name="Squat", type=0)
+        create_workouts(self.user, [self.exercise], 1, sets_per_exercise=2)
+        self.workout_exercise = WorkoutExercise.objects.get()
+        self.client.force_login(self.user)
+
+    def test_set_added_through_view(self):
+        self.client.post(reverse("edit_exercise_set", kwargs={"workout_exercise_id": self.workout_exercise.id}), {
+            "workout_exercise-exercise": self.exercise.id,
+            "exercise_set-reps": 5, "exercise_set-weight": 100,
+            "exercise_set-time": "00:00:00:0", "exercise_set-distance": 0,
+        })
+        summary = WorkoutExerciseSummary.objects.get(workout_exercise=self.workout_exercise)
+        self.assertEqual(summary.set_count, 3)
+        self.assertEqual(summary.total_volume, 10 * 20 + 10 * 21 + 5 * 100)
+        self.assertEqual(summary.best_set.weight, 100)
+        self.assertEqual(summary.report, "10 x 20 kg  10 x 21 kg  5 x 100 kg  ")
+        self.assertEqual(WorkoutSummary.objects.get().set_count, 3)
+
+    def test_set_deleted_through_view(self):
+        exercise_set = ExerciseSet.objects.order_by("id").last()
+        self.client.get(reverse("delete_exercise_set", kwargs={
+            "workout_exercise_id": self.workout_exercise.id, "exercise_set_id": exercise_set.id}))
+        summary = WorkoutExerciseSummary.objects.get(workout_exercise=self.workout_exercise)
+        self.assertEqual(summary.set_count, 1)
+        self.assertEqual(summary.report, "10 x 20 kg  ")
+        self.assertEqual(WorkoutSummary.objects.get().report, "Squat:10 x 20 kg  ")
+
+
+class WorkoutRowCacheTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="athlete", password="secret")
+        self.exercise = Exercise.objects.create(user=self.user, name="Squat", type=0)
+        create_workouts(self.user, [self.exercise], 1, sets_per_exercise=1)
+        self.client.force_login(self.user)
+        fragment_cache.get_cache().clear()
+        fragment_cache.reset_stats()
+
+    def test_row_is_cached_until_the_workout_changes(self):
+        self.client.get(reverse("workout_list"))
+        self.client.get(reverse("workout_list"))
+        self.assertEqual(fragment_cache.get_stats()["hits"], 1)
+        workout_exercise = WorkoutExercise.objects.get()
+        self.client.get(reverse("add_exercise_set", kwargs={
+            "workout_exercise_id": workout_exercise.id, "workout_id": workout_exercise.workout_id}))
+        response = self.client.get(reverse("workout_list"))
+        self.assertEqual(fragment_cache.get_stats()["misses"], 2)
+        self.assertContains(response, "Squat:10 x 20 kg  0 x 0 kg  ")
+
+
+class ExportTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="athlete", password="secret")
+        self.exercise = Exercise.objects.create(user=self.user, name="Squat", type=0)
+        create_workouts(self.user, [self.exercise], 3, sets_per_exercise=2)
+        self.client.force_login(self.user)
+
+    def export(self, **params):
+        response = self.client.get(reverse("export_workouts"), params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content)
+
+    def test_csv(self):
+        lines = self.export(format="csv").decode().splitlines()
+        self.assertEqual(len(lines), 1 + 3 * 2)
+        self.assertTrue(lines[1].endswith(",Squat,Strength,Repetitions,False,1,10,20,00:01:30:0,1.5"))
+
+    def test_gzipped_json(self):
+        workouts = json.loads(gzip.decompress(self.export(format="json", gzip="1")))
+        self.assertEqual(len(workouts), 3)
+        self.assertEqual(len(workouts[0]["exercises"][0]["sets"]), 2)
+
+    def test_date_range(self):
+        lines = self.export(format="ndjson", end="2000-01-01").decode().splitlines()
+        self.assertEqual(lines, [])
+        self.assertEqual(self.client.get(reverse("export_workouts"), {"start": "yesterday"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("export_workouts"), {"end": "2023-02-30"}).status_code, 400)
+
+    def test_command_parses_dates_like_the_view(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "workouts.ndjson")
+            call_command("export_workouts", "athlete", "--format", "ndjson", "--end", "2000-01-01", "--output", output)
+            with open(output) as file:
+                self.assertEqual(file.read(), "")
+        for value in ("yesterday", "2023-02-30"):
+            with self.assertRaisesMessage(CommandError, f"Invalid date: {value}"):
+                call_command("export_workouts", "athlete", "--start", value)
+
+
+class ImportTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="athlete", password="secret")
+        self.exercise = Exercise.objects.create(user=self.user, name="Squat", type=0)
+        create_workouts(self.user, [self.exercise], 3, sets_per_exercise=2)
+        self.other = User.objects.create_user(username="other", password="secret")
+        self.client.force_login(self.user)
+
+    def round_trip(self, export_format):
+        content = b"".join(self.client.get(reverse("export_workouts"), {"format": export_format}).streaming_content)
+        result = WorkoutImporter(self.other, batch_size=2).run(BytesIO(content), export_format)
+        self.assertEqual((result.workouts, result.sets), (3, 6))
+        self.assertEqual(Exercise.objects.filter(user=self.other).count(), 1)
+        self.assertEqual(ExerciseSet.objects.filter(workout_exercise__workout__user=self.other).count(), 6)
+        self.assertEqual(
+            list(Workout.objects.filter(user=self.other).values_list("date", flat=True)),
+            list(Workout.objects.filter(user=self.user).values_list("date", flat=True)))
+        self.assertEqual(WorkoutSummary.objects.filter(workout__user=self.other).count(), 3)
+
+    def test_csv(self):
+        self.round_trip("csv")
+
+    def test_json(self):
+        self.round_trip("json")
+
+    def test_ndjson(self):
+        self.round_trip("ndjson")
+
+    def test_invalid_record_rolls_back(self):
+        content = json.dumps([
+            {"name": "Good", "date": "2023-06-01T10:00:00", "exercises": [{"exercise": "Row", "sets": [{"reps": 5}]}]},
+            {"name": "Bad", "date": "2023-06-02T10:00:00", "exercises": [{"exercise": "Row", "sets": [{"reps": "many"}]}]},
+        ]).encode()
+        with self.assertRaises(ImportValidationError):
+            WorkoutImporter(self.other, batch_size=1).run(BytesIO(content), "json")
+        self.assertFalse(Workout.objects.filter(user=self.other).exists())
+        self.assertFalse(Exercise.objects.filter(user=self.other).exists())
+
+
+class ProgressTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="athlete", password="secret")
+        self.squat = Exercise.objects.create(user=self.user, name="Squat", type=0)
+        self.run = Exercise.objects.create(user=self.user, name="Run", type=1, goal=2)
+        create_workouts(self.user, [self.squat, self.run], 2, sets_per_exercise=2)
+        self.client.force_login(self.user)
+
+    def test_strength(self):
+        progress = analytics.compute_progress(self.user.id, self.squat)
+        self.assertEqual([session["value"] for session in progress["sessions"]], [28.0, 28.0])
+        self.assertEqual(progress["weekly_volume"][0]["volume"], 2 * (10 * 20 + 10 * 21))
+        self.assertEqual(progress["set_count"], 4)
+
+    def test_cardio_pace(self):
+        progress = analytics.compute_progress(self.user.id, self.run)
+        self.assertEqual([session["value"] for session in progress["sessions"]], [60.0, 60.0])
+
+    def test_cardio_totals_in_sql(self):
+        ExerciseSet.objects.filter(id=ExerciseSet.objects.filter(
+            workout_exercise__exercise=self.run).order_by("id").first().id).update(time=timedelta(seconds=60))
+        totals = analytics.cardio_totals(self.user.id, self.run)
+        self.assertEqual(totals["total_time"], timedelta(seconds=3 * 90 + 60))
+        self.assertEqual(totals["average_pace"], timedelta(seconds=(3 * 90 + 60) / 6))
+        self.assertEqual(totals["fastest_set"]["time"], timedelta(seconds=60))
+
+    def test_page_is_cached_by_data_version(self):
+        version = analytics.user_data_version(self.user.id)
+        response = self.client.get(reverse("exercise_progress", kwargs={"exercise_id": self.squat.id}))
+        self.assertEqual(response.status_code, 200)
+        summaries.rebuild_workouts(Workout.objects.values_list("id", flat=True))
+        self.assertNotEqual(analytics.user_data_version(self.user.id), version)
+
+
+class PersonalRecordTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="athlete", password="secret")
+        self.exercise = Exercise.objects.create(user=self.user, name="Squat", type=0)
+        create_workouts(self.user, [self.exercise], 1, sets_per_exercise=2)
+        records.recompute([(self.user.id, self.exercise.id)])
+        self.workout_exercise = WorkoutExercise.objects.get()
+        self.client.force_login(self.user)
+
+    def record(self, record_type):
+        return PersonalRecord.objects.get(user=self.user, exercise=self.exercise, record_type=record_type)
+
+    def test_recompute(self):
+        self.assertEqual(self.record(records.HEAVIEST_WEIGHT).value, 21)
+        self.assertEqual(self.record(records.MOST_REPS).value, 10)
+        self.assertEqual(self.record(records.FASTEST_TIME).value, 90)
+
+    def test_record_broken_and_restored(self):
+        self.client.post(reverse("edit_exercise_set", kwargs={"workout_exercise_id": self.workout_exercise.id}), {
+            "workout_exercise-exercise": self.exercise.id,
+            "exercise_set-reps": 5, "exercise_set-weight": 100,
+            "exercise_set-time": "00:00:00:0", "exercise_set-distance": 0,
+        })
+        exercise_set = ExerciseSet.objects.order_by("id").last()
+        self.assertEqual(self.record(records.HEAVIEST_WEIGHT).exercise_set, exercise_set)
+        self.assertEqual(self.record(records.MOST_REPS).value, 10)
+        response = self.client.get(reverse("workout_list"))
+        self.assertTrue(list(response.context["page_obj"])[0].exercise_reports[0].has_record)
+
+        # Deleting the set that holds the record brings back the previous one
+        self.client.get(reverse("delete_exercise_set", kwargs={
+            "workout_exercise_id": self.workout_exercise.id, "exercise_set_id": exercise_set.id}))
+        self.assertEqual(self.record(records.HEAVIEST_WEIGHT).value, 21)
+
+    def cardio_sets(self, goal):
+        # A long run at a good pace and a short run at a slow pace that takes less time
+        exercise = Exercise.objects.create(user=self.user, name="Run", type=1, goal=goal)
+        workout = Workout.objects.create(user=self.user, name="Runs")
+        workout_exercise = WorkoutExercise.objects.create(workout=workout, exercise=exercise)
+        long_run = ExerciseSet.objects.create(workout_exercise=workout_exercise, time=timedelta(minutes=10),
+                                              distance=5)
+        short_run = ExerciseSet.objects.create(workout_exercise=workout_exercise, time=timedelta(minutes=8),
+                                               distance=2)
+        return exercise, long_run, short_run
+
+    def fastest(self, exercise):
+        record = PersonalRecord.objects.get(exercise=exercise, record_type=records.FASTEST_TIME)
+        return record.exercise_set, record.value
+
+    def test_fastest_pace_for_distance_goal(self):
+        exercise, long_run, short_run = self.cardio_sets(goal=2)
+        records.register_sets(self.user.id, exercise.id, [short_run, long_run])
+        self.assertEqual(self.fastest(exercise), (long_run, 120))
+        records.recompute([(self.user.id, exercise.id)])
+        self.assertEqual(self.fastest(exercise), (long_run, 120))
+
+    def test_fastest_time_for_repetition_goal(self):
+        exercise, long_run, short_run = self.cardio_sets(goal=0)
+        records.register_sets(self.user.id, exercise.id, [long_run, short_run])
+        self.assertEqual(self.fastest(exercise), (short_run, 480))
+        records.recompute([(self.user.id, exercise.id)])
+        self.assertEqual(self.fastest(exercise), (short_run, 480))
+
+
+class TimeFieldTest(TestCase):
+
+    def test_timer_format_is_stored_as_duration(self):
+        form = ExerciseSetForm({"reps": 1, "weight": 0, "time": "01:02:03:4", "distance": 0})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data["time"], timedelta(hours=1, minutes=2, seconds=3.4))
+        # The form shows the time in the format of the timer again
+        self.assertIn('value="01:02:03:4"', str(ExerciseSetForm(initial=form.cleaned_data)["time"]))
+
+    def test_invalid_time(self):
+        form = ExerciseSetForm({"reps": 1, "weight": 0, "time": "1:xx", "distance": 0})
+        self.assertFalse(form.is_valid())
+        self.assertIn("time", form.errors)
+
+
+class IndexAuditTest(TestCase):
+    # Runs EXPLAIN on the queries of the views against a large dataset
+    # and fails if any of them reads a table of this app with a sequential scan
+    users = 20
+    workouts_per_user = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create([User(username=f"athlete{i}") for i in range(cls.users)])
+        exercises = Exercise.objects.bulk_create([
+            Exercise(user=user, name=name, type=exercise_type, goal=goal)
+            for user in users for name, exercise_type, goal in (("Squat", 0, 0), ("Run", 1, 2))])
+        workouts = Workout.objects.bulk_create([
+            Workout(user=user, name=f"Workout {i}") for user in users for i in range(cls.workouts_per_user)])
+        exercises_per_user = {}
+        for exercise in exercises:
+            exercises_per_user.setdefault(exercise.user_id, []).append(exercise)
+        workout_exercises = WorkoutExercise.objects.bulk_create([
+            WorkoutExercise(workout=workout, exercise=exercise)
+            for workout in workouts for exercise in exercises_per_user[workout.user_id]])
+        ExerciseSet.objects.bulk_create([
+            ExerciseSet(workout_exercise=workout_exercise, reps=10, weight=20 + i, time=timedelta(seconds=90),
+                        distance=1.5)
+            for workout_exercise in workout_exercises for i in range(3)])
+        summaries.rebuild_workouts([workout.id for workout in workouts])
+        records.recompute({(exercise.user_id, exercise.id) for exercise in exercises})
+        query_audit.analyze()
+        cls.user = users[0]
+        cls.exercises = exercises_per_user[cls.user.id]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def assert_no_sequential_scans(self, url, params=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params or {})
+            if response.streaming:
+                # The queries of a streaming response run while it is consumed
+                b"".join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        problems = query_audit.audit(context.captured_queries)
+        self.assertEqual(problems, [], f"Sequential scans in {url}")
+
+    def test_harness_detects_sequential_scans(self):
+        with CaptureQueriesContext(connection) as context:
+            list(Workout.objects.filter(name="Workout 1"))
+        self.assertEqual(query_audit.audit(context.captured_queries)[0][1], ["workout_app_workout"])
+
+    def test_workout_list(self):
+        self.assert_no_sequential_scans(reverse("workout_list"))
+        response = self.client.get(reverse("workout_list"))
+        self.assert_no_sequential_scans(reverse("workout_list"), {"after": response.context["page_obj"].next_token})
+
+    def test_exercise_list(self):
+        self.assert_no_sequential_scans(reverse("edit_exercise_list"))
+
+    def test_edit_exercise_set(self):
+        workout_exercise = WorkoutExercise.objects.filter(workout__user=self.user).first()
+        self.assert_no_sequential_scans(
+            reverse("edit_exercise_set", kwargs={"workout_exercise_id": workout_exercise.id}))
+
+    def test_exercise_progress(self):
+        for exercise in self.exercises:
+            self.assert_no_sequential_scans(reverse("exercise_progress", kwargs={"exercise_id": exercise.id}))
+
+    def test_export(self):
+        self.assert_no_sequential_scans(reverse("export_workouts"), {"format": "ndjson"})
+
+
+class LogExerciseSetsTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="athlete", password="secret")
+        self.squat = Exercise.objects.create(user=self.user, name="Squat", type=0)
+        self.run = Exercise.objects.create(user=self.user, name="Run", type=1, goal=2)
+        create_workouts(self.user, [self.squat, self.run], 1, sets_per_exercise=0)
+        self.squat_entry, self.run_entry = WorkoutExercise.objects.order_by("id")
+        self.client.force_login(self.user)
+
+    def log(self, sets):
+        return self.client.post(reverse("log_exercise_sets"), json.dumps({"sets": sets}),
+                                content_type="application/json")
+
+    def test_sets_are_created_in_one_batch(self):
+        sets = [{"workout_exercise": self.squat_entry.id, "reps": 5, "weight": 100 + i} for i in range(10)]
+        sets.append({"workout_exercise": self.run_entry.id, "time": "00:05:00:0", "distance": 1})
+        with CaptureQueriesContext(connection) as context:
+            response = self.log(sets)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()["sets"]), 11)
+        self.assertEqual(response.json()["sets"][-1]["time"], "00:05:00:0")
+        self.assertEqual(ExerciseSet.objects.count(), 11)
+        self.assertEqual(WorkoutSummary.objects.get().set_count, 11)
+        self.assertEqual(self.squat_entry.summary.best_set.weight, 109)
+        # One INSERT for all the sets
+        inserts = [query for query in context.captured_queries
+                   if query["sql"].startswith('INSERT INTO "workout_app_exerciseset"')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_invalid_set_saves_nothing(self):
+        response = self.log([{"workout_exercise": self.squat_entry.id, "reps": 5},
+                             {"workout_exercise": self.squat_entry.id, "reps": "many"}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("1", response.json()["errors"])
+        self.assertFalse(ExerciseSet.objects.exists())
+
+    def test_invalid_workout_exercise_ids(self):
+        response = self.log([{"workout_exercise": [self.squat_entry.id], "reps": 5},
+                             {"workout_exercise": True, "reps": 5},
+                             {"workout_exercise": {"id": self.squat_entry.id}, "reps": 5},
+                             {"workout_exercise": self.squat_entry.id, "reps": 5}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(sorted(response.json()["errors"]), ["0", "1", "2"])
+        self.assertEqual(response.json()["errors"]["1"], ["workout_exercise must be an integer"])
+        self.assertFalse(ExerciseSet.objects.exists())
+
+    def test_sets_of_other_users_are_rejected(self):
+        other = User.objects.create_user(username="other", password="secret")
+        self.client.force_login(other)
+        response = self.log([{"workout_exercise": self.squat_entry.id, "reps": 5}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ExerciseSet.objects.exists())
+
+
+class CloneWorkoutTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="athlete", password="secret")
+        self.exercises = [Exercise.objects.create(user=self.user, name=f"Exercise {i}", type=0) for i in range(2)]
+        self.client.force_login(self.user)
+
+    def clone(self, workout, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("clone_workout", kwargs={"workout_id": workout.id}), params)
+        self.assertEqual(response.status_code, 302)
+        return len(context.captured_queries)
+
+    def test_clone_with_sets(self):
+        create_workouts(self.user, self.exercises, 1, sets_per_exercise=3)
+        source = Workout.objects.get()
+        workout = clone_workout(source.id, self.user.id, with_sets=True)
+        self.assertEqual(workout.name, source.name)
+        self.assertEqual(workout.workout_workout_exercise.count(), 2)
+        self.assertEqual(ExerciseSet.objects.filter(workout_exercise__workout=workout).count(), 6)
+        self.assertEqual(workout.summary.set_count, 6)
+
+    def test_view_clones_without_sets(self):
+        create_workouts(self.user, self.exercises, 1, sets_per_exercise=3)
+        records.recompute([(self.user.id, exercise.id) for exercise in self.exercises])
+        source = Workout.objects.get()
+        self.clone(source, sets=1)
+        workout = Workout.objects.exclude(id=source.id).get()
+        self.assertEqual(workout.workout_workout_exercise.count(), 2)
+        self.assertFalse(ExerciseSet.objects.filter(workout_exercise__workout=workout).exists())
+        self.assertEqual(workout.summary.set_count, 0)
+        self.assertFalse(PersonalRecord.objects.filter(exercise_set__workout_exercise__workout=workout).exists())
+
+    def test_query_count_is_constant(self):
+        create_workouts(self.user, self.exercises[:1], 1, sets_per_exercise=1)
+        create_workouts(self.user, self.exercises * 5, 1, sets_per_exercise=5)
+        small, large = Workout.objects.order_by("id")
+        self.assertEqual(self.clone(small), self.clone(large))
+        with CaptureQueriesContext(connection) as small_queries:
+            clone_workout(small.id, self.user.id, with_sets=True)
+        with CaptureQueriesContext(connection) as large_queries:
+            clone_workout(large.id, self.user.id, with_sets=True)
+        self.assertEqual(len(small_queries.captured_queries), len(large_queries.captured_queries))
+
+    def test_workouts_of_other_users_cannot_be_cloned(self):
+        create_workouts(self.user, self.exercises, 1)
+        self.client.force_login(User.objects.create_user(username="other", password="secret"))
+        response = self.client.get(reverse("clone_workout", kwargs={"workout_id": Workout.objects.get().id}))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Workout.objects.count(), 1)
+
+
+class SyncExerciseSetsTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="athlete", password="secret")
+        self.exercise = Exercise.objects.create(user=self.user, name="Squat", type=0)
+        create_workouts(self.user, [self.exercise], 1, sets_per_exercise=0)
+        self.workout_exercise = WorkoutExercise.objects.get()
+        self.client.force_login(self.user)
+
+    def sync(self, operations):
+        return self.client.post(reverse("sync_exercise_sets"), json.dumps({"operations": operations}),
+                                content_type="application/json")
+
+    def operation(self, key, reps):
+        return {"key": key, "type": "add_set",
+                "set": {"workout_exercise": self.workout_exercise.id, "reps": reps, "weight": 50}}
+
+    def test_retried_operations_are_applied_once(self):
+        first = self.sync([self.operation("a", 5), self.operation("b", 6)])
+        self.assertEqual(first.status_code, 200)
+        # The response got lost, so the client sends the batch again together with a new operation
+        second = self.sync([self.operation("a", 5), self.operation("b", 6), self.operation("c", 7)])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(ExerciseSet.objects.count(), 3)
+        self.assertEqual(second.json()["results"]["a"]["id"], first.json()["results"]["a"]["id"])
+        self.assertEqual(second.json()["results"]["c"]["reps"], 7)
+        self.assertEqual(WorkoutSummary.objects.get().set_count, 3)
+
+    def test_errors_are_reported_by_operation(self):
+        self.sync([self.operation("a", 5)])
+        response = self.sync([self.operation("a", 5), self.operation("b", "many")])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()["errors"]), ["1"])
+        self.assertEqual(ExerciseSet.objects.count(), 1)
+
+    def test_keys_are_per_user(self):
+        self.sync([self.operation("a", 5)])
+        other = User.objects.create_user(username="other", password="secret")
+        self.client.force_login(other)
+        response = self.sync([self.operation("a", 5)])
+        # The key is new for this user, but the WorkoutExercise is not theirs
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ExerciseSet.objects.count(), 1)
+
+
+class AsyncViewsTest(TestCase):
+    # The read views are async. Through the ASGI handler they must not run blocking queries in the event loop
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="athlete", password="secret")
+        exercise = Exercise.objects.create(user=self.user, name="Squat", type=0)
+        create_workouts(self.user, [exercise], 3)
+        self.workout_exercise = WorkoutExercise.objects.order_by("id").first()
+        self.async_client = AsyncClient()
+        self.async_client.force_login(self.user)
+
+    async def test_read_views(self):
+        for path in (reverse("workout_list"),
+                     reverse("edit_workout", kwargs={"id": self.workout_exercise.workout_id}),
+                     reverse("edit_exercise_set", kwargs={"workout_exercise_id": self.workout_exercise.id})):
+            response = await self.async_client.get(path)
+            self.assertEqual(response.status_code, 200, path)
+
+    async def test_workout_list_pages(self):
+        response = await self.async_client.get(reverse("workout_list"))
+        page_obj = response.context["page_obj"]
+        self.assertEqual(page_obj.approximate_total, 3)
+        response = await self.async_client.get(reverse("workout_list"), {"after": page_obj.next_token})
+        self.assertEqual(len(response.context["page_obj"]), 1)
+
+    async def test_export_is_streamed(self):
+        # An async stream, so the ASGI handler does not read the export into memory first
+        response = await self.async_client.get(reverse("export_workouts"), {"format": "csv"})
+        self.assertTrue(response.is_async)
+        content = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(content.decode().splitlines()), 1 + 3 * 3)
+
+    async def test_astream_produces_batches(self):
+        produced = []
+
+        def chunks():
+            for i in range(5):
+                produced.append(i)
+                yield b"x"
+        stream = helpers.astream(chunks(), batch_size=2)
+        self.assertEqual(await anext(stream), b"xx")
+        self.assertEqual(produced, [0, 1])
+        self.assertEqual([chunk async for chunk in stream], [b"xx", b"x"])
+
+
+@skipUnless(connection.vendor == "sqlite", "The replica is a copy of the SQLite test database")
+class ReplicaRoutingTest(TransactionTestCase):
+    # The replica is a second SQLite database, copied from the primary in setUp.
+    # Rows written after the copy only exist on the primary, like on a replica that lags behind.
+    # The alias is added after setUpClass(), so the test case does not manage the replica like a database of its own
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.replica_file = tempfile.NamedTemporaryFile(suffix=".sqlite3", delete=False)
+        cls.replica_file.close()
+        connections.settings[db_routing.REPLICA] = connections.configure_settings({
+            "default": connections.settings["default"],
+            db_routing.REPLICA: {"ENGINE": "django.db.backends.sqlite3", "NAME": cls.replica_file.name},
+        })[db_routing.REPLICA]
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[db_routing.REPLICA].close()
+        del connections[db_routing.REPLICA]
+        del connections.settings[db_routing.REPLICA]
+        os.remove(cls.replica_file.name)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="athlete", password="secret")
+        self.exercise = Exercise.objects.create(user=self.user, name="Squat", type=0)
+        create_workouts(self.user, [self.exercise], 1)
+        self.replicate()
+        # Only on the primary
+        Workout.objects.create(user=self.user, name="Not replicated")
+        self.client.force_login(self.user)
+
+    def replicate(self):
+        connections[db_routing.REPLICA].close()
+        connection.ensure_connection()
+        replica = sqlite3.connect(self.replica_file.name)
+        connection.connection.backup(replica)
+        replica.close()
+
+    def workout_names(self, response):
+        return [report.name for report in response.context["page_obj"]]
+
+    def test_list_reads_from_replica(self):
+        with CaptureQueriesContext(connections[db_routing.REPLICA]) as replica_queries:
+            response = self.client.get(reverse("workout_list"))
+        self.assertTrue(response.wsgi_request.read_from_replica)
+        self.assertTrue(replica_queries.captured_queries)
+        self.assertEqual(self.workout_names(response), ["Workout 0"])
+
+    async def test_async_list_reads_from_replica(self):
+        async_client = AsyncClient()
+        await sync_to_async(async_client.force_login)(self.user)
+        response = await async_client.get(reverse("workout_list"))
+        self.assertTrue(response.asgi_request.read_from_replica)
+        self.assertEqual(self.workout_names(response), ["Workout 0"])
+
+    def test_other_views_read_from_primary(self):
+        workout = Workout.objects.get(name="Not replicated")
+        response = self.client.get(reverse("edit_workout", kwargs={"id": workout.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.wsgi_request.read_from_replica)
+
+    def test_reads_own_writes_after_post(self):
+        response = self.client.post(reverse("add_workout"),
+                                    {"workout-name": "Fresh", "workout_exercise-exercise": self.exercise.id})
+        self.assertFalse(response.wsgi_request.read_from_replica)
+        response = self.client.get(reverse("workout_list"))
+        self.assertFalse(response.wsgi_request.read_from_replica)
+        self.assertIn("Fresh", self.workout_names(response))
+        # After the sticky window the list is read from the replica again
+        with mock.patch.object(db_routing.time, "time", return_value=db_routing.time.time() + 60):
+            response = self.client.get(reverse("workout_list"))
+        self.assertTrue(response.wsgi_request.read_from_replica)
+        self.assertNotIn("Fresh", self.workout_names(response))
+
+    def test_reads_own_writes_after_delete_over_get(self):
+        # The delete views change data on GET and redirect to a view that reads from the replica
+        workout = Workout.objects.get(name="Workout 0")
+        response = self.client.get(reverse("delete_workout", kwargs={"workout_id": workout.id}))
+        self.assertRedirects(response, reverse("workout_list"), fetch_redirect_response=False)
+        with CaptureQueriesContext(connections[db_routing.REPLICA]) as replica_queries:
+            response = self.client.get(reverse("workout_list"))
+        self.assertFalse(response.wsgi_request.read_from_replica)
+        self.assertEqual(replica_queries.captured_queries, [])
+        self.assertNotIn("Workout 0", self.workout_names(response))
+
+    def test_missing_summaries_are_built_on_primary(self):
+        # The summaries are missing on both databases, and a set has been added after the replication
+        WorkoutExerciseSummary.objects.all().delete()
+        self.replicate()
+        workout_exercise = WorkoutExercise.objects.get(workout__name="Workout 0")
+        ExerciseSet.objects.create(workout_exercise=workout_exercise, reps=10, weight=30)
+        response = self.client.get(reverse("workout_list"))
+        self.assertTrue(response.wsgi_request.read_from_replica)
+        summary = WorkoutExerciseSummary.objects.get(workout_exercise=workout_exercise)
+        self.assertEqual(summary.set_count, 4)
+        report, = [report.exercise_reports[0].report for report in response.context["page_obj"]
+                   if report.name == "Workout 0"]
+        self.assertEqual(report, f"Squat:{summary.report}")
+
+    def test_get_without_writes_is_not_sticky(self):
+        workout = Workout.objects.get(name="Not replicated")
+        self.client.get(reverse("edit_workout", kwargs={"id": workout.id}))
+        self.assertTrue(self.client.get(reverse("workout_list")).wsgi_request.read_from_replica)
+
+    def test_writes_go_to_primary(self):
+        with db_routing.use_replica():
+            workout = Workout.objects.get(name="Workout 0")
+            self.assertEqual(workout._state.db, db_routing.REPLICA)
+            workout.name = "Renamed"
+            workout.save()
+        self.assertTrue(Workout.objects.filter(name="Renamed").exists())
+
+    def test_export_streams_from_replica(self):
+        response = self.client.get(reverse("export_workouts"), {"format": "json"})
+        content = b"".join(response.streaming_content).decode()
+        self.assertIn("Workout 0", content)
+        self.assertNotIn("Not replicated", content)
+
+    async def test_async_export_streams_from_replica(self):
+        async_client = AsyncClient()
+        await sync_to_async(async_client.force_login)(self.user)
+        response = await async_client.get(reverse("export_workouts"), {"format": "json"})
+        self.assertTrue(response.is_async)
+        content = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertIn("Workout 0", content)
+        self.assertNotIn("Not replicated", content)
+
+
+class MetricsTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="athlete", password="secret")
+        exercise = Exercise.objects.create(user=self.user, name="Squat", type=0)
+        create_workouts(self.user, [exercise], 2)
+        self.client.force_login(self.user)
+
+    def sample(self, name, **labels):
+        return metrics.REGISTRY.get_sample_value(name, labels) or 0
+
+    def cache_lookups(self):
+        return sum(self.sample("workout_cache_requests_total", cache="workout_rows", result=result)
+                   for result in ("hit", "miss"))
+
+    def test_request_metrics(self):
+        requests = self.sample("workout_request_duration_seconds_count", view="workout_list", method="GET")
+        queries = self.sample("workout_request_db_queries_sum", view="workout_list")
+        renders = self.sample("workout_template_render_seconds_count", template="workout_list.html")
+        lookups = self.cache_lookups()
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse("workout_list"))
+        self.assertEqual(self.sample("workout_request_duration_seconds_count", view="workout_list", method="GET"),
+                         requests + 1)
+        self.assertEqual(self.sample("workout_request_db_queries_sum", view="workout_list"),
+                         queries + len(context.captured_queries))
+        self.assertEqual(self.sample("workout_template_render_seconds_count", template="workout_list.html"),
+                         renders + 1)
+        # One lookup per row
+        self.assertEqual(self.cache_lookups(), lookups + 2)
+
+    @override_settings(METRICS_TOKEN="secret-token")
+    def test_metrics_endpoint(self):
+        self.client.get(reverse("workout_list"))
+        response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret-token")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('workout_request_db_queries_bucket{le="5.0",view="workout_list"}', response.content.decode())
+
+    @override_settings(METRICS_TOKEN="secret-token")
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 401)
+        self.assertEqual(self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer wrong").status_code, 401)
+        response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret-token")
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_TOKEN="")
+    def test_metrics_disabled_without_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+
+
+class BenchmarkCommandsTest(TestCase):
+
+    def test_seed_workouts(self):
+        call_command("seed_workouts", users=2, workouts=3, exercises=2, sets=4, stdout=StringIO())
+        user = User.objects.get(username="seed1")
+        self.assertEqual(Workout.objects.filter(user=user).count(), 3)
+        self.assertEqual(ExerciseSet.objects.filter(workout_exercise__workout__user=user).count(), 3 * 2 * 4)
+        self.assertEqual(WorkoutSummary.objects.filter(workout__user=user, set_count=8).count(), 3)
+        self.assertTrue(PersonalRecord.objects.filter(user=user).exists())
+        # The existing users are skipped
+        call_command("seed_workouts", users=3, workouts=1, stdout=StringIO())
+        self.assertEqual(Workout.objects.filter(user=user).count(), 3)
+        self.assertEqual(Workout.objects.filter(user__username="seed2").count(), 1)
+
+    def test_benchmark_views(self):
+        call_command("seed_workouts", users=1, workouts=3, stdout=StringIO())
+        output = StringIO()
+        call_command("benchmark_views", "seed0", repeat=3, views=["workout_list", "admin_exercise_set_list"],
+                     stdout=output)
+        report = json.loads(output.getvalue())
+        self.assertEqual(set(report["views"]), {"workout_list", "admin_exercise_set_list"})
+        result = report["views"]["workout_list"]
+        self.assertEqual(result["status"], 200)
+        self.assertGreater(result["queries"], 0)
+        self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+
+
+class QueryDetectorTest(query_detector.QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="athlete", password="secret")
+        self.exercises = [Exercise.objects.create(user=self.user, name=name, type=0) for name in ("A", "B", "C")]
+        create_workouts(self.user, self.exercises, 3)
+        self.client.force_login(self.user)
+
+    def test_fingerprint(self):
+        self.assertEqual(query_detector.fingerprint('SELECT * FROM "t" WHERE "id" IN (%s, %s, %s) AND x = 5'),
+                         query_detector.fingerprint('SELECT * FROM "t" WHERE "id" IN (%s) AND x = 7'))
+
+    def test_lazy_foreign_key(self):
+        with query_detector.recording() as recorder:
+            usernames = [exercise.user.username for exercise in Exercise.objects.all()]
+        repeated = recorder.repeated()
+        self.assertEqual(len(repeated), 1)
+        self.assertEqual(repeated[0]["count"], len(usernames))
+        self.assertIn("exercise.user.username", repeated[0]["stack"][0])
+
+    def test_template_line(self):
+        template = engines["django"].from_string(
+            "{% for exercise in exercises %}\n{{ exercise.user.username }}{% endfor %}")
+        with query_detector.recording() as recorder:
+            template.render({"exercises": Exercise.objects.all()})
+        self.assertEqual(recorder.repeated()[0]["template"], "<unknown source>:2")
+
+    def test_view_budgets(self):
+        workout_exercise = WorkoutExercise.objects.order_by("id").first()
+        for path, budget in ((reverse("workout_list"), 8),
+                             (reverse("edit_workout", kwargs={"id": workout_exercise.workout_id}), 8),
+                             (reverse("edit_exercise_set", kwargs={"workout_exercise_id": workout_exercise.id}), 8),
+                             (reverse("exercise_progress", kwargs={"exercise_id": self.exercises[0].id}), 8)):
+            with self.assertQueryBudget(budget):
+                self.assertEqual(self.client.get(path).status_code, 200)
+
+    def test_budget_exceeded(self):
+        with self.assertRaises(AssertionError):
+            with self.assertQueryBudget(1):
+                self.client.get(reverse("workout_list"))
+
+
+class RoleTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="athlete", password="secret")
+        self.admin_group = Group.objects.create(name=roles.ADMIN)
+        self.client.force_login(self.user)
+
+    def group_queries(self, path):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(path)
+        return response, [query["sql"] for query in context.captured_queries if "auth_group" in query["sql"]]
+
+    def test_groups_are_cached_in_session(self):
+        # Loaded at the login
+        response, queries = self.group_queries(reverse("workout_list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+        # Loaded once for a session without them
+        session = self.client.session
+        del session[roles.SESSION_ROLE_KEY]
+        session.save()
+        response, queries = self.group_queries(reverse("workout_list"))
+        self.assertEqual(len(queries), 1)
+        response, queries = self.group_queries(reverse("workout_list"))
+        self.assertEqual(queries, [])
+
+    def test_membership_change_is_picked_up(self):
+        self.client.get(reverse("workout_list"))
+        self.user.groups.add(self.admin_group)
+        response = self.client.get(reverse("workout_list"))
+        self.assertRedirects(response, reverse("admin-users"), fetch_redirect_response=False)
+        # Removed from the other side of the relation
+        self.admin_group.user_set.remove(self.user)
+        self.assertEqual(self.client.get(reverse("workout_list")).status_code, 200)
+
+    def test_admin_area_is_not_redirected(self):
+        self.user.groups.add(self.admin_group)
+        self.assertEqual(self.client.get(reverse("admin-users")).status_code, 200)
+
+    def test_renamed_group(self):
+        self.user.groups.add(self.admin_group)
+        self.assertEqual(self.client.get(reverse("workout_list")).status_code, 302)
+        self.admin_group.name = "coach"
+        self.admin_group.save()
+        # Members of other groups are sent to the home page
+        self.assertEqual(self.client.get(reverse("home")).status_code, 200)
+        self.assertRedirects(self.client.get(reverse("workout_list")), reverse("home"),
+                             fetch_redirect_response=False)
+
+    def test_change_in_another_process_is_picked_up(self):
+        self.user.groups.add(self.admin_group)
+        self.assertEqual(self.client.get(reverse("admin_cache_stats")).status_code, 200)
+        # Another process with a cache of its own removes the user from the group
+        other_cache = LocMemCache("other-process", {})
+        with mock.patch.object(roles, "get_cache", return_value=other_cache):
+            self.admin_group.user_set.remove(self.user)
+        self.assertEqual(self.client.get(reverse("admin_cache_stats")).status_code, 200)
+        # The groups in the session expire
+        later = roles.time.time() + roles.DEFAULT_ROLE_CACHE_SECONDS + 1
+        with mock.patch.object(roles.time, "time", return_value=later):
+            self.assertEqual(self.client.get(reverse("admin_cache_stats")).status_code, 403)
+
+    def test_versions_are_kept_in_the_shared_cache(self):
+        version = roles.get_version(self.user.id)
+        self.assertEqual(fragment_cache.get_cache().get(roles._version_key(self.user.id)), version)
+        self.user.groups.add(self.admin_group)
+        self.assertNotEqual(fragment_cache.get_cache().get(roles._version_key(self.user.id)), version)
+
+
+class DeferredDeletionTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="athlete", password="secret")
+        self.exercise = Exercise.objects.create(user=self.user, name="Squat", type=0)
+        create_workouts(self.user, [self.exercise], 2, sets_per_exercise=3)
+        self.workout = Workout.objects.order_by("id").first()
+        self.client.force_login(self.user)
+
+    def test_deleted_workout_is_hidden(self):
+        response = self.client.get(reverse("delete_workout", kwargs={"workout_id": self.workout.id}))
+        self.assertRedirects(response, reverse("workout_list"), fetch_redirect_response=False)
+        # Nothing has been deleted yet
+        self.assertTrue(Workout.all_objects.filter(id=self.workout.id).exists())
+        self.assertEqual(ExerciseSet.objects.count(), 6)
+        self.assertFalse(Workout.objects.filter(id=self.workout.id).exists())
+        self.assertEqual(analytics.compute_progress(self.user.id, self.exercise)["set_count"], 3)
+        export = b"".join(self.client.get(reverse("export_workouts"), {"format": "csv"}).streaming_content)
+        self.assertEqual(len(export.decode().splitlines()), 1 + 3)
+        self.assertFalse(PersonalRecord.objects.filter(
+            exercise_set__workout_exercise__workout=self.workout).exists())
+
+    def test_purge_in_batches(self):
+        job = deletion.delete_workout(self.workout)
+        progress = []
+        deletion.purge(job, batch_size=2, progress=lambda job: progress.append(job.deleted_rows))
+        # 3 sets in two batches, then the exercise with its summary, then the workout with its summary
+        self.assertEqual(progress, [2, 3, 5, 7])
+        job.refresh_from_db()
+        self.assertIsNotNone(job.finished)
+        self.assertEqual(job.deleted_rows, 7)
+        self.assertFalse(Workout.all_objects.filter(id=self.workout.id).exists())
+        self.assertEqual(ExerciseSet.objects.count(), 3)
+
+    def test_purge_user(self):
+        job = deletion.delete_user(self.user)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        out = StringIO()
+        call_command("purge_deleted", "--batch-size", "100", stdout=out)
+        self.assertIn(f"Purged user {self.user.id}", out.getvalue())
+        self.assertFalse(User.objects.filter(id=self.user.id).exists())
+        self.assertFalse(Workout.all_objects.exists())
+        self.assertFalse(ExerciseSet.objects.exists())
+        self.assertFalse(Exercise.objects.exists())
+        self.assertFalse(DeletionJob.objects.filter(finished=None).exists())
+
+    def test_children_of_deleted_workout_are_not_found(self):
+        workout_exercise = WorkoutExercise.objects.filter(workout=self.workout).first()
+        exercise_set = ExerciseSet.objects.filter(workout_exercise=workout_exercise).first()
+        deletion.delete_workout(self.workout)
+        urls = [
+            reverse("edit_workout", kwargs={"id": self.workout.id}),
+            reverse("edit_exercise_set", kwargs={"workout_exercise_id": workout_exercise.id}),
+            reverse("add_exercise_set", kwargs={"workout_exercise_id": workout_exercise.id,
+                                                "workout_id": self.workout.id}),
+            reverse("delete_exercise_set", kwargs={"workout_exercise_id": workout_exercise.id,
+                                                   "exercise_set_id": exercise_set.id}),
+            reverse("add_workout_exercise", kwargs={"workout_id": self.workout.id}),
+            reverse("delete_workout_exercise", kwargs={"workout_exercise_id": workout_exercise.id,
+                                                       "workout_id": self.workout.id}),
+            reverse("delete_workout", kwargs={"workout_id": self.workout.id}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+        for url in urls[:2]:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.post(url, {}).status_code, 404)
+        # Nothing has been added or deleted
+        self.assertEqual(WorkoutExercise.objects.filter(workout=self.workout).count(), 1)
+        self.assertEqual(ExerciseSet.objects.filter(workout_exercise=workout_exercise).count(), 3)
+        self.assertEqual(DeletionJob.objects.count(), 1)
+
+
+class ExerciseCatalogueTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="athlete", password="secret")
+        self.squat = Exercise.objects.create(user=self.user, name="Squat", type=0)
+        self.run = Exercise.objects.create(user=self.user, name="Run", type=1, goal=2)
+        create_workouts(self.user, [self.squat, self.run], 2, sets_per_exercise=1)
+        self.workout = Workout.objects.order_by("id").first()
+        self.client.force_login(self.user)
+
+    def exercise_queries(self, path):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response, [query["sql"] for query in context.captured_queries
+                          if '"workout_app_exercise"' in query["sql"].split("WHERE")[0]]
+
+    def test_pages_read_the_catalogue(self):
+        self.exercise_queries(reverse("workout_list"))
+        for path in (reverse("workout_list"), reverse("add_workout"),
+                     reverse("edit_workout", kwargs={"id": self.workout.id})):
+            response, queries = self.exercise_queries(path)
+            self.assertEqual(queries, [], path)
+        self.assertContains(response, f'<option value="{self.run.id}">Run</option>', html=True)
+        self.assertContains(response, "Squat")
+
+    def test_invalidated_when_an_exercise_changes(self):
+        self.assertEqual(catalogue.get_catalogue(self.user.id)[self.squat.id].name, "Squat")
+        self.client.get(reverse("edit_exercise", kwargs={"exercise_id": self.squat.id}))
+        self.client.post(reverse("edit_exercise", kwargs={"exercise_id": self.squat.id}),
+                         {"name": "Front squat", "type": 0, "goal": 0})
+        self.assertEqual(catalogue.get_catalogue(self.user.id)[self.squat.id].name, "Front squat")
+        self.client.post(reverse("edit_exercise_list"), {"name": "Row", "type": 1, "goal": 2})
+        self.assertEqual([entry.name for entry in catalogue.get_catalogue(self.user.id).values()],
+                         ["Front squat", "Run", "Row"])
+        row = Exercise.objects.get(name="Row")
+        self.client.get(reverse("delete_exercise", kwargs={"exercise_id": row.id}))
+        self.assertNotIn(row.id, catalogue.get_catalogue(self.user.id))
+
+    def test_form_validates_against_the_catalogue(self):
+        other = User.objects.create_user(username="other", password="secret")
+        foreign = Exercise.objects.create(user=other, name="Foreign", type=0)
+        form = WorkoutExerciseForm({"exercise": self.run.id}, user_id=self.user.id)
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data["exercise"].name, "Run")
+        self.assertFalse(WorkoutExerciseForm({"exercise": foreign.id}, user_id=self.user.id).is_valid())
+        self.assertFalse(WorkoutExerciseForm({"exercise": "x"}, user_id=self.user.id).is_valid())
+        # A cached exercise that has been deleted meanwhile, e.g. in another process
+        cached = catalogue.get_catalogue(self.user.id)
+        spare = Exercise.objects.create(user=self.user, name="Spare", type=0)
+        Exercise.objects.filter(id=spare.id).delete()
+        stale = {**cached, spare.id: catalogue.Entry(spare.id, "Spare", 0, 0)}
+        form = WorkoutExerciseForm({"exercise": spare.id}, user_id=self.user.id, catalogue=stale)
+        self.assertFalse(form.is_valid())
+        self.assertIn("exercise", form.errors)
+
+    def test_foreign_ids_do_not_create_versions(self):
+        other = User.objects.create_user(username="other", password="secret")
+        foreign = Exercise.objects.create(user=other, name="Foreign", type=0)
+        catalogue.get_catalogue(self.user.id)
+        version = catalogue._get_version(self.user.id)
+        with CaptureQueriesContext(connection) as context:
+            exercises = catalogue.get_catalogue(self.user.id, [foreign.id])
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertNotIn(foreign.id, exercises)
+        self.assertEqual(catalogue._get_version(self.user.id), version)
+
+    def test_missing_exercise_is_reloaded(self):
+        catalogue.get_catalogue(self.user.id)
+        # bulk_create does not send post_save
+        row = Exercise.objects.bulk_create([Exercise(user=self.user, name="Row", type=1, goal=2)])[0]
+        self.assertNotIn(row.id, catalogue.get_catalogue(self.user.id))
+        self.assertIn(row.id, catalogue.get_catalogue(self.user.id, [row.id]))
+        self.assertIn(row.id, catalogue.get_catalogue(self.user.id))
+
+    def test_rows_follow_a_rename_in_another_process(self):
+        self.assertContains(self.client.get(reverse("workout_list")), "Squat:")
+        # Another process renames the exercise. Its invalidation does not reach this process,
+        # but the rebuilt summaries bump the versions of the workouts in the database
+        Exercise.objects.filter(id=self.squat.id).update(name="Front squat")
+        summaries.rebuild_exercise(self.squat.id)
+        # Until the copies of the catalogue expire, this process renders the old name
+        self.assertContains(self.client.get(reverse("workout_list")), ">Squat:")
+        # Afterwards the rows rendered with the old name are not served from the cache any longer
+        fragment_cache.get_cache().delete(
+            catalogue._catalogue_key(self.user.id, catalogue._get_version(self.user.id)))
+        with mock.patch.object(catalogue.time, "monotonic", return_value=catalogue.time.monotonic() + 3600):
+            response = self.client.get(reverse("workout_list"))
+        self.assertContains(response, "Front squat:")
+        self.assertNotContains(response, ">Squat:")
+
+    def test_local_copies_expire(self):
+        catalogue.get_catalogue(self.user.id)
+        with mock.patch.object(catalogue.time, "monotonic", return_value=catalogue.time.monotonic() + 3600):
+            with CaptureQueriesContext(connection) as context:
+                catalogue.get_catalogue(self.user.id)
+        # Read from the cache of the rows, not from the database
+        self.assertEqual(context.captured_queries, [])
@@ -14,6 +14,13 @@ urlpatterns = [
     path('delete_exercise_set/<int:workout_exercise_id>/<int:exercise_set_id>', views.DeleteExerciseSet.as_view(), name='delete_exercise_set'),
     path('add_workout_exercise/<int:workout_id>', views.AddWorkoutExercise.as_view(), name='add_workout_exercise'),
     path('edit_exercise_set/<int:workout_exercise_id>', views.EditExerciseSet.as_view(), name='edit_exercise_set'),
+    path('log_exercise_sets', views.LogExerciseSets.as_view(), name='log_exercise_sets'),
+    path('sync_exercise_sets', views.SyncExerciseSets.as_view(), name='sync_exercise_sets'),
     path('delete_workout/<int:workout_id>', views.DeleteWorkout.as_view(), name='delete_workout'),
+    path('clone_workout/<int:workout_id>', views.CloneWorkout.as_view(), name='clone_workout'),
     path('delete_workout_exercise/<int:workout_exercise_id>/<int:workout_id>', views.DeleteWorkoutExercise.as_view(), name='delete_workout_exercise'),
+    path('export_workouts', views.ExportWorkouts.as_view(), name='export_workouts'),
+    path('import_workouts', views.ImportWorkouts.as_view(), name='import_workouts'),
+    path('exercise_progress/<int:exercise_id>', views.ExerciseProgress.as_view(), name='exercise_progress'),
+    path('metrics', views.Metrics.as_view(), name='metrics'),
 ]
\ No newline at end of file
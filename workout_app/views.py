@@ -1,49 +1,32 @@
 from django.shortcuts import render, get_object_or_404, reverse
 from django.views import generic, View
-from django.http import HttpResponseRedirect
+import hmac
+import json
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseRedirect, HttpResponseBadRequest, JsonResponse, Http404
 from .models import *
 from .forms import *
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.db.models import ProtectedError
-from django.core.paginator import Paginator
-from .helpers import redirect_user_to_goup
-
-# The follwing two reports are used by WorkoutList view
-# They are the items that get displayed when the user navigates to 'Workouts'
-# They are used in the template workout_list.html to enable displaying the name of the workout
-# and providing a link to the workout by using its id.
-# Also, the reports store summaries of each exercise in the workout.
-# And hold the id of WorkoutExercise, which can be used to provide a link to the WorkoutExercise
-# with all of its ExerciseSets
-class WorkoutReport:
-    # A class for storing reports for each workout
-    workout_id = 0
-    date = None
-    name = None
-    exercise_reports = None
-
-    def __init__(self) -> None:
-        self.date = "today"
-        self.name = "workout name"
-        self.exercise_reports = []
-
-
-class ExerciseReport:
-    # A class for storing reports about an exercise in a workout
-    workout_exercise_id = 0
-    report = ""
-
+from asgiref.sync import sync_to_async
+from .helpers import aget_user, arender, streaming_response
+from .reports import ReportBuilder
+from .pagination import KeysetPaginator
+from . import export, analytics, metrics, deletion, catalogue
+from .importer import WorkoutImporter, ImportValidationError
+from .set_batch import log_sets, SetBatchError
+from .cloning import clone_workout
+from .sync import apply_operations, SyncConflict
+from . import summaries, records
+from .fragment_cache import bump_workout_versions
 
 class HomePage(View):
     # View for the home page
     template_name = "index.html"
 
     def get(self, request, *args, **kwargs):
-        # Check if the user belongs in a group and redirect them if they do
-        if request.user.groups.exists():
-            return redirect_user_to_goup(request=request)
-
+        # Members of a group are redirected to their area by roles.RoleMiddleware
         return render(request, self.template_name)
 
 
@@ -53,106 +36,33 @@ class WorkoutList(View):
     model = Workout
     template_name = "workout_list.html"
     paginate_by = 2
-    # Constants for exercise.type
-    STRENGTH = 0
-    CARDIO = 1
-    # Constants for exercise.goal
-    REPETITIONS = 0
-    DISTANCE = 1
-
-    def get(self, request, *args, **kwargs):
+    # Workouts are paginated by (date, id) using cursors instead of page numbers
+    ordering = ("-date", "-id")
+    # Show the (approximate) number of workouts
+    show_total = True
+    # Reference to the class that builds the reports
+    report_builder_class = ReportBuilder
+
+    async def get(self, request, *args, **kwargs):
+        # Async view: the queries use the async queryset API
+        user = await aget_user(request)
         # If the user is not logged in, then redirect them to the login page
-        if not request.user.is_authenticated:
+        if not user.is_authenticated:
             return HttpResponseRedirect("accounts/login/")
 
-        # Check if the user belongs in a group and redirect them if they do
-        if request.user.groups.exists():
-            return redirect_user_to_goup(request=request)
-
         # Only retrieve datasets related to the user
-        self.model.objects.filter(user_id=self.request.user.id)
-        # Generate Roports
-        reports = self.__generate_reports()
-        # Create paginator and load it with reports
-        paginator = Paginator(reports, self.paginate_by)
-        # Retrieve page number from the GET-Request-object
-        page_number = request.GET.get("page")
-        page_obj = paginator.get_page(page_number)
+        workouts = self.model.objects.filter(user_id=user.id)
+        # Paginate first, so only the workouts on the requested page get loaded
+        paginator = KeysetPaginator(workouts, self.paginate_by, self.ordering, with_total=self.show_total)
+        # Retrieve the cursor from the GET-Request-object
+        page_obj = await paginator.aget_page(
+            after=request.GET.get("after"), before=request.GET.get("before"), last="last" in request.GET)
+        # Replace the workouts on the page with their reports
+        page_obj.object_list = await self.report_builder_class().abuild(page_obj.object_list)
         context = {
             "page_obj": page_obj,
         }
-        return render(request, self.template_name, context=context)
-
-    # Create Reports
-
-    def __generate_reports(self):
-        reports = []
-        workout_list = self.model.objects.filter(user_id=self.request.user.id)
-        for workout in workout_list:
-            # Create w wokrout report for each workout
-            workout_exercises = WorkoutExercise.objects.filter(
-                workout_id=workout.id)
-            report = WorkoutReport()
-            report.workout_id = workout.id
-            report.date = workout.date
-            report.name = workout.name
-
-            for workout_exercise in workout_exercises:
-                # Create an exercise report for each exercise
-                # and attach it to the workout report
-                exercise_report = ExerciseReport()
-                exercise_report.workout_exercise_id = workout_exercise.id
-                exercise_report.report += f"{workout_exercise.exercise.name}:"
-                exercise_report.report += self.__generate_report(
-                    workout_exercise)
-                report.exercise_reports.append(exercise_report)
-
-            reports.append(report)
-        return reports
-
-    def __generate_report(self, workout_exercise):
-        # generate a report according to the type and goal of an exercise
-        report = ""
-        exercise_sets = ExerciseSet.objects.filter(
-            workout_exercise_id=workout_exercise.id)
-
-        if workout_exercise.exercise.type == self.STRENGTH:
-            # Get a summarized report for strength exercises
-            report += self.__generate_strength_report(exercise_sets)
-
-        else:
-            if workout_exercise.exercise.goal == self.REPETITIONS:
-                # Get a summarized report for cardio exercises with repetitions
-                report += self.__generate_repetitions_report(exercise_sets)
-            else:
-                # Get a summarized report for cardio exercises with distance
-                report += self.__generate_distance_report(exercise_sets)
-
-        return report
-
-    def __generate_strength_report(self, exercise_sets):
-        # Summarize all the sets in a single report for an exercise for strength
-        report = ""
-        for exercise_set in exercise_sets:
-            report += f"{exercise_set.reps} x {exercise_set.weight} kg  "
-
-        return report
-
-    def __generate_repetitions_report(self, exercise_sets):
-        # Summarize all the sets in a single report for cardio exercise with repetitions
-        report = ""
-        for exercise_set in exercise_sets:
-            report += f"{exercise_set.reps} in {exercise_set.time}     "
-
-        return report
-
-    def __generate_distance_report(self, exercise_sets):
-        # Summarize all the sets in a single report for an exercise with distance
-        report = ""
-        for exercise_set in exercise_sets:
-            report += f"{exercise_set.distance} in {exercise_set.time}   "
-
-        return report
+        return await arender(request, self.template_name, context=context)
 
 
 class AddWorkout(View):
@@ -171,9 +81,6 @@ class AddWorkout(View):
         if not request.user.is_authenticated:
             return HttpResponseRedirect("accounts/login/")
 
-        # Check if the user belongs in a group and redirect them if they do
-        if request.user.groups.exists():
-            return redirect_user_to_goup(request=request)
         # Instanciate the forms.
         # The prefix is mandatory whhen using several forms in the same view.
         # When initializing a form, using the data in the POST-request object, prefix
@@ -203,6 +110,8 @@ class AddWorkout(View):
             workout_exercise_form.instance.workout_id = workout_form.instance.id
             # Commit the model object to the database
             workout_exercise_form.save()
+            # Create the summaries of the new workout
+            summaries.rebuild_workout_exercises([workout_exercise_form.instance.id])
 
             return HttpResponseRedirect(reverse("edit_workout", kwargs={'id': workout_form.instance.id}))
 
@@ -223,42 +132,53 @@ class EditWorkout(View):
     template_name = "edit_workout.html"
     # Process a GET-Request
 
-    def get(self, request, *args, **kwargs):
+    async def get(self, request, *args, **kwargs):
+        # Async view: the queries use the async queryset API
+        user = await aget_user(request)
         # If the user is not logged in, then redirect them to the login page
-        if not request.user.is_authenticated:
+        if not user.is_authenticated:
             return HttpResponseRedirect("accounts/login/")
 
-        # Check if the user belongs in a group and redirect them if they do
-        if request.user.groups.exists():
-            return redirect_user_to_goup(request=request)
         # Pull the workout.id from kwargs
         id = kwargs['id']
         # Instanciate the forms.
         # The prefix is mandatory whhen using several forms in the same view.
         # When initializing a form, using the data in the POST-request object, prefix
         # helps setting the forms apart, as you can see in the post method below.
-        workout = Workout.objects.get(id=id)
+        # A deleted workout is not found
+        try:
+            workout = await Workout.objects.aget(id=id)
+        except Workout.DoesNotExist:
+            raise Http404("No such workout")
         # Create form for the workout object
         workout_form = self.workout_form_class(
             instance=workout, prefix="workout")
 
-        workout_exercise_list = WorkoutExercise.objects.filter(
-            workout_id=workout.id)
+        # The list is loaded before rendering. The names of the exercises are taken from the catalogue
+        workout_exercise_list = [workout_exercise async for workout_exercise in WorkoutExercise.objects.filter(
+            workout_id=workout.id).aiterator()]
+        exercises = await catalogue.aget_catalogue(
+            user.id, [workout_exercise.exercise_id for workout_exercise in workout_exercise_list])
+        catalogue.attach_exercises(user.id, workout_exercise_list, exercises)
         # Create a form for the last WrokoutExercise object
         workout_exercise_form = self.workout_exercise_form_class(
-            user_id=request.user.id, prefix="workout_exercise")
+            user_id=user.id, catalogue=exercises, prefix="workout_exercise")
 
         # Render the dedicated template
-        return render(
+        return await arender(
             request, self.template_name, {"workout_form": workout_form,
                                           "workout_exercise_list": workout_exercise_list,
                                           "workout_exercise_form": workout_exercise_form})
 
-    def post(self, request, id, *args, **kwargs):
+    async def post(self, request, *args, **kwargs):
+        # A view is either sync or async, so the writes run in the synchronous code path in a thread
+        return await sync_to_async(self.__post)(request, *args, **kwargs)
+
+    def __post(self, request, id, *args, **kwargs):
         # Process a POST-Request
         # @parameter : id = workout_id
         # Get the workout using the id parameter
-        workout = Workout.objects.get(id=id)
+        workout = get_object_or_404(Workout, id=id)
         # Instanciate the forms.
         workout_form = self.workout_form_class(
             request.POST, prefix="workout", instance=workout)
@@ -271,6 +191,8 @@ class EditWorkout(View):
             if workout_form.is_valid():
                 # Save the workout form only
                 workout_form.save()
+                # The name has changed, so the cached row in the list of workouts is outdated
+                bump_workout_versions([workout_form.instance.id])
                 return HttpResponseRedirect(reverse('edit_workout', kwargs={'id': workout_form.instance.id}))
         # If the workout form has not changed, yet the workout_exercise_form has
         elif workout_exercise_form.has_changed() and not workout_form.has_changed():
@@ -288,8 +210,9 @@ class EditWorkout(View):
         # messages for the user, which had been generated upon calling the is_valid() method
         messages.add_message(
             request, messages.ERROR, "You might have forgotten to select the exercise you want to add!")
-        workout_exercise_list = WorkoutExercise.objects.filter(
-            workout_id=workout.id)
+        workout_exercise_list = list(WorkoutExercise.objects.filter(workout_id=workout.id))
+        catalogue.attach_exercises(request.user.id, workout_exercise_list, catalogue.get_catalogue(
+            request.user.id, [workout_exercise.exercise_id for workout_exercise in workout_exercise_list]))
 
         return render(request, self.template_name, {"workout_form": workout_form, "workout_exercise_form": workout_exercise_form,
                                                     "workout_exercise_list": workout_exercise_list})
@@ -308,6 +231,8 @@ class EditWorkout(View):
         workout_exercise.done = workout_exercise_form.instance.done
         # Save the object
         workout_exercise.save()
+        # Update the summaries of the workout
+        summaries.rebuild_workout_exercises([workout_exercise.id])
 
         return HttpResponseRedirect(reverse('edit_workout', kwargs={'id': workout_form.instance.id}))
 
@@ -326,6 +251,8 @@ class EditWorkout(View):
         workout_exercise.exercise_id = workout_exercise_form.instance.exercise_id
         workout_exercise.done = workout_exercise_form.instance.done
         workout_exercise.save()
+        # Update the summaries of the workout
+        summaries.rebuild_workout_exercises([workout_exercise.id])
 
         return HttpResponseRedirect(reverse('edit_workout', kwargs={'id': workout_form.instance.id}))
 
@@ -341,37 +268,48 @@ class EditExerciseSet(View):
     EXERCISE_GOAL_REPETITIONS = 0
     EXERCISE_GOAL_DISTANCE = 1
 
-    def get(self, request, *args, **kwargs):
+    async def get(self, request, *args, **kwargs):
+        # Async view: the queries use the async queryset API
+        user = await aget_user(request)
         # If the user is not logged in, then redirect them to the login page
-        if not request.user.is_authenticated:
+        if not user.is_authenticated:
             return HttpResponseRedirect("accounts/login/")
 
-        # Check if the user belongs in a group and redirect them if they do
-        if request.user.groups.exists():
-            return redirect_user_to_goup(request=request)
-
         workout_exercise_id = kwargs["workout_exercise_id"]
 
-        workout_exercise = WorkoutExercise.objects.get(id=workout_exercise_id)
-        workout_exercise_form = self.workout_exercise_form_class(user_id=request.user.id,
+        # The workout is loaded along, it is used in the template. The exercise is taken from the catalogue
+        # The exercises and sets of a deleted workout are hidden until they are purged
+        try:
+            workout_exercise = await WorkoutExercise.objects.select_related("workout").aget(
+                id=workout_exercise_id, workout__deleted_at=None)
+        except WorkoutExercise.DoesNotExist:
+            raise Http404("No such exercise")
+        exercises = await catalogue.aget_catalogue(user.id, [workout_exercise.exercise_id])
+        catalogue.attach_exercises(user.id, [workout_exercise], exercises)
+        workout_exercise_form = self.workout_exercise_form_class(user_id=user.id, catalogue=exercises,
                                                                  instance=workout_exercise, prefix="workout_exercise")
 
         # Empty form for adding a new set
         exercise_set_form = self.exercise_set_form_class(prefix="exercise_set")
 
         # Retrieve list of exercise_sets for the template
-        exercise_set_list = ExerciseSet.objects.filter(
-            workout_exercise_id=workout_exercise_id).order_by("id")
+        exercise_set_list = [exercise_set async for exercise_set in ExerciseSet.objects.filter(
+            workout_exercise_id=workout_exercise_id).order_by("id").aiterator()]
 
-        # Retrieve exercise for the template
-        exercise = Exercise.objects.get(
-            id=workout_exercise.exercise_id)
+        # Retrieve exercise for the template. It is loaded in a thread if the catalogue does not hold it
+        exercise = await sync_to_async(lambda: workout_exercise.exercise)()
+        record_set_ids = await records.arecord_set_ids(user.id, exercise.id)
 
-        return self.__render(request, exercise, workout_exercise_form, exercise_set_form, exercise_set_list)
+        return await arender(request, self.__template_name(exercise), self.__context(
+            exercise, workout_exercise_form, exercise_set_form, exercise_set_list, record_set_ids))
+
+    async def post(self, request, *args, **kwargs):
+        # A view is either sync or async, so the writes run in the synchronous code path in a thread
+        return await sync_to_async(self.__post)(request, *args, **kwargs)
 
-    def post(self, request, workout_exercise_id, *args, **kwargs):
+    def __post(self, request, workout_exercise_id, *args, **kwargs):
         # Retrieve workout_exercise using the workout_exercise_id
-        workout_exercise = WorkoutExercise.objects.get(id=workout_exercise_id)
+        workout_exercise = get_object_or_404(WorkoutExercise, id=workout_exercise_id, workout__deleted_at=None)
 
         # Retrieve the workout_exercise_form from the request object
         workout_exercise_form = self.workout_exercise_form_class(
@@ -380,7 +318,9 @@ class EditExerciseSet(View):
         exercise_set_form = self.exercise_set_form_class(
             request.POST, prefix="exercise_set")
         # Retrieve an exercise object for the template
-        exercise = Exercise.objects.get(id=workout_exercise.exercise_id)
+        catalogue.attach_exercises(request.user.id, [workout_exercise], catalogue.get_catalogue(
+            request.user.id, [workout_exercise.exercise_id]))
+        exercise = workout_exercise.exercise
 
         # If forms are valid
         if workout_exercise_form.is_valid() and exercise_set_form.is_valid():
@@ -388,11 +328,17 @@ class EditExerciseSet(View):
             return self.__save_forms(request, workout_exercise_form,
                                      exercise_set_form)
 
-        return self.__render(request, exercise, workout_exercise_form, exercise_set_form)
+        # Retrieve list of exercise_sets for the template
+        exercise_set_list = ExerciseSet.objects.filter(
+            workout_exercise_id=workout_exercise_id).order_by("id")
+
+        return self.__render(request, exercise, workout_exercise_form, exercise_set_form, exercise_set_list)
 
     def __save_forms(self, request, workout_exercise_form, exercise_set_form):
         # Save forms
         workout_exercise_form.instance.user = request.user
+        # The exercise before saving, in case the form replaces it
+        previous_exercise_id = workout_exercise_form.initial.get("exercise")
         workout_exercise_form.save()
 
         # Create a new object of type ExerciseSet
@@ -406,17 +352,92 @@ class EditExerciseSet(View):
         # Save the object
         exercise_set.save()
 
+        # Update the summaries and the personal records
+        if workout_exercise_form.has_changed():
+            # The exercise might have been replaced, so the whole summary has to be rebuilt
+            summaries.rebuild_workout_exercises([workout_exercise_form.instance.id])
+            # The sets have moved from one exercise to the other, so recompute the records of both
+            records.recompute({(request.user.id, previous_exercise_id),
+                               (request.user.id, workout_exercise_form.instance.exercise_id)})
+        else:
+            summaries.set_added(exercise_set)
+            broken_records = records.register_sets(
+                request.user.id, workout_exercise_form.instance.exercise_id, [exercise_set])
+            if broken_records:
+                messages.add_message(request, messages.SUCCESS,
+                                     f"New personal record: {', '.join(broken_records)}!")
+
         return HttpResponseRedirect(reverse("edit_exercise_set", kwargs={"workout_exercise_id": workout_exercise_form.instance.id}))
 
     def __render(self, request, exercise, workout_exercise_form, exercise_set_form, exercise_set_list):
-        # Render a template according to the type and goal of the exercise
+        record_set_ids = records.record_set_ids(request.user.id, exercise.id)
+        return render(request, self.__template_name(exercise), self.__context(
+            exercise, workout_exercise_form, exercise_set_form, exercise_set_list, record_set_ids))
+
+    def __context(self, exercise, workout_exercise_form, exercise_set_form, exercise_set_list, record_set_ids):
+        return {"exercise": exercise, "workout_exercise_form": workout_exercise_form,
+                "exercise_set_form": exercise_set_form, "exercise_set_list": exercise_set_list,
+                # Sets that hold a personal record get marked in the template
+                "record_set_ids": record_set_ids}
+
+    def __template_name(self, exercise):
+        # The template depends on the type and goal of the exercise
         if exercise.type == self.EXERCISE_TYPE_STRENGTH:
-            return render(request, self.template_strength_exercise, {"exercise": exercise, "workout_exercise_form": workout_exercise_form, "exercise_set_form": exercise_set_form, "exercise_set_list": exercise_set_list})
+            return self.template_strength_exercise
         else:
             if exercise.goal == self.EXERCISE_GOAL_REPETITIONS:
-                return render(request, self.template_repetitions_exercise, {"exercise": exercise, "workout_exercise_form": workout_exercise_form, "exercise_set_form": exercise_set_form, "exercise_set_list": exercise_set_list})
+                return self.template_repetitions_exercise
             else:
-                return render(request, self.template_distance_exercise, {"exercise": exercise, "workout_exercise_form": workout_exercise_form, "exercise_set_form": exercise_set_form, "exercise_set_list": exercise_set_list})
+                return self.template_distance_exercise
+
+
+class LogExerciseSets(View):
+    # JSON endpoint for logging many sets in one round trip, for one or more WorkoutExercises.
+    # Body: {"sets": [{"workout_exercise": 1, "reps": 10, "weight": 20, "time": "00:00:00:0", "distance": 0}, ...]}
+    # Responds with the created sets, or with the errors per index of the invalid sets (nothing is saved then)
+
+    def post(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({"error": "Not logged in"}, status=401)
+
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({"error": "Invalid JSON"}, status=400)
+        if not isinstance(payload, dict):
+            return JsonResponse({"error": "Expected an object"}, status=400)
+
+        try:
+            result = log_sets(request.user.id, payload.get("sets"))
+        except SetBatchError as error:
+            return JsonResponse({"error": str(error), "errors": error.errors}, status=400)
+        return JsonResponse(result, status=201)
+
+
+class SyncExerciseSets(View):
+    # Endpoint of the offline write queue in static/js/write_queue.js.
+    # Body: {"operations": [{"key": "<uuid>", "type": "add_set", "set": {"workout_exercise": 1, "reps": 10, ...}}]}
+    # Retried operations are recognized by their key and not applied twice.
+    # Responds with the canonical set of every key
+
+    def post(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({"error": "Not logged in"}, status=401)
+
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({"error": "Invalid JSON"}, status=400)
+        if not isinstance(payload, dict):
+            return JsonResponse({"error": "Expected an object"}, status=400)
+
+        try:
+            result = apply_operations(request.user.id, payload.get("operations"))
+        except SetBatchError as error:
+            return JsonResponse({"error": str(error), "errors": error.errors}, status=400)
+        except SyncConflict as error:
+            return JsonResponse({"error": str(error)}, status=409)
+        return JsonResponse(result)
 
 
 class AddExerciseSet(View):
@@ -425,45 +446,89 @@ class AddExerciseSet(View):
     def get(self, request, workout_exercise_id, workout_id,  *args, **kwargs):
         # Process a GET-request
 
+        # No sets are added to a deleted workout
+        workout_exercise = get_object_or_404(WorkoutExercise, id=workout_exercise_id, workout__deleted_at=None)
         # Create new ExerciseSet object
-        ExerciseSet.objects.create(workout_exercise_id=workout_exercise_id)
+        exercise_set = ExerciseSet.objects.create(workout_exercise=workout_exercise)
+        # Update the summaries
+        summaries.set_added(exercise_set)
         return HttpResponseRedirect(reverse('edit_exercise_set', kwargs={"workout_exercise_id": workout_exercise_id}))
 
 
 class DeleteExerciseSet(View):
     # Delete an ExerciseSet from a workout
     def get(self, request, workout_exercise_id, exercise_set_id, *args, **kwargs):
-        exercise_set = ExerciseSet.objects.get(id=exercise_set_id)
+        exercise_set = get_object_or_404(ExerciseSet, id=exercise_set_id, workout_exercise__workout__deleted_at=None)
+        # Records that have to be recomputed, if the set holds any of them
+        affected_records = records.records_held_by(ExerciseSet.objects.filter(id=exercise_set_id))
         exercise_set.delete()
+        # Rebuild the summary of the WorkoutExercise from the remaining sets
+        summaries.rebuild_workout_exercises([workout_exercise_id])
+        records.recompute(affected_records)
         return HttpResponseRedirect(reverse('edit_exercise_set', kwargs={"workout_exercise_id": workout_exercise_id}))
 
 
 class AddWorkoutExercise(View):
     def get(self, request, workout_id, *args, **kwargs):
+        # Workout.objects does not find a deleted workout
+        workout = get_object_or_404(Workout, id=workout_id)
         exercise = Exercise.objects.first()
-        WorkoutExercise.objects.create(
-            workout_id=workout_id, exercise_id=exercise.id)
+        workout_exercise = WorkoutExercise.objects.create(
+            workout=workout, exercise_id=exercise.id)
+        # Update the summaries of the workout
+        summaries.rebuild_workout_exercises([workout_exercise.id])
 
         return HttpResponseRedirect(reverse('edit_workout', kwargs={"id": workout_id}))
 
 
 class DeleteWorkoutExercise(View):
     def get(self, request, workout_exercise_id, workout_id, *args, **kwargs):
-        workout_exercise = WorkoutExercise.objects.get(id=workout_exercise_id)
+        workout_exercise = get_object_or_404(WorkoutExercise, id=workout_exercise_id, workout__deleted_at=None)
+        # Records that have to be recomputed, if any of the sets hold them
+        affected_records = records.records_held_by(
+            ExerciseSet.objects.filter(workout_exercise_id=workout_exercise_id))
         workout_exercise.delete()
+        records.recompute(affected_records)
+        # Update the summary of the workout
+        summaries.refresh_workout(workout_id)
         return HttpResponseRedirect(reverse('edit_workout', kwargs={'id': workout_id}))
 
 
 class DeleteWorkout(View):
     def get(self, request, workout_id, *args, **kwargs):
-        workout = Workout.objects.get(id=workout_id)
-        workout.delete()
+        workout = get_object_or_404(Workout, id=workout_id)
+        # Records that have to be recomputed, if any of the sets hold them
+        affected_records = records.records_held_by(
+            ExerciseSet.objects.filter(workout_exercise__workout_id=workout_id))
+        # The workout is hidden right away, its exercises and sets are deleted in the background
+        deletion.delete_workout(workout)
+        records.recompute(affected_records)
         return HttpResponseRedirect(reverse('workout_list'))
 
 
+class CloneWorkout(View):
+    # Repeat a past workout: copy it with its exercises into a new workout dated today.
+    # The sets are not copied: a copied set would count as done in the summaries and the records
+    def get(self, request, workout_id, *args, **kwargs):
+        # If the user is not logged in, then redirect them to the login page
+        if not request.user.is_authenticated:
+            return HttpResponseRedirect(reverse("account_login"))
+
+        try:
+            workout = clone_workout(workout_id, request.user.id)
+        except Workout.DoesNotExist:
+            return HttpResponseBadRequest("Unknown workout")
+        messages.add_message(request, messages.SUCCESS, f"{workout.name} has been copied")
+        return HttpResponseRedirect(reverse('edit_workout', kwargs={'id': workout.id}))
+
+
 class EditExerciseList(View):
     # Paginator - Number of items per page
     paginate_by = 5
+    # Exercises are paginated by id using cursors instead of page numbers
+    ordering = ("-id",)
+    # Show the (approximate) number of exercises
+    show_total = True
     # Reference to the form
     exercise_form_class = ExerciseForm
     # Reference to the template
@@ -476,19 +541,14 @@ class EditExerciseList(View):
         if not request.user.is_authenticated:
             return HttpResponseRedirect("accounts/login/")
 
-        # Check if the user belongs in a group and redirect them if they do
-        if request.user.groups.exists():
-            return redirect_user_to_goup(request=request)
-
         # Query the last exercises related to the current user
-        exercises = Exercise.objects.filter(
-            user_id=request.user.id).order_by('-id')
+        exercises = Exercise.objects.filter(user_id=request.user.id)
 
         # Pagination
-        paginator = Paginator(exercises, self.paginate_by)
-        # Retrieve page number from the GET-Request-object
-        page_number = request.GET.get("page")
-        page_obj = paginator.get_page(page_number)
+        paginator = KeysetPaginator(exercises, self.paginate_by, self.ordering, with_total=self.show_total)
+        # Retrieve the cursor from the GET-Request-object
+        page_obj = paginator.get_page(
+            after=request.GET.get("after"), before=request.GET.get("before"), last="last" in request.GET)
 
         # Instanciate the form
         # exercise_form = self.exercise_form_class(instance=edit_exercise)
@@ -587,8 +647,105 @@ class EditExercise(View):
             exercise_form.instance.user = request.user
             # Commit the model object to the database
             exercise_form.save()
+            # The name, type or goal might have changed, which changes the reports
+            if exercise_form.has_changed():
+                summaries.rebuild_exercise(exercise_form.instance.id)
+            # The goal decides whether the fastest time is the time or the pace
+            if "goal" in exercise_form.changed_data:
+                records.recompute([(request.user.id, exercise_form.instance.id)])
 
             return HttpResponseRedirect(reverse("edit_exercise_list"))
         # If the form was not valid, render the template. The workout_from will contain the validation
         # messages for the user, which had been generated upon calling the is_valid() method
         return render(request, self.template_name, {"exercise_form": exercise_form})
+
+
+class ExportWorkouts(View):
+    # Download the complete training history of the user.
+    # GET-parameters: format = csv, ndjson or json; start and end = dates (YYYY-MM-DD); gzip = 1
+    # The response is streamed, so the memory does not depend on the size of the history.
+
+    def get(self, request, *args, **kwargs):
+        # If the user is not logged in, then redirect them to the login page
+        if not request.user.is_authenticated:
+            return HttpResponseRedirect(reverse("account_login"))
+
+        export_format = request.GET.get("format", "csv")
+        if export_format not in export.EXPORT_FORMATS:
+            return HttpResponseBadRequest("Unknown format")
+        try:
+            start = export.parse_day(request.GET.get("start"))
+            end = export.parse_day(request.GET.get("end"))
+        except ValueError:
+            return HttpResponseBadRequest("Invalid date")
+        compress = request.GET.get("gzip") == "1"
+
+        filename = f"workouts.{export_format}"
+        content_type = export.EXPORT_FORMATS[export_format]
+        if compress:
+            filename += ".gz"
+            content_type = "application/gzip"
+        response = streaming_response(
+            request, export.stream_export(request.user.id, export_format, start, end, compress), content_type)
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+class ImportWorkouts(View):
+    # Upload a file with workouts, e.g. from another tracker or from the export
+    import_form_class = ImportWorkoutsForm
+    template_name = "import_workouts.html"
+
+    def get(self, request, *args, **kwargs):
+        # If the user is not logged in, then redirect them to the login page
+        if not request.user.is_authenticated:
+            return HttpResponseRedirect(reverse("account_login"))
+
+        return render(request, self.template_name, {"import_form": self.import_form_class()})
+
+    def post(self, request, *args, **kwargs):
+        # If the user is not logged in, then redirect them to the login page
+        if not request.user.is_authenticated:
+            return HttpResponseRedirect(reverse("account_login"))
+
+        import_form = self.import_form_class(request.POST, request.FILES)
+        if not import_form.is_valid():
+            return render(request, self.template_name, {"import_form": import_form})
+        try:
+            result = WorkoutImporter(request.user).run(
+                import_form.cleaned_data["file"], import_form.cleaned_data["format"])
+        except ImportValidationError as error:
+            # Nothing has been imported
+            messages.add_message(request, messages.ERROR, f"The import failed. {error}")
+            return render(request, self.template_name, {"import_form": import_form})
+
+        messages.add_message(request, messages.SUCCESS, str(result))
+        return HttpResponseRedirect(reverse("workout_list"))
+
+
+class ExerciseProgress(View):
+    # Progress of the user in an exercise over time
+    template_name = "exercise_progress.html"
+
+    def get(self, request, exercise_id, *args, **kwargs):
+        # If the user is not logged in, then redirect them to the login page
+        if not request.user.is_authenticated:
+            return HttpResponseRedirect(reverse("account_login"))
+
+        exercise = get_object_or_404(Exercise, id=exercise_id, user_id=request.user.id)
+        progress = analytics.get_progress(request.user.id, exercise)
+        return render(request, self.template_name, {"exercise": exercise, "progress": progress})
+
+
+class Metrics(View):
+    # Metrics of the requests, the queries, the templates and the caches in the Prometheus text format.
+    # Protected by settings.METRICS_TOKEN. Without a token the endpoint does not exist
+
+    def get(self, request, *args, **kwargs):
+        token = getattr(settings, "METRICS_TOKEN", "")
+        if not token:
+            raise Http404("Metrics are disabled")
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            return HttpResponse("Unauthorized", status=401, content_type="text/plain")
+        content, content_type = metrics.export()
+        return HttpResponse(content, content_type=content_type)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from django.contrib.messages import constants as messages
 from .env import Database
@@ -54,20 +55,33 @@ LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/"
 
 MIDDLEWARE = [
+    # First, so the metrics include the time of the other middleware (see workout_app/metrics.py)
+    "workout_app.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    # Redirects members of a group (admin) to their area, see workout_app/roles.py
+    "workout_app.roles.RoleMiddleware",
+    "workout_app.db_routing.ReplicaMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# N+1 query detector for development, see workout_app/query_detector.py.
+# Set QUERY_DETECTOR=1 to log repeated queries with the lines of code and templates that caused them
+if DEBUG and os.environ.get("QUERY_DETECTOR") == "1":
+    MIDDLEWARE.append("workout_app.query_detector.QueryDetectorMiddleware")
+
 ROOT_URLCONF = "workout_prj.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # The Django backend, recording the render time of the templates for the metrics
+        "BACKEND": "workout_app.metrics.InstrumentedDjangoTemplates",
+        # The alias would be taken from the module name of the backend otherwise
+        "NAME": "django",
         "DIRS": [BASE_DIR / 'workout_app/templates'],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -91,6 +105,14 @@ MESSAGE_TAGS = {
     messages.ERROR: 'alert-danger',
 }
 
+# Metrics
+# The metrics in the Prometheus format are served at /metrics (see workout_app/metrics.py).
+# They are only served if METRICS_TOKEN is set, and the scraper must send it in the header
+# "Authorization: Bearer <token>". Without a token /metrics returns 404.
+# For several worker processes, set PROMETHEUS_MULTIPROC_DIR to an empty directory.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
@@ -110,6 +132,51 @@ DATABASES = {
     }
 }
 
+# Optional read replica. If READ_REPLICA_NAME is set, the read-only views (workout list, progress,
+# exports and the admin lists) read from it, see workout_app/db_routing.py.
+# The other settings are copied from the primary unless READ_REPLICA_ENGINE, READ_REPLICA_HOST or
+# READ_REPLICA_PORT are set. For a local test, e.g. point it to a second database that is a copy of the first.
+if os.environ.get("READ_REPLICA_NAME"):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "ENGINE": os.environ.get("READ_REPLICA_ENGINE", DATABASES["default"]["ENGINE"]),
+        "NAME": os.environ["READ_REPLICA_NAME"],
+        "HOST": os.environ.get("READ_REPLICA_HOST", DATABASES["default"]["HOST"]),
+        "PORT": os.environ.get("READ_REPLICA_PORT", DATABASES["default"]["PORT"]),
+        # The tests use the test database of the primary
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["workout_app.db_routing.ReplicaRouter"]
+# Seconds after a write during which the user reads from the primary
+REPLICA_STICKY_SECONDS = int(os.environ.get("REPLICA_STICKY_SECONDS", 10))
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The rows of the workout list, the exercise catalogues and the versions of the group memberships are
+# cached in the "fragments" cache (see workout_app/fragment_cache.py, catalogue.py and roles.py).
+# It defaults to a local memory cache, so it works without external services. To share it
+# between processes, set FRAGMENT_CACHE_BACKEND to e.g. django.core.cache.backends.filebased.FileBasedCache
+# and FRAGMENT_CACHE_LOCATION to a directory. With several processes this is required for changed exercises
+# to show up in the other processes right away.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "fragments": {
+        "BACKEND": os.environ.get("FRAGMENT_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("FRAGMENT_CACHE_LOCATION", "workout-fragments"),
+        # Outdated versions of a row are never read again, so let them expire after a week
+        "TIMEOUT": 60 * 60 * 24 * 7,
+    },
+}
+
+WORKOUT_FRAGMENT_CACHE = "fragments"
+# Seconds after which the groups of a user cached in the session are reloaded (see workout_app/roles.py)
+ROLE_CACHE_SECONDS = int(os.environ.get("ROLE_CACHE_SECONDS", 60))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators